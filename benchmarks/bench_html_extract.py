@@ -0,0 +1,77 @@
+"""
+Main-content extraction (extract_main_content) against whole-page text (parse_html) on saved HTML pages:
+characters kept and extraction time per page.
+
+Usage:
+    python benchmarks/bench_html_extract.py
+    python benchmarks/bench_html_extract.py --repeat 50 path/to/saved_page.html other_dir/
+"""
+import os
+import sys
+import time
+import glob
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.parsing import parse_html, parse_html_document
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def collect(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.htm*"))))
+        else:
+            files.append(path)
+    return files
+
+
+def timed(func, content, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = func(content)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return text, statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", default=[FIXTURES], help="HTML files or directories")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--show", action="store_true", help="Print the extracted text")
+    args = parser.parse_args()
+
+    files = collect(args.paths)
+    if not files:
+        print("No HTML files found.")
+        return
+
+    print(f"{'page':<28} {'bytes':>8} {'full chars':>11} {'main chars':>11} {'kept':>6} {'full ms':>8} {'main ms':>8}")
+    totals = [0, 0, 0.0, 0.0]
+    for path in files:
+        with open(path, "rb") as f:
+            content = f.read()
+        full_text, full_ms = timed(parse_html, content, args.repeat)
+        main_text, main_ms = timed(parse_html_document, content, args.repeat)
+
+        kept = len(main_text) / len(full_text) if full_text else 0.0
+        print(f"{os.path.basename(path)[:28]:<28} {len(content):>8} {len(full_text):>11} {len(main_text):>11} "
+              f"{kept:>6.0%} {full_ms:>8.2f} {main_ms:>8.2f}")
+        totals[0] += len(full_text)
+        totals[1] += len(main_text)
+        totals[2] += full_ms
+        totals[3] += main_ms
+        if args.show:
+            print(main_text)
+            print()
+
+    kept = totals[1] / totals[0] if totals[0] else 0.0
+    print(f"{'total':<28} {'':>8} {totals[0]:>11} {totals[1]:>11} {kept:>6.0%} {totals[2]:>8.2f} {totals[3]:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
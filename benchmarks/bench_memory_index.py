@@ -0,0 +1,90 @@
+"""
+Recall vs latency of the memory ANN index (IVFIndex) against the exact scan (FlatIndex).
+
+Usage:
+    python benchmarks/bench_memory_index.py --n 1000000 --dim 768
+    python benchmarks/bench_memory_index.py --n 200000 --nprobe 4 8 16 32
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.vector_index import FlatIndex, IVFIndex
+
+
+def make_data(n, dim, clusters, seed=0):
+    # Real embeddings are clustered by topic; uniform noise would be a pessimistic worst case
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    data = centers[labels] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    return data
+
+
+def make_queries(data, count, seed=1):
+    rng = np.random.default_rng(seed)
+    picks = data[rng.choice(data.shape[0], count, replace=False)]
+    return picks + 0.3 * rng.normal(size=picks.shape).astype(np.float32)
+
+
+def timed_search(index, queries, k, **kwargs):
+    results, latencies = [], []
+    for q in queries:
+        start = time.perf_counter()
+        results.append([key for _, key in index.search(q, k, **kwargs)])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=200000, help="Stored memories")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension")
+    parser.add_argument("--clusters", type=int, default=500, help="Synthetic topic clusters")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=2, help="top_k (MemorySystem default is 2)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    args = parser.parse_args()
+
+    print(f"Generating {args.n} x {args.dim} embeddings...")
+    data = make_data(args.n, args.dim, args.clusters)
+    queries = make_queries(data, args.queries)
+
+    flat, ivf = FlatIndex(), IVFIndex()
+    start = time.perf_counter()
+    for i, vec in enumerate(data):
+        flat.add(i, vec)
+    print(f"FlatIndex build: {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    for i, vec in enumerate(data):
+        ivf.add(i, vec)
+    # Refits run in the background; measure the trained layout, not the exact scan it replaces
+    ivf.wait_for_training()
+    print(f"IVFIndex build (incremental, incl. k-means refits): {time.perf_counter() - start:.1f}s")
+    for dim, part in ivf.partitions.items():
+        print(f"  dim {dim}: {len(part.lists)} lists, centroids fit on {part.trained_size} rows")
+
+    exact, exact_lat = timed_search(flat, queries, args.k)
+    print(f"\n{'index':<16}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    print(f"{'exact':<16}{1.0:>10.3f}{np.percentile(exact_lat, 50):>10.3f}"
+          f"{np.percentile(exact_lat, 95):>10.3f}{exact_lat.mean():>10.3f}")
+
+    for nprobe in args.nprobe:
+        approx, lat = timed_search(ivf, queries, args.k, nprobe=nprobe)
+        recall = np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(approx, exact) if e])
+        print(f"{'ivf nprobe=' + str(nprobe):<16}{recall:>10.3f}{np.percentile(lat, 50):>10.3f}"
+              f"{np.percentile(lat, 95):>10.3f}{lat.mean():>10.3f}")
+
+    # Incremental delete path
+    start = time.perf_counter()
+    for i in range(0, min(args.n, 10000)):
+        ivf.remove(i)
+    print(f"\nRemoved {min(args.n, 10000)} rows in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
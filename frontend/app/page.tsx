@@ -13,6 +13,8 @@ export default function Home() {
   const [currentStage, setCurrentStage] = useState('Initializing...');
   const [stageNumber, setStageNumber] = useState(0);
   const [finalPaper, setFinalPaper] = useState('');
+  // Paper text streamed token by token while Stage 7 is still generating
+  const [draftPaper, setDraftPaper] = useState('');
   const socketRef = useRef<WebSocket | null>(null);
   const logsEndRef = useRef<HTMLDivElement>(null);
   const [isSyncing, setIsSyncing] = useState(true);
@@ -94,6 +96,7 @@ export default function Home() {
     setStatus('running');
     setLogs([]);
     setFinalPaper('');
+    setDraftPaper('');
     setStageNumber(1);
     setCurrentStage('Topic Decomposition');
 
@@ -118,6 +121,15 @@ export default function Home() {
           return;
         }
 
+        if (msg.startsWith('PAPER_TOKEN:')) {
+          const token = msg.slice('PAPER_TOKEN:'.length);
+          setDraftPaper(prev => prev + token);
+          return;
+        }
+        if (msg === 'PAPER_RESET') {
+          setDraftPaper('');
+          return;
+        }
         if (msg.startsWith('FINAL_PAPER_CONTENT:')) {
           setFinalPaper(msg.replace('FINAL_PAPER_CONTENT:', ''));
           return;
@@ -321,6 +333,13 @@ export default function Home() {
                   {logs.length > 0 ? logs[logs.length - 1].replace('STAGE:', '').replace(/[^a-zA-Z0-9\s]/g, '') : "INITIALIZING NEURAL PATHWAYS..."}
                 </p>
               </div>
+
+              {/* Live draft while the paper is being written */}
+              {draftPaper && (
+                <div className="max-h-80 overflow-y-auto text-left bg-white/5 border border-white/10 rounded-xl p-6 text-white/70 text-sm font-serif whitespace-pre-wrap leading-relaxed">
+                  {draftPaper}
+                </div>
+              )}
             </div>
           </div>
         )}
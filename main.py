@@ -12,6 +12,7 @@ from stages.stage5_filtering import stage5_selection_filtering
 from stages.stage6_synthesis import stage6_research_synthesis
 from stages.stage7_generation import stage7_paper_generation
 from stages.stage8_review import stage8_review_paper
+from stages.stream_pipeline import stream_discover_analyze_score, PIPELINE_STREAMING
 
 def main():
     load_dotenv()
@@ -35,22 +36,35 @@ def main():
     decomposition = stage1_topic_decomposition(topic)
     if not decomposition: return
 
-    # Stage 2
-    raw_docs = stage2_document_discovery(decomposition)
-    if not raw_docs:
-        print("No documents found.")
-        return
+    if PIPELINE_STREAMING:
+        # Stages 2-4 per document, no barriers between them
+        analyzed_docs, scored_docs = stream_discover_analyze_score(decomposition, topic)
+        if not analyzed_docs:
+            print("No documents found.")
+            return
 
-    # Stage 3
-    analyzed_docs = stage3_document_analysis(raw_docs)
-    
-    # Stage 3b: Deep Knowledge Recursion (New Feature)
-    deep_docs = stage3b_deepen_research(analyzed_docs, topic)
-    if deep_docs:
-        analyzed_docs.extend(deep_docs)
-    
-    # Stage 4
-    scored_docs = stage4_academic_scoring(analyzed_docs, topic)
+        # Stage 3b needs every analysis; its documents are scored on their own
+        deep_docs = stage3b_deepen_research(analyzed_docs, topic)
+        if deep_docs:
+            analyzed_docs.extend(deep_docs)
+            scored_docs.extend(stage4_academic_scoring(deep_docs, topic))
+    else:
+        # Stage 2
+        raw_docs = stage2_document_discovery(decomposition, topic)
+        if not raw_docs:
+            print("No documents found.")
+            return
+
+        # Stage 3
+        analyzed_docs = stage3_document_analysis(raw_docs, topic)
+        
+        # Stage 3b: Deep Knowledge Recursion (New Feature)
+        deep_docs = stage3b_deepen_research(analyzed_docs, topic)
+        if deep_docs:
+            analyzed_docs.extend(deep_docs)
+        
+        # Stage 4
+        scored_docs = stage4_academic_scoring(analyzed_docs, topic)
     
     # Stage 5
     knowledge_base = stage5_selection_filtering(scored_docs)
@@ -1,9 +1,10 @@
+import os
 import sys
 import asyncio
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-from contextlib import redirect_stdout
+from contextlib import redirect_stdout, asynccontextmanager
 import io
 import threading
 import queue
@@ -19,8 +20,35 @@ from stages.stage5_filtering import stage5_selection_filtering
 from stages.stage6_synthesis import stage6_research_synthesis
 from stages.stage7_generation import stage7_paper_generation
 from stages.stage8_review import stage8_review_paper
-
-app = FastAPI()
+from stages.stage1_topic import stage1_topic_decomposition_async
+from stages.stage2_discovery import stage2_document_discovery_async
+from stages.stage3_analysis import stage3_document_analysis_async
+from stages.stage3b_deepen import stage3b_deepen_research_async
+from stages.stage4_scoring import stage4_academic_scoring_async
+from stages.stage6_synthesis import stage6_research_synthesis_async
+from stages.stage7_generation import stage7_paper_generation_async
+from stages.stage8_review import stage8_review_paper_async
+from stages.stream_pipeline import stream_discover_analyze_score, stream_discover_analyze_score_async, PIPELINE_STREAMING
+from utils.llm import memory_system, get_hedge_stats, llm_cache
+from utils.provider_health import provider_health
+from utils.rate_limit import rate_limit_stats
+from utils.http_client import http_client
+from utils.doc_cache import doc_cache
+from utils.parsing import parse_pool
+from utils.search_cache import search_cache
+
+# Run the pipeline as a task on the server's event loop instead of a dedicated thread
+PIPELINE_ASYNC = os.getenv("PIPELINE_ASYNC", "False").lower() == "true"
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Queued memories are only embedded and persisted by the write-behind thread;
+    # atexit alone is skipped when uvicorn reloads or a worker is killed
+    print("[Memory] Flushing queued memories before shutdown...")
+    await asyncio.to_thread(memory_system.flush, 30)
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -210,6 +238,12 @@ def save_research_to_db(topic, content):
     finally:
         db.close()
 
+def stream_paper_token(text):
+    log_queue.put(f"PAPER_TOKEN:{text}")
+
+def reset_paper_stream():
+    log_queue.put("PAPER_RESET")
+
 def run_research_pipeline(topic):
     try:
         sys.__stdout__.write(f"DEBUG: run_research_pipeline called for {topic}\n")
@@ -223,18 +257,30 @@ def run_research_pipeline(topic):
             decomposition = stage1_topic_decomposition(topic)
             if not decomposition: return
 
-            log_queue.put("STAGE:2")
-            raw_docs = stage2_document_discovery(decomposition)
-            
-            log_queue.put("STAGE:3")
-            analyzed_docs = stage3_document_analysis(raw_docs or []) # Empty list fallback for robust flow
+            if PIPELINE_STREAMING:
+                analyzed_docs, scored_docs = stream_discover_analyze_score(
+                    decomposition, topic, on_stage=lambda code: log_queue.put(f"STAGE:{code}")
+                )
+
+                log_queue.put("STAGE:3b")
+                deep_docs = stage3b_deepen_research(analyzed_docs, topic)
+                if deep_docs:
+                    analyzed_docs.extend(deep_docs)
+                    log_queue.put("STAGE:4")
+                    scored_docs.extend(stage4_academic_scoring(deep_docs, topic))
+            else:
+                log_queue.put("STAGE:2")
+                raw_docs = stage2_document_discovery(decomposition, topic)
+                
+                log_queue.put("STAGE:3")
+                analyzed_docs = stage3_document_analysis(raw_docs or [], topic) # Empty list fallback for robust flow
 
-            log_queue.put("STAGE:3b")
-            deep_docs = stage3b_deepen_research(analyzed_docs, topic)
-            if deep_docs: analyzed_docs.extend(deep_docs)
+                log_queue.put("STAGE:3b")
+                deep_docs = stage3b_deepen_research(analyzed_docs, topic)
+                if deep_docs: analyzed_docs.extend(deep_docs)
 
-            log_queue.put("STAGE:4")
-            scored_docs = stage4_academic_scoring(analyzed_docs, topic)
+                log_queue.put("STAGE:4")
+                scored_docs = stage4_academic_scoring(analyzed_docs, topic)
 
             log_queue.put("STAGE:5")
             knowledge_base = stage5_selection_filtering(scored_docs)
@@ -254,7 +300,12 @@ def run_research_pipeline(topic):
             final_paper = ""
 
             while loop_count < max_loops:
-                final_paper = stage7_paper_generation(synthesis, knowledge_base, topic, feedback=feedback)
+                # Each draft is streamed to the client as it is written
+                reset_paper_stream()
+                final_paper = stage7_paper_generation(
+                    synthesis, knowledge_base, topic, feedback=feedback,
+                    on_token=stream_paper_token, on_reset=reset_paper_stream
+                )
                 log_queue.put("STAGE:8")
                 review = stage8_review_paper(final_paper, topic)
                 if review.get('score', 0) >= 6: break
@@ -272,6 +323,82 @@ def run_research_pipeline(topic):
         traceback.print_exc()
         log_queue.put(f"ERROR:{str(e)}")
 
+async def run_research_pipeline_async(topic):
+    """
+    Same stages as run_research_pipeline, driven from the event loop via the async stage entry points.
+    """
+    try:
+        capture = OutputCapture()
+        with redirect_stdout(capture):
+            print(f"Starting research on: {topic}")
+            log_queue.put("STAGE:1") 
+            decomposition = await stage1_topic_decomposition_async(topic)
+            if not decomposition: return
+
+            if PIPELINE_STREAMING:
+                analyzed_docs, scored_docs = await stream_discover_analyze_score_async(
+                    decomposition, topic, on_stage=lambda code: log_queue.put(f"STAGE:{code}")
+                )
+
+                log_queue.put("STAGE:3b")
+                deep_docs = await stage3b_deepen_research_async(analyzed_docs, topic)
+                if deep_docs:
+                    analyzed_docs.extend(deep_docs)
+                    log_queue.put("STAGE:4")
+                    scored_docs.extend(await stage4_academic_scoring_async(deep_docs, topic))
+            else:
+                log_queue.put("STAGE:2")
+                raw_docs = await stage2_document_discovery_async(decomposition, topic)
+                
+                log_queue.put("STAGE:3")
+                analyzed_docs = await stage3_document_analysis_async(raw_docs or [], topic)
+
+                log_queue.put("STAGE:3b")
+                deep_docs = await stage3b_deepen_research_async(analyzed_docs, topic)
+                if deep_docs: analyzed_docs.extend(deep_docs)
+
+                log_queue.put("STAGE:4")
+                scored_docs = await stage4_academic_scoring_async(analyzed_docs, topic)
+
+            # Pure CPU, no I/O to overlap
+            log_queue.put("STAGE:5")
+            knowledge_base = stage5_selection_filtering(scored_docs)
+            if not knowledge_base:
+                log_queue.put("ERROR:No valid docs")
+                return
+
+            log_queue.put("STAGE:6")
+            synthesis = await stage6_research_synthesis_async(knowledge_base, topic)
+            if not synthesis: return
+
+            log_queue.put("STAGE:7")
+            loop_count = 0
+            max_loops = 3
+            feedback = ""
+            final_paper = ""
+
+            while loop_count < max_loops:
+                reset_paper_stream()
+                final_paper = await stage7_paper_generation_async(
+                    synthesis, knowledge_base, topic, feedback=feedback,
+                    on_token=stream_paper_token, on_reset=reset_paper_stream
+                )
+                log_queue.put("STAGE:8")
+                review = await stage8_review_paper_async(final_paper, topic)
+                if review.get('score', 0) >= 6: break
+                feedback = review.get('critique', '')
+                loop_count += 1
+            
+            await asyncio.to_thread(save_research_to_db, topic, final_paper)
+
+            log_queue.put("COMPLETE")
+            log_queue.put(f"FINAL_PAPER_CONTENT:{final_paper}")
+            
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        log_queue.put(f"ERROR:{str(e)}")
+
 # ... (WebSocket handler same as before)
 
 @app.get("/history")
@@ -281,6 +408,42 @@ def get_history():
     db.close()
     return [{"id": p.id, "topic": p.topic, "date": p.created_at, "preview": p.content[:200]} for p in papers]
 
+@app.get("/memory/stats")
+def get_memory_stats():
+    return memory_system.stats()
+
+@app.get("/providers/stats")
+def get_provider_stats():
+    return provider_health.stats()
+
+@app.get("/hedge/stats")
+def get_hedge_stats_route():
+    return get_hedge_stats()
+
+@app.get("/rate-limits/stats")
+def get_rate_limit_stats():
+    return rate_limit_stats()
+
+@app.get("/llm-cache/stats")
+def get_llm_cache_stats():
+    return llm_cache.stats() if llm_cache else {"enabled": False}
+
+@app.get("/http/stats")
+def get_http_stats():
+    return http_client.stats()
+
+@app.get("/doc-cache/stats")
+def get_doc_cache_stats():
+    return doc_cache.stats() if doc_cache else {"enabled": False}
+
+@app.get("/parse/stats")
+def get_parse_stats():
+    return parse_pool.stats()
+
+@app.get("/search-cache/stats")
+def get_search_cache_stats():
+    return search_cache.stats() if search_cache else {"enabled": False}
+
 # ... (rest of main)
 
 
@@ -302,16 +465,22 @@ async def websocket_endpoint(websocket: WebSocket):
                 with log_queue.mutex:
                     log_queue.queue.clear()
                 
-                # Run pipeline in a separate thread so we don't block the websocket loop
-                t = threading.Thread(target=run_research_pipeline, args=(topic,))
-                t.start()
-                sys.__stdout__.write(f"DEBUG: Thread started. ID: {t.ident}\n")
+                if PIPELINE_ASYNC:
+                    task = asyncio.create_task(run_research_pipeline_async(topic))
+                    is_running = lambda: not task.done()
+                    sys.__stdout__.write("DEBUG: Pipeline task started on event loop\n")
+                else:
+                    # Run pipeline in a separate thread so we don't block the websocket loop
+                    t = threading.Thread(target=run_research_pipeline, args=(topic,))
+                    t.start()
+                    is_running = t.is_alive
+                    sys.__stdout__.write(f"DEBUG: Thread started. ID: {t.ident}\n")
                 
                 # Start a loop to drain the queue and send to client
-                while t.is_alive() or not log_queue.empty():
+                while is_running() or not log_queue.empty():
                     try:
-                        # Non-blocking get
-                        msg = log_queue.get(timeout=0.1)
+                        # Non-blocking get; a blocking wait would stall an in-loop pipeline
+                        msg = log_queue.get_nowait()
                         if msg:
                              # sys.__stdout__.write(f"DEBUG: Sending WS message: {msg[:50]}...\n")
                              await websocket.send_text(msg)
@@ -319,7 +488,7 @@ async def websocket_endpoint(websocket: WebSocket):
                         await asyncio.sleep(0.1)
                         
                 await websocket.send_text("DONE")
-                sys.__stdout__.write("DEBUG: Pipeline finished (thread dead and queue empty).\n")
+                sys.__stdout__.write("DEBUG: Pipeline finished (pipeline done and queue empty).\n")
                 
     except WebSocketDisconnect:
         print("Client disconnected")
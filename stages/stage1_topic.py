@@ -1,10 +1,9 @@
-from utils.llm import query_stage
+from utils.llm import query_stage, forget_response
+from utils.llm_async import query_stage_async
 import json
 
-def stage1_topic_decomposition(topic):
-    print(f"\n--- STAGE 1: TOPIC DECOMPOSITION for '{topic}' ---")
-    
-    prompt = f"""
+def _build_prompt(topic):
+    return f"""
     You are an expert research planner.
     User Topic: "{topic}"
     
@@ -26,10 +25,8 @@ def stage1_topic_decomposition(topic):
         ]
     }}
     """
-    
-    # Logic task, so safe to fall back to Groq/Anthropic
-    response = query_stage("topic", prompt)
-    
+
+def _parse_response(response, prompt):
     from utils.json_parser import extract_json_from_text
     data = extract_json_from_text(response)
     
@@ -37,4 +34,20 @@ def stage1_topic_decomposition(topic):
         return data
     else:
         print(f"Error parsing Stage 1 output")
+        forget_response("topic", prompt)
         return None
+
+def stage1_topic_decomposition(topic):
+    print(f"\n--- STAGE 1: TOPIC DECOMPOSITION for '{topic}' ---")
+    
+    # Logic task, so safe to fall back to Groq/Anthropic
+    prompt = _build_prompt(topic)
+    response = query_stage("topic", prompt)
+    return _parse_response(response, prompt)
+
+async def stage1_topic_decomposition_async(topic):
+    print(f"\n--- STAGE 1: TOPIC DECOMPOSITION for '{topic}' ---")
+    
+    prompt = _build_prompt(topic)
+    response = await query_stage_async("topic", prompt)
+    return _parse_response(response, prompt)
@@ -1,12 +1,27 @@
-from utils.search import google_search, download_and_parse
-import time
+from utils.search import google_search, download_document, parse_document
+from utils.relevance import rank_texts
+import os
+import queue
+import asyncio
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+MAX_CANDIDATES = 20 # User Constraint
+SEARCH_CONCURRENCY = 4
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", 5))
+# Admitted candidates waiting for a download worker; a full queue holds back the search threads
+DOWNLOAD_QUEUE_SIZE = int(os.getenv("DOWNLOAD_QUEUE_SIZE", 2 * DOWNLOAD_CONCURRENCY))
+
+# Candidate ranking: weight of BM25 relevance vs. snippet information density
+CANDIDATE_RELEVANCE_WEIGHT = 0.9
+
+_WORKER_DONE = object()
+
 def process_search_item(item):
     """
     Helper function to process a single search result:
     - Filters domains
-    - Downloads and parses content
+    - Downloads content, then parses it in the parse process pool
     """
     url = item.get('link')
     title = item.get('title')
@@ -30,7 +45,9 @@ def process_search_item(item):
     #          return None
 
     try:
-        raw_text = download_and_parse(url)
+        raw_text, parse_seconds = parse_document(download_document(url))
+        if parse_seconds:
+            print(f"  [Parse] {len(raw_text) // 1000}k chars in {parse_seconds:.2f}s: {url}")
         if len(raw_text) < 500: # Too short to be a paper
             return None
         
@@ -38,83 +55,260 @@ def process_search_item(item):
             "title": title,
             "url": url,
             "snippet": snippet,
-            "raw_text": raw_text
+            "subtopic": item.get('subtopic'),
+            "keywords": item.get('keywords', []),
+            "raw_text": raw_text,
+            "parse_seconds": round(parse_seconds, 3)
         }
     except Exception as e:
         print(f"Error processing {url}: {e}")
         return None
 
-def stage2_document_discovery(decomposition_data):
-    print("\n--- STAGE 2: DOCUMENT DISCOVERY ---")
+def execute_search_query(subtopic, query):
+    results = []
+    # Enforce academic constraints in query - REMOVED
+    # USER REQUEST: Fetch ALL documents, no authentic filtering
+    academic_query = query 
+    print(f"  [Search] Querying: {academic_query}")
     
-    all_documents = []
-    seen_urls = set()
-    search_candidates = []
-    
-    if not decomposition_data or 'subtopics' not in decomposition_data:
-        print("Invalid input for Stage 2")
-        return []
+    try:
+        search_res = google_search(academic_query, num_results=6) # Reduced from 8 to 6 for speed
+        for item in search_res:
+            item['subtopic'] = subtopic['name']
+            item['keywords'] = subtopic.get('keywords', [])
+            results.append(item)
+    except Exception as e:
+        print(f"    Error querying Google for '{query}': {e}")
+    return results
 
-    # 1. Gather all candidates concurrently
-    def execute_search_query(subtopic, query):
-        results = []
-        # Enforce academic constraints in query - REMOVED
-        # USER REQUEST: Fetch ALL documents, no authentic filtering
-        academic_query = query 
-        print(f"  [Search] Querying: {academic_query}")
-        
-        try:
-            # Small random delay to stagger requests slightly
-            time.sleep(0.1) 
-            search_res = google_search(academic_query, num_results=6) # Reduced from 8 to 6 for speed
-            for item in search_res:
-                item['subtopic'] = subtopic['name']
-                results.append(item)
-        except Exception as e:
-            print(f"    Error querying Google for '{query}': {e}")
-        return results
-
-    # Flatten all queries
+def _flatten_queries(decomposition_data):
     all_queries = []
     for subtopic in decomposition_data['subtopics']:
         for query in subtopic['search_queries']:
             all_queries.append((subtopic, query))
+    return all_queries
+
+def _ranking_query(subtopic, topic=None):
+    # What a good hit should talk about: the topic plus this subtopic's name, keywords and queries
+    parts = [topic or "", subtopic.get('name', "")]
+    parts += subtopic.get('keywords', []) or []
+    parts += subtopic.get('search_queries', []) or []
+    return " ".join(str(p) for p in parts if p)
+
+class CandidateGate:
+    """
+    Online admission of search results. URLs are deduped as they arrive and each query's
+    results are ranked on arrival by BM25 relevance of title + snippet to the topic and
+    subtopic (utils/relevance.py). The best ones are admitted while their subtopic still
+    has room in its equal share of MAX_CANDIDATES; results with no term in common with the
+    query never take a share. Everything else is kept as a leftover, and the remaining
+    slots go to the best leftovers of any subtopic when all queries are done (finish()).
+    """
+
+    def __init__(self, all_queries, topic=None, limit=MAX_CANDIDATES):
+        self.limit = limit
+        self.topic = topic
+        self.seen_urls = set()
+        self.admitted = 0
+
+        self._taken = {id(subtopic): 0 for subtopic, _ in all_queries}  # admitted per subtopic
+        self.quota = max(limit // max(len(self._taken), 1), 1)
+        self._leftovers = []  # (score, item)
+
+    @property
+    def full(self):
+        return self.admitted >= self.limit
+
+    def _take(self, ranked, count, min_score=0.0):
+        accepted = []
+        for score, item in ranked:
+            if len(accepted) >= count or self.full or score <= min_score:
+                break
+            accepted.append(item)
+            self.admitted += 1
+        return accepted
+
+    def admit(self, subtopic, results):
+        """
+        Ranks one query's results and returns the items admitted now (possibly none).
+        """
+        key = id(subtopic)
+        items = []
+        for item in results:
+            url = item.get('link')
+            if not url or url in self.seen_urls:
+                continue
+            self.seen_urls.add(url)
+            items.append(item)
+        if not items:
+            return []
+
+        texts = [f"{item.get('title') or ''} {item.get('snippet') or ''}" for item in items]
+        scores = rank_texts(texts, _ranking_query(subtopic, self.topic), relevance_weight=CANDIDATE_RELEVANCE_WEIGHT)
+        ranked = sorted(zip(scores, items), key=lambda pair: pair[0], reverse=True)
+
+        # Density alone tops out at 1 - weight: anything at or below it matched no query term
+        room = max(self.quota - self._taken.get(key, 0), 0)
+        accepted = self._take(ranked, room, min_score=1 - CANDIDATE_RELEVANCE_WEIGHT)
+        self._taken[key] = self._taken.get(key, 0) + len(accepted)
+        self._leftovers.extend(ranked[len(accepted):])
+        print(f"  [Rank] '{subtopic.get('name', '')}': admitted {len(accepted)} of {len(items)} results")
+        return accepted
+
+    def finish(self):
+        """
+        Fills slots left by thin or failed subtopics with the best remaining results overall.
+        """
+        self._leftovers.sort(key=lambda pair: pair[0], reverse=True)
+        accepted = self._take(self._leftovers, self.limit, min_score=-1.0)
+        self._leftovers = []
+        return accepted
+
+def _report_parse_time(all_documents):
+    parsed = [doc['parse_seconds'] for doc in all_documents if doc.get('parse_seconds')]
+    if parsed:
+        print(f"Parsed {len(parsed)} documents off-thread: {sum(parsed):.2f}s total, slowest {max(parsed):.2f}s")
+
+def discover_documents(decomposition_data, topic=None):
+    """
+    Generator over downloaded documents, yielded as each one finishes.
+    Search queries (producer) feed admitted candidates into a bounded queue drained by
+    DOWNLOAD_CONCURRENCY download workers (consumers), so the first download starts with
+    the first search result instead of after the slowest query.
+    """
+    all_queries = _flatten_queries(decomposition_data)
+    print(f"Executing {len(all_queries)} search queries; downloads start as results arrive...")
+
+    gate = CandidateGate(all_queries, topic)
+    download_queue = queue.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+    results = queue.Queue()
+
+    def produce():
+        search_executor = ThreadPoolExecutor(max_workers=SEARCH_CONCURRENCY)
+        try:
+            futures = {search_executor.submit(execute_search_query, s, q): s for s, q in all_queries}
+            for future in as_completed(futures):
+                for item in gate.admit(futures[future], future.result()):
+                    download_queue.put(item)
+                if gate.full:
+                    pending = sum(1 for f in futures if not f.done())
+                    if pending:
+                        print(f"Candidate cap of {MAX_CANDIDATES} reached; dropping {pending} pending queries.")
+                    break
+            for item in gate.finish():
+                download_queue.put(item)
+        finally:
+            # Queries already running finish in the background (and land in the search cache)
+            search_executor.shutdown(wait=False, cancel_futures=True)
+            for _ in range(DOWNLOAD_CONCURRENCY):
+                download_queue.put(None)
+
+    def consume():
+        while True:
+            item = download_queue.get()
+            if item is None:
+                results.put(_WORKER_DONE)
+                return
+            results.put(process_search_item(item))
 
-    print(f"Executing {len(all_queries)} search queries in parallel...")
+    threads = [threading.Thread(target=produce, daemon=True)]
+    threads += [threading.Thread(target=consume, daemon=True) for _ in range(DOWNLOAD_CONCURRENCY)]
+    for thread in threads:
+        thread.start()
+
+    finished = 0
+    while finished < DOWNLOAD_CONCURRENCY:
+        result = results.get()
+        if result is _WORKER_DONE:
+            finished += 1
+        elif result:
+            print(f"    + Downloaded: {result['title'][:40]}...")
+            yield result
+
+def stage2_document_discovery(decomposition_data, topic=None):
+    print("\n--- STAGE 2: DOCUMENT DISCOVERY ---")
     
-    # Execute concurrently to speed up discovery
-    with ThreadPoolExecutor(max_workers=4) as search_executor:
-        future_to_query = {search_executor.submit(execute_search_query, s, q): (s, q) for s, q in all_queries}
-        
-        for future in as_completed(future_to_query):
-            results = future.result()
-            for item in results:
-                url = item.get('link')
-                if url in seen_urls:
-                    continue
-                seen_urls.add(url)
-                search_candidates.append(item)
-
-    # Limit to top 20 candidates total (User Constraint)
-    if len(search_candidates) > 20:
-        print(f"Limiting candidates from {len(search_candidates)} to top 20.")
-        search_candidates = search_candidates[:20]
-
-    print(f"\nDownloading and parsing {len(search_candidates)} candidates in parallel...")
-
-    # 2. Process downloads in parallel
-    # max_workers=5 is a safe number to not overwhelm network or get IP blocked
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_item = {executor.submit(process_search_item, item): item for item in search_candidates}
-        
-        for future in as_completed(future_to_item):
-            result = future.result()
-            if result:
-                all_documents.append(result)
+    if not decomposition_data or 'subtopics' not in decomposition_data:
+        print("Invalid input for Stage 2")
+        return []
+
+    all_documents = list(discover_documents(decomposition_data, topic))
+    
+    print(f"Total documents retrieved: {len(all_documents)}")
+    _report_parse_time(all_documents)
+    return all_documents
+
+async def discover_documents_async(decomposition_data, topic=None):
+    """
+    Async counterpart of discover_documents: search and download coroutines connected by a
+    bounded asyncio.Queue; the blocking HTTP + parsing calls run on the default executor.
+    """
+    all_queries = _flatten_queries(decomposition_data)
+    print(f"Executing {len(all_queries)} search queries; downloads start as results arrive...")
+
+    gate = CandidateGate(all_queries, topic)
+    download_queue = asyncio.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+    results = asyncio.Queue()
+
+    search_sem = asyncio.Semaphore(SEARCH_CONCURRENCY)
+    async def search(subtopic, query):
+        async with search_sem:
+            return subtopic, await asyncio.to_thread(execute_search_query, subtopic, query)
+
+    async def produce():
+        tasks = [asyncio.ensure_future(search(s, q)) for s, q in all_queries]
+        try:
+            for coro in asyncio.as_completed(tasks):
+                for item in gate.admit(*(await coro)):
+                    await download_queue.put(item)
+                if gate.full:
+                    pending = sum(1 for t in tasks if not t.done())
+                    if pending:
+                        print(f"Candidate cap of {MAX_CANDIDATES} reached; dropping {pending} pending queries.")
+                    break
+            for item in gate.finish():
+                await download_queue.put(item)
+        finally:
+            for task in tasks:
+                task.cancel()
+            for _ in range(DOWNLOAD_CONCURRENCY):
+                await download_queue.put(None)
+
+    async def consume():
+        while True:
+            item = await download_queue.get()
+            if item is None:
+                await results.put(_WORKER_DONE)
+                return
+            await results.put(await asyncio.to_thread(process_search_item, item))
+
+    workers = [asyncio.ensure_future(produce())]
+    workers += [asyncio.ensure_future(consume()) for _ in range(DOWNLOAD_CONCURRENCY)]
+    try:
+        finished = 0
+        while finished < DOWNLOAD_CONCURRENCY:
+            result = await results.get()
+            if result is _WORKER_DONE:
+                finished += 1
+            elif result:
                 print(f"    + Downloaded: {result['title'][:40]}...")
-            else:
-                # Optional: indicate skip/failure
-                pass
+                yield result
+    finally:
+        for worker in workers:
+            worker.cancel()
+
+async def stage2_document_discovery_async(decomposition_data, topic=None):
+    """
+    Async counterpart of stage2_document_discovery.
+    """
+    print("\n--- STAGE 2: DOCUMENT DISCOVERY ---")
+    
+    if not decomposition_data or 'subtopics' not in decomposition_data:
+        print("Invalid input for Stage 2")
+        return []
+
+    all_documents = [doc async for doc in discover_documents_async(decomposition_data, topic)]
     
     print(f"Total documents retrieved: {len(all_documents)}")
+    _report_parse_time(all_documents)
     return all_documents
@@ -1,6 +1,21 @@
-from utils.llm import query_stage
+from utils.llm import query_stage, stage_budget, forget_response
+from utils.llm_async import query_stage_async
+import os
 import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from utils.json_parser import extract_json_from_text
+from utils.relevance import rank_texts
+
+# LLM pacing is handled by the shared per-provider rate limiter, so documents can run wide
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", 8))
+# Chunk (map) calls in flight per large document; 1 analyzes chunks one after another
+ANALYSIS_CHUNK_FANOUT = max(int(os.getenv("ANALYSIS_CHUNK_FANOUT", 6)), 1)
+# Chunks of a large document sent to the LLM, picked by relevance and information density
+ANALYSIS_MAX_CHUNKS = max(int(os.getenv("ANALYSIS_MAX_CHUNKS", 4)), 1)
+
+# Map calls run here rather than in the document pool, so a document's worker can wait on them
+_map_pool = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS * ANALYSIS_CHUNK_FANOUT, thread_name_prefix="analysis-map")
 
 def chunk_text(text, chunk_size=15000, overlap=1000):
     """
@@ -22,50 +37,47 @@ def chunk_text(text, chunk_size=15000, overlap=1000):
             
     return chunks
 
-def analyze_single_document(doc):
-    try:
-        # print(f"Analyzing: {doc['title'][:30]}...")
-        full_text = doc['raw_text']
-        
-        # Strategy Decision: Chunk vs Whole
-        # Reduced threshold to 15k chars (~4k tokens) to avoid 413 Payload Too Large errors
-        if len(full_text) > 15000:
-            # print(f"  - Large Doc ({len(full_text)} chars). Chunking...")
-            all_chunks = chunk_text(full_text, chunk_size=15000, overlap=1000)
-            
-            # Smart Selection: Limit to max 6 chunks for speed
-            if len(all_chunks) > 6:
-                # First 2, Middle 2, Last 2
-                mid = len(all_chunks) // 2
-                selected_chunks = all_chunks[:2] + all_chunks[mid:mid+2] + all_chunks[-2:]
-            else:
-                selected_chunks = all_chunks
-            
-            chunk_summaries = []
-            
-            # Parallel Chunk Analysis (Mini-batch)
-            # Sequential Chunk Analysis to avoid Rate Limits
-            for i, chunk in enumerate(selected_chunks):
-                chunk_prompt = f"""
+def relevance_query(doc, topic=None):
+    """
+    Terms a chunk should match: research topic, the subtopic the document was found for, and its keywords.
+    """
+    parts = [topic or "", doc.get('subtopic') or "", " ".join(doc.get('keywords') or [])]
+    return " ".join(p for p in parts if p)
+
+def select_chunks(full_text, query=None, max_chunks=ANALYSIS_MAX_CHUNKS):
+    """
+    Splits a large document and keeps the `max_chunks` chunks scoring highest on lexical
+    relevance to `query` and information density (reference lists and front matter score low).
+    The first chunk (abstract/introduction) is always kept. Chunks are returned in document order.
+    """
+    all_chunks = chunk_text(full_text, chunk_size=15000, overlap=1000)
+    if len(all_chunks) <= max_chunks:
+        return all_chunks
+    
+    scores = rank_texts(all_chunks[1:], query)
+    ranked = sorted(range(1, len(all_chunks)), key=lambda i: scores[i - 1], reverse=True)
+    keep = sorted([0] + ranked[:max_chunks - 1])
+    return [all_chunks[i] for i in keep]
+
+def build_chunk_prompt(doc, i, chunk):
+    def render(segment):
+        return f"""
                 Analyze this segment (Part {i+1}) of "{doc['title']}".
-                Segment: {chunk[:16000]}
+                Segment: {segment}
                 Task: Extract Research Problem, Methodology, Findings, Limitations.
                 Output: Concise bullet points.
                 """
-                try:
-                    res = query_stage("analysis", chunk_prompt)
-                    if res: chunk_summaries.append(res)
-                    time.sleep(1) # Pace requests slightly
-                except Exception as e:
-                    print(f"    x Chunk analysis failed: {e}")
-                    pass
-            
-            text_context = "\n".join(chunk_summaries)
-        else:
-            text_content = full_text[:18000] 
-            text_context = text_content
+    return render(stage_budget("analysis", max_chars=16000).fit_text(render(""), chunk))
 
-        prompt = f"""
+def build_analysis_prompt(doc, text_context):
+    """
+    Reduce/single-pass prompt; text_context is trimmed to the analysis stage's token budget.
+    """
+    template = _render_analysis_prompt(doc, "")
+    return _render_analysis_prompt(doc, stage_budget("analysis", max_chars=18000).fit_text(template, text_context))
+
+def _render_analysis_prompt(doc, text_context):
+    return f"""
         Analyze the following research document content (or extracted summaries of it).
         
         Document Title: {doc['title']}
@@ -99,47 +111,173 @@ def analyze_single_document(doc):
             "missing_entities": "string"
         }}
         """
+
+def parse_analysis(doc, response, prompt=None):
+    # Robust Parsing
+    analysis = extract_json_from_text(response)
+    
+    if not analysis:
+        print(f"  ! Warning: Could not parse JSON for {doc['title'][:15]}. Using raw text fallback.")
+        if prompt:
+            forget_response("analysis", prompt)
+        analysis = {
+            "research_problem": "JSON Parsing Failed",
+            "methodology": "See findings",
+            "key_findings": response if response else "No content returned",
+            "limitations": "N/A",
+            "research_gaps": "N/A",
+            "novelty_assessment": "N/A",
+            "technical_depth_score": 0,
+            "missing_entities": "Parsing Failed"
+        }
+    return analysis
+
+def record_timing(doc, start, map_seconds, chunks):
+    """
+    Stores and prints the per-document analysis latency (map phase and reduce call).
+    """
+    total = time.time() - start
+    doc['analysis_timing'] = {
+        "total": round(total, 2),
+        "map": round(map_seconds, 2),
+        "reduce": round(total - map_seconds, 2),
+        "chunks": chunks
+    }
+    detail = f"map {chunks} chunks {map_seconds:.1f}s + reduce {total - map_seconds:.1f}s" if chunks else "single pass"
+    print(f"  + Analysis Complete: {doc['title'][:30]}... ({total:.1f}s, {detail})")
+
+def report_latency(documents):
+    timings = sorted(d['analysis_timing']['total'] for d in documents if 'analysis_timing' in d)
+    if timings:
+        print(f"  Analysis latency per document: p50 {timings[len(timings) // 2]:.1f}s, max {timings[-1]:.1f}s over {len(timings)} docs")
+
+def map_chunks(doc, chunks):
+    """
+    Runs the chunk prompts with at most ANALYSIS_CHUNK_FANOUT in flight and returns the
+    summaries in chunk order. Failed chunks are skipped.
+    """
+    summaries = [None] * len(chunks)
+    todo = list(enumerate(chunks))
+    in_flight = {}
+    while todo or in_flight:
+        while todo and len(in_flight) < ANALYSIS_CHUNK_FANOUT:
+            i, chunk = todo.pop(0)
+            in_flight[_map_pool.submit(query_stage, "analysis", build_chunk_prompt(doc, i, chunk))] = i
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            i = in_flight.pop(future)
+            try:
+                summaries[i] = future.result()
+            except Exception as e:
+                print(f"    x Chunk analysis failed: {e}")
+    return [s for s in summaries if s]
+
+def analyze_single_document(doc, topic=None):
+    try:
+        # print(f"Analyzing: {doc['title'][:30]}...")
+        start = time.time()
+        full_text = doc['raw_text']
+        selected_chunks = []
+        map_seconds = 0.0
         
+        # Strategy Decision: Chunk vs Whole
+        # Reduced threshold to 15k chars (~4k tokens) to avoid 413 Payload Too Large errors
+        if len(full_text) > 15000:
+            # print(f"  - Large Doc ({len(full_text)} chars). Chunking...")
+            selected_chunks = select_chunks(full_text, relevance_query(doc, topic))
+            
+            # Map: chunks concurrently (pacing comes from the shared provider rate limiter)
+            chunk_summaries = map_chunks(doc, selected_chunks)
+            map_seconds = time.time() - start
+            
+            text_context = "\n".join(chunk_summaries)
+        else:
+            text_context = full_text
+
+        # Reduce
+        prompt = build_analysis_prompt(doc, text_context)
         response = query_stage("analysis", prompt)
         
-        # Robust Parsing
-        analysis = extract_json_from_text(response)
-        
-        if not analysis:
-            print(f"  ! Warning: Could not parse JSON for {doc['title'][:15]}. Using raw text fallback.")
-            analysis = {
-                "research_problem": "JSON Parsing Failed",
-                "methodology": "See findings",
-                "key_findings": response if response else "No content returned",
-                "limitations": "N/A",
-                "research_gaps": "N/A",
-                "novelty_assessment": "N/A",
-                "technical_depth_score": 0,
-                "missing_entities": "Parsing Failed"
-            }
-        
-        doc['analysis'] = analysis
-        print(f"  + Analysis Complete: {doc['title'][:30]}...")
+        doc['analysis'] = parse_analysis(doc, response, prompt)
+        record_timing(doc, start, map_seconds, len(selected_chunks))
         return doc
         
     except Exception as e:
         print(f"  x Error analyzing {doc['title'][:20]}: {e}")
         return None
 
-def stage3_document_analysis(documents):
-    print("\n--- STAGE 3: DOCUMENT ANALYSIS (Sequential) ---")
+def stage3_document_analysis(documents, topic=None):
+    print("\n--- STAGE 3: DOCUMENT ANALYSIS (Parallel) ---")
     analyzed_documents = []
     
     # Process documents in parallel
     # Increased speed by using threading, relying on robust fallback for rate limits
-    from concurrent.futures import ThreadPoolExecutor, as_completed
     
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        future_to_doc = {executor.submit(analyze_single_document, doc): doc for doc in documents}
+    with ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS) as executor:
+        future_to_doc = {executor.submit(analyze_single_document, doc, topic): doc for doc in documents}
         
         for future in as_completed(future_to_doc):
             result = future.result()
             if result:
                 analyzed_documents.append(result)
-                
+    
+    report_latency(analyzed_documents)
+    return analyzed_documents
+
+async def analyze_single_document_async(doc, topic=None):
+    """
+    Async counterpart of analyze_single_document. Chunk prompts are issued concurrently;
+    pacing comes from the shared provider rate limiter.
+    """
+    try:
+        start = time.time()
+        full_text = doc['raw_text']
+        selected_chunks = []
+        map_seconds = 0.0
+        
+        if len(full_text) > 15000:
+            selected_chunks = select_chunks(full_text, relevance_query(doc, topic))
+            fanout = asyncio.Semaphore(ANALYSIS_CHUNK_FANOUT)
+            
+            async def map_chunk(i, chunk):
+                async with fanout:
+                    return await query_stage_async("analysis", build_chunk_prompt(doc, i, chunk))
+            
+            results = await asyncio.gather(
+                *[map_chunk(i, chunk) for i, chunk in enumerate(selected_chunks)],
+                return_exceptions=True
+            )
+            chunk_summaries = []
+            for res in results:
+                if isinstance(res, Exception):
+                    print(f"    x Chunk analysis failed: {res}")
+                elif res:
+                    chunk_summaries.append(res)
+            map_seconds = time.time() - start
+            text_context = "\n".join(chunk_summaries)
+        else:
+            text_context = full_text
+
+        prompt = build_analysis_prompt(doc, text_context)
+        response = await query_stage_async("analysis", prompt)
+        
+        doc['analysis'] = parse_analysis(doc, response, prompt)
+        record_timing(doc, start, map_seconds, len(selected_chunks))
+        return doc
+        
+    except Exception as e:
+        print(f"  x Error analyzing {doc['title'][:20]}: {e}")
+        return None
+
+async def stage3_document_analysis_async(documents, topic=None):
+    print("\n--- STAGE 3: DOCUMENT ANALYSIS (Async) ---")
+    
+    sem = asyncio.Semaphore(ANALYSIS_WORKERS)
+    async def analyze(doc):
+        async with sem:
+            return await analyze_single_document_async(doc, topic)
+    
+    results = await asyncio.gather(*[analyze(doc) for doc in documents])
+    analyzed_documents = [r for r in results if r]
+    report_latency(analyzed_documents)
     return analyzed_documents
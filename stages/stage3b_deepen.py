@@ -1,20 +1,18 @@
-from utils.llm import query_stage
+from utils.llm import query_stage, stage_budget, forget_response
+from utils.llm_async import query_stage_async
 from utils.json_parser import extract_json_from_text
-from stages.stage2_discovery import stage2_document_discovery
-from stages.stage3_analysis import stage3_document_analysis
+from stages.stage2_discovery import stage2_document_discovery, stage2_document_discovery_async
+from stages.stage3_analysis import stage3_document_analysis, stage3_document_analysis_async
 import json
 
-def stage3b_deepen_research(analyzed_docs, topic):
+def build_gap_prompt(analyzed_docs, topic):
     """
-    Analyzes the initial research for gaps and performs a recursive deep dive.
+    Returns the gap-analysis prompt, or None if there is nothing to deepen.
     """
-    print("\n--- STAGE 3b: DEEP KNOWLEDGE RECURSION ---")
-    
     # 1. Assess current depth
     valid_docs = [d for d in analyzed_docs if 'analysis' in d]
     if not valid_docs:
-        print("No valid documents to deepen.")
-        return []
+        return None
 
     # Collect gaps and missing entities
     gaps_context = ""
@@ -25,11 +23,15 @@ def stage3b_deepen_research(analyzed_docs, topic):
         gaps_context += f"  Gaps: {analysis.get('research_gaps', 'N/A')}\n"
 
     # 2. Generate Targeted Queries
-    prompt = f"""
+    template = _render_gap_prompt("", topic)
+    return _render_gap_prompt(stage_budget("analysis", max_chars=8000).fit_text(template, gaps_context), topic)
+
+def _render_gap_prompt(gaps_context, topic):
+    return f"""
     The user wants "Deep Knowledge" on the topic: "{topic}".
     Here is the analysis of the first round of research papers:
     
-    {gaps_context[:8000]}
+    {gaps_context}
     
     Task:
     Identify specific missing technical details, implementation specifics, or data points.
@@ -39,16 +41,18 @@ def stage3b_deepen_research(analyzed_docs, topic):
     Output Format (JSON string list):
     ["query 1", "query 2", ...]
     """
-    
-    print("  Identifying knowledge gaps...")
-    # Using 'analysis' stage config (Groq/Anthropic/Ollama)
-    response = query_stage("analysis", prompt)
-    
+
+def build_deep_decomposition(response, prompt=None):
+    """
+    Parses the generated queries into the 'decomposition' structure Stage 2 expects.
+    """
     new_queries_list = extract_json_from_text(response)
     
+    if not isinstance(new_queries_list, list) and prompt:
+        forget_response("analysis", prompt)
     if not new_queries_list or not isinstance(new_queries_list, list):
         print("  No further deep queries generated.")
-        return []
+        return None
 
     print(f"  Generated {len(new_queries_list)} deep-dive queries:")
     for q in new_queries_list:
@@ -56,7 +60,7 @@ def stage3b_deepen_research(analyzed_docs, topic):
 
     # 3. Construct a fake 'decomposition' structure for Stage 2
     # Stage 2 expects: {'subtopics': [{'name': 'Deep Dive', 'search_queries': [...]}]}
-    deep_decomposition = {
+    return {
         'subtopics': [
             {
                 'name': 'Deep Dive Refinement',
@@ -64,16 +68,63 @@ def stage3b_deepen_research(analyzed_docs, topic):
             }
         ]
     }
+
+def stage3b_deepen_research(analyzed_docs, topic):
+    """
+    Analyzes the initial research for gaps and performs a recursive deep dive.
+    """
+    print("\n--- STAGE 3b: DEEP KNOWLEDGE RECURSION ---")
+    
+    prompt = build_gap_prompt(analyzed_docs, topic)
+    if not prompt:
+        print("No valid documents to deepen.")
+        return []
+    
+    print("  Identifying knowledge gaps...")
+    # Using 'analysis' stage config (Groq/Anthropic/Ollama)
+    response = query_stage("analysis", prompt)
+    
+    deep_decomposition = build_deep_decomposition(response, prompt)
+    if not deep_decomposition:
+        return []
     
     # 4. Run Stage 2 & 3 recursively
     print("  Executing Recursive Search...")
-    new_raw_docs = stage2_document_discovery(deep_decomposition)
+    new_raw_docs = stage2_document_discovery(deep_decomposition, topic)
     
     if not new_raw_docs:
         print("  No new documents found in deep dive.")
         return []
         
     print("  Analyzing Deep Dive Documents...")
-    new_analyzed_docs = stage3_document_analysis(new_raw_docs)
+    new_analyzed_docs = stage3_document_analysis(new_raw_docs, topic)
     
     return new_analyzed_docs
+
+async def stage3b_deepen_research_async(analyzed_docs, topic):
+    """
+    Async counterpart of stage3b_deepen_research.
+    """
+    print("\n--- STAGE 3b: DEEP KNOWLEDGE RECURSION ---")
+    
+    prompt = build_gap_prompt(analyzed_docs, topic)
+    if not prompt:
+        print("No valid documents to deepen.")
+        return []
+    
+    print("  Identifying knowledge gaps...")
+    response = await query_stage_async("analysis", prompt)
+    
+    deep_decomposition = build_deep_decomposition(response, prompt)
+    if not deep_decomposition:
+        return []
+    
+    print("  Executing Recursive Search...")
+    new_raw_docs = await stage2_document_discovery_async(deep_decomposition, topic)
+    
+    if not new_raw_docs:
+        print("  No new documents found in deep dive.")
+        return []
+        
+    print("  Analyzing Deep Dive Documents...")
+    return await stage3_document_analysis_async(new_raw_docs, topic)
@@ -1,21 +1,24 @@
-from utils.llm import query_stage
+from utils.llm import query_stage, stage_context_window, forget_response
+from utils.llm_async import query_stage_async
+from utils.json_parser import extract_json_from_text
+from utils.rate_limit import estimate_tokens
+import os
 import json
 import re
+import asyncio
 
-def stage4_academic_scoring(analyzed_documents, topic):
-    print("\n--- STAGE 4: ACADEMIC SCORING (Groq) ---")
-    scored_documents = []
-    
-    # process in parallel
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    
-    def score_single_doc(doc):
-        analysis = doc.get('analysis', {})
-        if not analysis: return None
-        
-        print(f"Scoring: {doc['title'][:50]}...")
-        
-        prompt = f"""
+# LLM pacing is handled by the shared per-provider rate limiter
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", 10))
+
+# Batched scoring: up to SCORING_BATCH_SIZE documents per prompt (1 = one call per document).
+# SCORING_BATCH_TOKENS caps a batch's input; 0 derives it from the scoring chain's context window.
+SCORING_BATCH_SIZE = int(os.getenv("SCORING_BATCH_SIZE", 10))
+SCORING_BATCH_TOKENS = int(os.getenv("SCORING_BATCH_TOKENS", 0))
+SCORE_OUTPUT_TOKENS = 120  # Reply budget per document in a batch
+
+def build_scoring_prompt(doc, topic):
+    analysis = doc['analysis']
+    return f"""
         Role: Research Relevance Evaluator.
         Target Research Topic: "{topic}"
         
@@ -40,30 +43,210 @@ def stage4_academic_scoring(analyzed_documents, topic):
           "weaknesses": "Short summary"
         }}
         """
+
+def apply_score(doc, response):
+    """
+    Attaches the parsed score to doc. Returns False if the response held no JSON.
+    """
+    score_data = extract_json_from_text(response)
+    if not score_data:
+        return False
+    doc['scoring'] = score_data
+    print(f"  Score: {score_data.get('score')} - {doc['title'][:30]}")
+    return True
+
+def apply_default_score(doc):
+    # Fallback for ANY failure (LLM or Parser): Default to 3 to keep pipeline moving
+    print(f"  Score: 3 (Defaulted/Failed) - {doc['title'][:30]}")
+    doc['scoring'] = {
+        "score": 3,
+        "strengths": "Defaulted due to scoring error/LLM limit",
+        "weaknesses": "Could not verify"
+    }
+    return doc
+
+def build_batch_entry(index, doc):
+    analysis = doc['analysis']
+    return f"""
+        [{index}] {doc['title']}
+        - Problem: {analysis.get('research_problem')}
+        - Method: {analysis.get('methodology')}
+        - Findings: {analysis.get('key_findings')}
+        - Novelty: {analysis.get('novelty_assessment')}
+        """
+
+def build_batch_prompt(entries, topic):
+    return f"""
+        Role: Research Relevance Evaluator.
+        Target Research Topic: "{topic}"
         
+        Score each of the {len(entries)} documents below independently. Each starts with its [index].
+        {"".join(entries)}
+        Evaluate based on:
+        1. Relevance to the research topic (Most Important)
+        2. Information value
+        3. Clarity
+        4. Methodological rigor (Optional but good)
+        5. Usefulness for a synthesis paper
+        
+        Return *only* a JSON array with one object per document. Do not add any text before or after.
+        [
+          {{"index": 0, "score": 5, "strengths": "Short summary", "weaknesses": "Short summary"}}
+        ]
+        """
+
+def batch_token_budget():
+    if SCORING_BATCH_TOKENS:
+        return SCORING_BATCH_TOKENS
+    # Half the smallest window in the chain: a batch must survive failover to any model
+    return stage_context_window("scoring") // 2
+
+def plan_batches(docs):
+    """
+    Packs docs into batches of at most SCORING_BATCH_SIZE whose prompt (plus expected reply)
+    fits batch_token_budget(). Returns a list of [(doc, entry), ...] batches.
+    """
+    budget = batch_token_budget()
+    overhead = estimate_tokens(build_batch_prompt([], ""))
+    
+    batches = []
+    current, used = [], overhead
+    for doc in docs:
+        entry = build_batch_entry(len(current), doc)
+        cost = estimate_tokens(entry) + SCORE_OUTPUT_TOKENS
+        if current and (len(current) >= SCORING_BATCH_SIZE or used + cost > budget):
+            batches.append(current)
+            entry = build_batch_entry(0, doc)
+            current, used = [], overhead
+        current.append((doc, entry))
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def parse_batch_scores(response, size):
+    """
+    Returns {index: score_data} for a batch reply, or {} unless it scores every index in
+    range(size) exactly once: a reply numbered from 1, or with an entry missing, would
+    otherwise attach scores to the wrong documents.
+    """
+    data = extract_json_from_text(response)
+    if isinstance(data, dict) and size == 1 and 'index' in data:
+        # A one-entry array can come back as its lone object
+        data = [data]
+    elif isinstance(data, dict):
+        # Some models wrap the array: {"scores": [...]}
+        data = next((v for v in data.values() if isinstance(v, list)), None)
+    if not isinstance(data, list):
+        return {}
+    
+    scores = {}
+    for item in data:
         try:
-            response = query_stage("scoring", prompt)
-            from utils.json_parser import extract_json_from_text
-            score_data = extract_json_from_text(response)
-            
-            if score_data:
-                doc['scoring'] = score_data
-                print(f"  Score: {score_data.get('score')} - {doc['title'][:30]}")
-                return doc
-        except Exception as e:
-            print(f"Error scoring {doc['title'][:10]}: {e}")
-            
-        # Fallback for ANY failure (LLM or Parser): Default to 3 to keep pipeline moving
-        print(f"  Score: 3 (Defaulted/Failed) - {doc['title'][:30]}")
-        doc['scoring'] = {
-            "score": 3,
-            "strengths": "Defaulted due to scoring error/LLM limit",
-            "weaknesses": "Could not verify"
+            index = int(item.get('index'))
+            score = float(item.get('score'))
+        except (AttributeError, TypeError, ValueError):
+            index = None
+        if index is None or index in scores:
+            print("  Batch reply has a malformed or duplicate entry; discarding it")
+            return {}
+        scores[index] = {
+            "score": int(score) if score.is_integer() else score,
+            "strengths": item.get('strengths', ''),
+            "weaknesses": item.get('weaknesses', '')
         }
-        return doc
+    
+    if set(scores) != set(range(size)):
+        print(f"  Batch reply indices {sorted(scores)[:10]} do not match 0..{size - 1}; discarding it")
+        return {}
+    return scores
+
+def apply_batch_scores(batch, response):
+    """
+    Attaches scores from a batch reply. Returns the docs the reply did not cover.
+    """
+    scores = parse_batch_scores(response, len(batch))
+    missing = []
+    for index, (doc, _) in enumerate(batch):
+        if index in scores:
+            doc['scoring'] = scores[index]
+            print(f"  Score: {scores[index]['score']} - {doc['title'][:30]}")
+        else:
+            missing.append(doc)
+    return missing
 
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {executor.submit(score_single_doc, doc): doc for doc in analyzed_documents}
+def score_single_document(doc, topic):
+    if not doc.get('analysis'): return None
+    
+    print(f"Scoring: {doc['title'][:50]}...")
+    
+    try:
+        prompt = build_scoring_prompt(doc, topic)
+        response = query_stage("scoring", prompt)
+        if apply_score(doc, response):
+            return doc
+        forget_response("scoring", prompt)
+    except Exception as e:
+        print(f"Error scoring {doc['title'][:10]}: {e}")
+        
+    return apply_default_score(doc)
+
+def score_batch(batch, topic):
+    """
+    Scores one planned batch in a single call. Returns the docs the reply did not cover.
+    """
+    if len(batch) == 1:
+        # Nothing to amortize: the single-document prompt is shorter and its reply simpler
+        score_single_document(batch[0][0], topic)
+        return []
+    print(f"Scoring batch of {len(batch)}: {batch[0][0]['title'][:40]}...")
+    try:
+        prompt = build_batch_prompt([entry for _, entry in batch], topic)
+        missing = apply_batch_scores(batch, query_stage("scoring", prompt))
+        if missing:
+            # The reply was rejected as a whole; don't replay it on the next run
+            forget_response("scoring", prompt)
+        return missing
+    except Exception as e:
+        print(f"Error scoring batch: {e}")
+        return [doc for doc, _ in batch]
+
+def score_documents(docs, topic):
+    """
+    Scores a small group of documents in the calling thread: batched calls, then single
+    calls for anything a batch reply missed. Used by the streaming pipeline.
+    """
+    docs = [doc for doc in docs if doc.get('analysis')]
+    pending = docs
+    if SCORING_BATCH_SIZE > 1 and len(docs) > 1:
+        pending = [doc for batch in plan_batches(docs) for doc in score_batch(batch, topic)]
+    missing = {id(doc) for doc in pending}
+    scored = [doc for doc in docs if id(doc) not in missing]
+    return scored + [res for res in (score_single_document(doc, topic) for doc in pending) if res]
+
+def stage4_academic_scoring(analyzed_documents, topic):
+    print("\n--- STAGE 4: ACADEMIC SCORING (Groq) ---")
+    scored_documents = []
+    
+    # process in parallel
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    with ThreadPoolExecutor(max_workers=SCORING_WORKERS) as executor:
+        pending = analyzed_documents
+        if SCORING_BATCH_SIZE > 1:
+            docs = [doc for doc in analyzed_documents if doc.get('analysis')]
+            batches = plan_batches(docs)
+            print(f"  Scoring {len(docs)} documents in {len(batches)} batched calls")
+            
+            pending = []
+            for future in as_completed([executor.submit(score_batch, b, topic) for b in batches]):
+                pending.extend(future.result())
+            missing = {id(doc) for doc in pending}
+            scored_documents.extend(doc for doc in docs if id(doc) not in missing)
+            if pending:
+                print(f"  Re-scoring {len(pending)} documents missing from batch replies individually")
+        
+        futures = {executor.submit(score_single_document, doc, topic): doc for doc in pending}
         
         for future in as_completed(futures):
             res = future.result()
@@ -71,3 +254,83 @@ def stage4_academic_scoring(analyzed_documents, topic):
                 scored_documents.append(res)
             
     return scored_documents
+
+async def score_single_document_async(doc, topic):
+    if not doc.get('analysis'): return None
+    
+    print(f"Scoring: {doc['title'][:50]}...")
+    try:
+        prompt = build_scoring_prompt(doc, topic)
+        response = await query_stage_async("scoring", prompt)
+        if apply_score(doc, response):
+            return doc
+        forget_response("scoring", prompt)
+    except Exception as e:
+        print(f"Error scoring {doc['title'][:10]}: {e}")
+    
+    return apply_default_score(doc)
+
+async def score_batch_async(batch, topic):
+    if len(batch) == 1:
+        await score_single_document_async(batch[0][0], topic)
+        return []
+    print(f"Scoring batch of {len(batch)}: {batch[0][0]['title'][:40]}...")
+    try:
+        prompt = build_batch_prompt([entry for _, entry in batch], topic)
+        missing = apply_batch_scores(batch, await query_stage_async("scoring", prompt))
+        if missing:
+            forget_response("scoring", prompt)
+        return missing
+    except Exception as e:
+        print(f"Error scoring batch: {e}")
+        return [doc for doc, _ in batch]
+
+async def score_documents_async(docs, topic):
+    """
+    Async counterpart of score_documents.
+    """
+    docs = [doc for doc in docs if doc.get('analysis')]
+    pending = docs
+    if SCORING_BATCH_SIZE > 1 and len(docs) > 1:
+        pending = []
+        for batch in plan_batches(docs):
+            pending.extend(await score_batch_async(batch, topic))
+    missing = {id(doc) for doc in pending}
+    scored = [doc for doc in docs if id(doc) not in missing]
+    for doc in pending:
+        res = await score_single_document_async(doc, topic)
+        if res:
+            scored.append(res)
+    return scored
+
+async def stage4_academic_scoring_async(analyzed_documents, topic):
+    """
+    Async counterpart of stage4_academic_scoring; SCORING_WORKERS bounds concurrent calls.
+    """
+    print("\n--- STAGE 4: ACADEMIC SCORING (Groq) ---")
+    semaphore = asyncio.Semaphore(SCORING_WORKERS)
+    
+    async def score_single_doc(doc):
+        async with semaphore:
+            return await score_single_document_async(doc, topic)
+
+    async def score_one_batch(batch):
+        async with semaphore:
+            return await score_batch_async(batch, topic)
+
+    scored_documents = []
+    pending = analyzed_documents
+    if SCORING_BATCH_SIZE > 1:
+        docs = [doc for doc in analyzed_documents if doc.get('analysis')]
+        batches = plan_batches(docs)
+        print(f"  Scoring {len(docs)} documents in {len(batches)} batched calls")
+        
+        results = await asyncio.gather(*(score_one_batch(b) for b in batches))
+        pending = [doc for missing in results for doc in missing]
+        missing = {id(doc) for doc in pending}
+        scored_documents.extend(doc for doc in docs if id(doc) not in missing)
+        if pending:
+            print(f"  Re-scoring {len(pending)} documents missing from batch replies individually")
+
+    results = await asyncio.gather(*(score_single_doc(doc) for doc in pending))
+    return scored_documents + [res for res in results if res]
@@ -1,17 +1,15 @@
-from utils.llm import query_stage
+from utils.llm import query_stage, stage_budget, forget_response
+from utils.llm_async import query_stage_async
 import json
 import re
 
-def stage6_research_synthesis(knowledge_base, topic):
-    print("\n--- STAGE 6: ORIGINAL RESEARCH SYNTHESIS ")
-    
-    if not knowledge_base:
-        print("No knowledge base available. Cannot synthesize.")
-        return None
-        
+def build_synthesis_prompt(knowledge_base, topic):
     kb_text = json.dumps(knowledge_base, indent=2)
-    
-    prompt = f"""
+    template = _render_synthesis_prompt("", topic)
+    return _render_synthesis_prompt(stage_budget("synthesis").fit_text(template, kb_text), topic)
+
+def _render_synthesis_prompt(kb_text, topic):
+    return f"""
     You are an expert academic researcher (Author Model).
     Topic: "{topic}"
     
@@ -39,14 +37,42 @@ def stage6_research_synthesis(knowledge_base, topic):
         "conclusion_plan": "string"
     }}
     """
+
+def stage6_research_synthesis(knowledge_base, topic):
+    print("\n--- STAGE 6: ORIGINAL RESEARCH SYNTHESIS ")
+    
+    if not knowledge_base:
+        print("No knowledge base available. Cannot synthesize.")
+        return None
+        
+    prompt = build_synthesis_prompt(knowledge_base, topic)
     
     # Heavy synthesis using 'synthesis' stage strategy
     response = query_stage("synthesis", prompt)
     
+    return parse_synthesis(response, prompt)
+
+def parse_synthesis(response, prompt=None):
     from utils.json_parser import extract_json_from_text
     synthesis = extract_json_from_text(response)
     # Fallback if parser returns None
     if not synthesis:
          print("Error regarding synthesis JSON extraction.")
+         if prompt:
+             forget_response("synthesis", prompt)
          
     return synthesis
+
+async def stage6_research_synthesis_async(knowledge_base, topic):
+    """
+    Async counterpart of stage6_research_synthesis.
+    """
+    print("\n--- STAGE 6: ORIGINAL RESEARCH SYNTHESIS ")
+    
+    if not knowledge_base:
+        print("No knowledge base available. Cannot synthesize.")
+        return None
+    
+    prompt = build_synthesis_prompt(knowledge_base, topic)
+    response = await query_stage_async("synthesis", prompt)
+    return parse_synthesis(response, prompt)
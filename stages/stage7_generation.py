@@ -1,23 +1,22 @@
-from utils.llm import query_stage
+from utils.llm import query_stage, stage_budget
+from utils.llm_async import query_stage_async
 import json
 
-def stage7_paper_generation(synthesis, knowledge_base, topic, feedback=""):
-    print("\n--- STAGE 7: SCOPUS-STYLE PAPER GENERATION ---")
-    
-    if not synthesis:
-        print("No synthesis provided.")
-        return ""
-    
-    if feedback:
-        print(f"  > Regenerating paper with feedback: {feedback}")
-    
+def build_paper_prompt(synthesis, knowledge_base, topic, feedback=""):
     references_list = []
     for entry in knowledge_base:
         references_list.append(f"{entry['source_title']} ({entry['url']})")
     
     ref_block = "\n".join(references_list)
+    feedback = feedback if feedback else "None. First draft."
     
-    prompt = f"""
+    # Reviewer feedback outranks the reference list when the budget is tight
+    template = _render_paper_prompt(synthesis, topic, "", "")
+    feedback, ref_block = stage_budget("generation").fit(template, [(feedback, 1), (ref_block, 0)])
+    return _render_paper_prompt(synthesis, topic, feedback, ref_block)
+
+def _render_paper_prompt(synthesis, topic, feedback, ref_block):
+    return f"""
     You are an expert academic author. Write a complete Scopus-journal-quality research paper.
     
     Topic: {topic}
@@ -29,7 +28,7 @@ def stage7_paper_generation(synthesis, knowledge_base, topic, feedback=""):
     Results (Simulated): {synthesis['simulated_results_description']}
     
     PREVIOUS FEEDBACK (Must address this):
-    {feedback if feedback else "None. First draft."}
+    {feedback}
     
     AVAILABLE REFERENCES (Use these as the primary citations):
     {ref_block}
@@ -56,7 +55,38 @@ def stage7_paper_generation(synthesis, knowledge_base, topic, feedback=""):
     OUTPUT:
     Return ONLY the completed research paper in Markdown format.
     """
+
+def stage7_paper_generation(synthesis, knowledge_base, topic, feedback="", on_token=None, on_reset=None):
+    """
+    Writes the paper. Pass on_token/on_reset to receive it incrementally (see query_stage).
+    """
+    print("\n--- STAGE 7: SCOPUS-STYLE PAPER GENERATION ---")
+    
+    if not synthesis:
+        print("No synthesis provided.")
+        return ""
+    
+    if feedback:
+        print(f"  > Regenerating paper with feedback: {feedback}")
+    
+    prompt = build_paper_prompt(synthesis, knowledge_base, topic, feedback)
     
     # Heavy content generation using 'generation' stage strategy
-    paper = query_stage("generation", prompt)
+    paper = query_stage("generation", prompt, on_token=on_token, on_reset=on_reset)
     return paper
+
+async def stage7_paper_generation_async(synthesis, knowledge_base, topic, feedback="", on_token=None, on_reset=None):
+    """
+    Async counterpart of stage7_paper_generation.
+    """
+    print("\n--- STAGE 7: SCOPUS-STYLE PAPER GENERATION ---")
+    
+    if not synthesis:
+        print("No synthesis provided.")
+        return ""
+    
+    if feedback:
+        print(f"  > Regenerating paper with feedback: {feedback}")
+    
+    prompt = build_paper_prompt(synthesis, knowledge_base, topic, feedback)
+    return await query_stage_async("generation", prompt, on_token=on_token, on_reset=on_reset)
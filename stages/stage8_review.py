@@ -1,16 +1,62 @@
-from utils.llm import query_stage
+from utils.llm import query_stage, stage_budget, forget_response
+from utils.llm_async import query_stage_async
+import re
 import json
 
-def stage8_review_paper(paper_content, topic):
-    print("\n--- STAGE 8: FINAL PAPER REVIEW (Multi-Model Judge) ---")
-    
-    prompt = f"""
+# Sections the judge most needs to see; references go first when the paper must be trimmed
+KEY_SECTIONS = re.compile(r"abstract|introduction|conclusion", re.IGNORECASE)
+REFERENCE_SECTIONS = re.compile(r"references|bibliography", re.IGNORECASE)
+
+def split_sections(paper_content):
+    """
+    Splits Markdown at its headings. Returns [(section_text, priority)]: the title block and
+    abstract/introduction/conclusion outrank body sections, which outrank the references.
+    """
+    sections = []
+    current = []
+    for line in paper_content.splitlines(keepends=True):
+        if line.startswith("#") and current:
+            sections.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append("".join(current))
+
+    parts = []
+    for i, section in enumerate(sections):
+        heading = section.split("\n", 1)[0]
+        if not heading.startswith("#") or (i == 0 and heading.startswith("# ")):
+            priority = 3
+        elif REFERENCE_SECTIONS.search(heading):
+            priority = 0
+        elif KEY_SECTIONS.search(heading):
+            priority = 2
+        else:
+            priority = 1
+        parts.append((section, priority))
+    return parts
+
+def build_review_prompt(paper_content, topic):
+    """
+    The paper is trimmed section by section (references, then body sections, each keeping its
+    head) to a budget every model in the review chain accepts, so failover never cuts it blindly.
+    """
+    template = _render_review_prompt("", topic)
+    parts = split_sections(paper_content)
+    trimmed = stage_budget("review", max_chars=25000, failover_safe=True).fit(template, parts)
+    # A shortened section must still end its line, or the next heading would run into it
+    trimmed = [text if text == section or not text else text.rstrip() + " [...]\n"
+               for text, (section, _) in zip(trimmed, parts)]
+    return _render_review_prompt("".join(trimmed), topic)
+
+def _render_review_prompt(paper_content, topic):
+    return f"""
     You are a strict Senior Editor at a Scopus-indexed journal.
     
     Research Topic: "{topic}"
     
     Review the following draft research paper content (Markdown):
-    {paper_content[:25000]}  # Truncate to fit context if needed
+    {paper_content}
     
     Task:
     Rate this paper on a scale of 1-10 (10 being perfect for publication).
@@ -28,10 +74,17 @@ def stage8_review_paper(paper_content, topic):
         "critique": "string"
     }}
     """
+
+def stage8_review_paper(paper_content, topic):
+    print("\n--- STAGE 8: FINAL PAPER REVIEW (Multi-Model Judge) ---")
+    
+    prompt = build_review_prompt(paper_content, topic)
     
-    response = query_stage("review", prompt)
     response = query_stage("review", prompt)
     
+    return parse_review(response, prompt)
+
+def parse_review(response, prompt=None):
     from utils.json_parser import extract_json_from_text
     review = extract_json_from_text(response)
     
@@ -40,6 +93,17 @@ def stage8_review_paper(paper_content, topic):
         return review
     else:
         print(f"  Raw response: {response}")
+        if prompt:
+            forget_response("review", prompt)
         return {"score": 4, "critique": "JSON parsing failed. Automatic integrity penalty."}
 
         # Previously was returning 0 and "Error ...", which works too.
+
+async def stage8_review_paper_async(paper_content, topic):
+    """
+    Async counterpart of stage8_review_paper.
+    """
+    print("\n--- STAGE 8: FINAL PAPER REVIEW (Multi-Model Judge) ---")
+    prompt = build_review_prompt(paper_content, topic)
+    response = await query_stage_async("review", prompt)
+    return parse_review(response, prompt)
@@ -0,0 +1,213 @@
+from stages.stage2_discovery import discover_documents, discover_documents_async, _report_parse_time
+from stages.stage3_analysis import analyze_single_document, analyze_single_document_async, report_latency, ANALYSIS_WORKERS
+from stages.stage4_scoring import score_documents, score_documents_async, SCORING_WORKERS, SCORING_BATCH_SIZE
+import os
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Streaming mode: each document goes download -> analysis -> scoring on its own instead of
+# waiting behind whole-stage barriers (main.py / server.py, PIPELINE_STREAMING=True)
+PIPELINE_STREAMING = os.getenv("PIPELINE_STREAMING", "False").lower() == "true"
+# Analyses running at once; a full set holds back the discovery stream
+STREAM_ANALYSIS_INFLIGHT = int(os.getenv("STREAM_ANALYSIS_INFLIGHT", ANALYSIS_WORKERS))
+# Analysed documents are scored in micro-batches: up to SCORING_BATCH_SIZE, or whatever
+# arrived within this many seconds of the first one
+STREAM_SCORE_WAIT = float(os.getenv("STREAM_SCORE_WAIT", 2.0))
+
+_END = object()
+
+
+def _stage_started(on_stage, started, stage):
+    if on_stage and stage not in started:
+        started.add(stage)
+        on_stage(stage)
+
+
+def stream_discover_analyze_score(decomposition_data, topic, on_stage=None):
+    """
+    Stages 2, 3 and 4 as one pipeline. Documents are analysed as soon as they are parsed
+    and scored in micro-batches as soon as they are analysed. `on_stage(code)` is called
+    the first time each stage gets work. Returns (analyzed_documents, scored_documents).
+    """
+    print("\n--- STAGES 2-4: DISCOVERY -> ANALYSIS -> SCORING (Streaming) ---")
+    if not decomposition_data or 'subtopics' not in decomposition_data:
+        print("Invalid input for Stage 2")
+        return [], []
+
+    started = set()
+    _stage_started(on_stage, started, "2")
+    start = time.time()
+
+    discovered = []
+    analyzed_documents = []
+    scored_documents = []
+    analyzed_queue = queue.Queue()
+    slots = threading.BoundedSemaphore(STREAM_ANALYSIS_INFLIGHT)
+    lock = threading.Lock()
+
+    def analyze(doc):
+        try:
+            result = analyze_single_document(doc, topic)
+        finally:
+            slots.release()
+        if result:
+            with lock:
+                analyzed_documents.append(result)
+            analyzed_queue.put(result)
+
+    def score(batch):
+        scored = score_documents(batch, topic)
+        with lock:
+            scored_documents.extend(scored)
+        print(f"  [Stream] {len(scored)} scored after {time.time() - start:.1f}s")
+
+    scorer_errors = []
+
+    def scorer(scoring_pool):
+        # Micro-batching: wait for one document, then collect more for up to STREAM_SCORE_WAIT
+        futures = []
+        done = False
+        try:
+            while not done:
+                item = analyzed_queue.get()
+                if item is _END:
+                    break
+                batch = [item]
+                deadline = time.time() + STREAM_SCORE_WAIT
+                while len(batch) < SCORING_BATCH_SIZE:
+                    try:
+                        item = analyzed_queue.get(timeout=max(deadline - time.time(), 0))
+                    except queue.Empty:
+                        break
+                    if item is _END:
+                        done = True
+                        break
+                    batch.append(item)
+                _stage_started(on_stage, started, "4")
+                futures.append(scoring_pool.submit(score, batch))
+            for future in futures:
+                future.result()
+        except Exception as e:
+            scorer_errors.append(e)
+
+    with ThreadPoolExecutor(max_workers=STREAM_ANALYSIS_INFLIGHT) as analysis_pool, \
+            ThreadPoolExecutor(max_workers=SCORING_WORKERS) as scoring_pool:
+        scorer_thread = threading.Thread(target=scorer, args=(scoring_pool,), daemon=True)
+        scorer_thread.start()
+
+        analysis_futures = []
+        try:
+            for doc in discover_documents(decomposition_data, topic):
+                discovered.append(doc)
+                slots.acquire()
+                _stage_started(on_stage, started, "3")
+                analysis_futures.append(analysis_pool.submit(analyze, doc))
+            for future in analysis_futures:
+                future.result()
+        except BaseException:
+            for future in analysis_futures:
+                future.cancel()
+            raise
+        finally:
+            # The scorer must see _END whatever happened upstream, or join() never returns
+            analyzed_queue.put(_END)
+            scorer_thread.join()
+
+        if scorer_errors:
+            raise scorer_errors[0]
+
+    print(f"Total documents retrieved: {len(discovered)}")
+    _report_parse_time(discovered)
+    report_latency(analyzed_documents)
+    print(f"  [Stream] {len(scored_documents)} documents discovered, analysed and scored in {time.time() - start:.1f}s")
+    return analyzed_documents, scored_documents
+
+
+async def stream_discover_analyze_score_async(decomposition_data, topic, on_stage=None):
+    """
+    Async counterpart of stream_discover_analyze_score.
+    """
+    print("\n--- STAGES 2-4: DISCOVERY -> ANALYSIS -> SCORING (Streaming) ---")
+    if not decomposition_data or 'subtopics' not in decomposition_data:
+        print("Invalid input for Stage 2")
+        return [], []
+
+    started = set()
+    _stage_started(on_stage, started, "2")
+    start = time.time()
+
+    discovered = []
+    analyzed_documents = []
+    scored_documents = []
+    analyzed_queue = asyncio.Queue()
+    analysis_slots = asyncio.Semaphore(STREAM_ANALYSIS_INFLIGHT)
+    scoring_slots = asyncio.Semaphore(SCORING_WORKERS)
+
+    async def analyze(doc):
+        try:
+            result = await analyze_single_document_async(doc, topic)
+        finally:
+            analysis_slots.release()
+        if result:
+            analyzed_documents.append(result)
+            await analyzed_queue.put(result)
+
+    async def score(batch):
+        async with scoring_slots:
+            scored = await score_documents_async(batch, topic)
+        scored_documents.extend(scored)
+        print(f"  [Stream] {len(scored)} scored after {time.time() - start:.1f}s")
+
+    async def scorer():
+        tasks = []
+        done = False
+        loop = asyncio.get_running_loop()
+        while not done:
+            item = await analyzed_queue.get()
+            if item is _END:
+                break
+            batch = [item]
+            deadline = loop.time() + STREAM_SCORE_WAIT
+            while len(batch) < SCORING_BATCH_SIZE:
+                try:
+                    item = await asyncio.wait_for(analyzed_queue.get(), max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    break
+                if item is _END:
+                    done = True
+                    break
+                batch.append(item)
+            _stage_started(on_stage, started, "4")
+            tasks.append(asyncio.create_task(score(batch)))
+        await asyncio.gather(*tasks)
+
+    scorer_task = asyncio.create_task(scorer())
+    analysis_tasks = []
+    try:
+        async for doc in discover_documents_async(decomposition_data, topic):
+            discovered.append(doc)
+            await analysis_slots.acquire()
+            _stage_started(on_stage, started, "3")
+            analysis_tasks.append(asyncio.create_task(analyze(doc)))
+        await asyncio.gather(*analysis_tasks)
+    except BaseException as e:
+        for task in analysis_tasks:
+            task.cancel()
+        if isinstance(e, asyncio.CancelledError):
+            scorer_task.cancel()
+        # Let the scorer finish what it has, but keep the upstream error as the one raised
+        analyzed_queue.put_nowait(_END)
+        await asyncio.gather(scorer_task, return_exceptions=True)
+        raise
+
+    analyzed_queue.put_nowait(_END)
+    await scorer_task
+
+    print(f"Total documents retrieved: {len(discovered)}")
+    _report_parse_time(discovered)
+    report_latency(analyzed_documents)
+    print(f"  [Stream] {len(scored_documents)} documents discovered, analysed and scored in {time.time() - start:.1f}s")
+    return analyzed_documents, scored_documents
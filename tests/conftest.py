@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# The repo is run from its root, not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Several modules open their caches and stores (llm_cache.db, memory_store.*, ...) in the
+# working directory at import time; keep them out of the checkout
+os.chdir(tempfile.mkdtemp(prefix="research-tests-"))
@@ -0,0 +1,86 @@
+import json
+import stages.stage4_scoring as stage4
+from stages.stage4_scoring import parse_batch_scores, apply_batch_scores, plan_batches
+
+
+def doc(i, text="short"):
+    return {"title": f"Doc {i}", "analysis": {
+        "research_problem": text, "methodology": text, "key_findings": text, "novelty_assessment": text,
+    }}
+
+
+def reply(indices):
+    return json.dumps([{"index": i, "score": 5 + i, "strengths": "s", "weaknesses": "w"} for i in indices])
+
+
+def test_reply_covering_every_index_is_accepted():
+    scores = parse_batch_scores(reply([2, 0, 1]), 3)
+    assert sorted(scores) == [0, 1, 2]
+    assert scores[2] == {"score": 7, "strengths": "s", "weaknesses": "w"}
+
+
+def test_wrapped_array_is_accepted():
+    response = "Here you go: " + json.dumps({"scores": json.loads(reply([0, 1]))})
+    assert sorted(parse_batch_scores(response, 2)) == [0, 1]
+
+
+def test_one_based_reply_is_rejected():
+    assert parse_batch_scores(reply([1, 2, 3]), 3) == {}
+
+
+def test_partial_duplicate_or_malformed_replies_are_rejected():
+    assert parse_batch_scores(reply([0, 1]), 3) == {}
+    assert parse_batch_scores(reply([0, 1, 1]), 3) == {}
+    assert parse_batch_scores(json.dumps([{"index": 0, "score": 5}, {"index": 1, "score": "high"}]), 2) == {}
+    assert parse_batch_scores("no json here", 2) == {}
+
+
+def test_apply_returns_whole_batch_when_reply_is_rejected():
+    batch = [(doc(i), "") for i in range(3)]
+    missing = apply_batch_scores(batch, reply([1, 2, 3]))
+    assert missing == [d for d, _ in batch]
+    assert not any('scoring' in d for d, _ in batch)
+
+    assert apply_batch_scores(batch, reply([0, 1, 2])) == []
+    assert [d['scoring']['score'] for d, _ in batch] == [5, 6, 7]
+
+
+def test_plan_batches_respects_batch_size(monkeypatch):
+    monkeypatch.setattr(stage4, "SCORING_BATCH_SIZE", 4)
+    monkeypatch.setattr(stage4, "batch_token_budget", lambda: 10 ** 6)
+    batches = plan_batches([doc(i) for i in range(10)])
+    assert [len(b) for b in batches] == [4, 4, 2]
+    # Entries are numbered from 0 within each batch
+    assert [entry.strip().startswith(f"[{i}]") for i, (_, entry) in enumerate(batches[1])] == [True] * 4
+
+
+def test_plan_batches_respects_token_budget(monkeypatch):
+    monkeypatch.setattr(stage4, "SCORING_BATCH_SIZE", 10)
+    docs = [doc(i, text="x" * 2000) for i in range(6)]
+    per_doc = stage4.estimate_tokens(stage4.build_batch_entry(0, docs[0])) + stage4.SCORE_OUTPUT_TOKENS
+    overhead = stage4.estimate_tokens(stage4.build_batch_prompt([], ""))
+    monkeypatch.setattr(stage4, "batch_token_budget", lambda: overhead + 2 * per_doc + 10)
+
+    batches = plan_batches(docs)
+    assert [len(b) for b in batches] == [2, 2, 2]
+    assert [d for b in batches for d, _ in b] == docs
+
+
+def test_single_entry_reply_parsed_as_object_is_accepted():
+    assert sorted(parse_batch_scores(reply([0]), 1)) == [0]
+    assert sorted(parse_batch_scores(json.dumps({"index": 0, "score": 6}), 1)) == [0]
+    assert parse_batch_scores(json.dumps({"index": 1, "score": 6}), 1) == {}
+
+
+def test_single_document_batch_uses_the_single_prompt(monkeypatch):
+    prompts = []
+
+    def fake_query(stage, prompt):
+        prompts.append(prompt)
+        return json.dumps({"score": 8, "strengths": "s", "weaknesses": "w"})
+
+    monkeypatch.setattr(stage4, "query_stage", fake_query)
+    d = doc(0)
+    assert stage4.score_batch([(d, stage4.build_batch_entry(0, d))], "topic") == []
+    assert prompts == [stage4.build_scoring_prompt(d, "topic")]
+    assert d['scoring']['score'] == 8
@@ -0,0 +1,68 @@
+from stages.stage2_discovery import CandidateGate
+
+
+def result(url, title, snippet=""):
+    return {"link": url, "title": title, "snippet": snippet}
+
+
+SOLAR = {"name": "Solar cell efficiency", "keywords": ["perovskite"], "search_queries": []}
+WIND = {"name": "Wind turbine wakes", "keywords": ["wake"], "search_queries": []}
+
+
+def relevant(prefix, count, words):
+    return [result(f"https://{prefix}.org/{i}", f"{words} study {i}", f"Results on {words} measured in trial {i}.")
+            for i in range(count)]
+
+
+def test_each_query_is_admitted_on_arrival_against_its_subtopic_quota():
+    gate = CandidateGate([(SOLAR, "q1"), (SOLAR, "q2"), (WIND, "q3")], topic="renewable energy", limit=4)
+    assert gate.quota == 2
+
+    # The first solar query fills the subtopic's share without waiting for the second
+    assert len(gate.admit(SOLAR, relevant("solar-a", 3, "perovskite solar cell efficiency"))) == 2
+    assert gate.admit(SOLAR, relevant("solar-b", 3, "perovskite solar cell efficiency")) == []
+    assert len(gate._leftovers) == 4
+
+    admitted = gate.admit(WIND, relevant("wind", 5, "wind turbine wake"))
+    assert len(admitted) == 2
+    assert gate.full
+
+
+def test_later_query_fills_room_left_by_an_earlier_one():
+    gate = CandidateGate([(SOLAR, "q1"), (SOLAR, "q2"), (WIND, "q3")], topic="renewable energy", limit=6)
+    assert len(gate.admit(SOLAR, relevant("solar-a", 1, "perovskite solar cell efficiency"))) == 1
+    assert len(gate.admit(SOLAR, relevant("solar-b", 4, "perovskite solar cell efficiency"))) == 2
+
+
+def test_duplicate_urls_are_admitted_once():
+    gate = CandidateGate([(SOLAR, "q1"), (WIND, "q2")], topic="energy", limit=10)
+    same = relevant("shared", 2, "perovskite solar cell")
+    admitted = gate.admit(SOLAR, same) + gate.admit(WIND, same + relevant("wind", 1, "wind turbine wake"))
+    urls = [item['link'] for item in admitted]
+    assert len(urls) == len(set(urls)) == 3
+
+
+def test_irrelevant_results_do_not_take_a_share():
+    gate = CandidateGate([(SOLAR, "q1")], topic="solar", limit=4)
+    junk = [result(f"https://junk.com/{i}", "Buy cheap shoes online", "Free shipping today") for i in range(3)]
+    admitted = gate.admit(SOLAR, junk + relevant("solar", 1, "perovskite solar cell efficiency"))
+    assert [item['link'] for item in admitted] == ["https://solar.org/0"]
+
+
+def test_finish_fills_slots_left_by_thin_subtopics():
+    gate = CandidateGate([(SOLAR, "q1"), (WIND, "q2")], topic="renewable energy", limit=6)
+    assert len(gate.admit(SOLAR, relevant("solar", 6, "perovskite solar cell efficiency"))) == 3
+    assert gate.admit(WIND, []) == []
+
+    leftovers = gate.finish()
+    assert len(leftovers) == 3
+    assert gate.admitted == 6
+    assert gate.finish() == []
+
+
+def test_finish_never_exceeds_limit():
+    gate = CandidateGate([(SOLAR, "q1"), (WIND, "q2")], topic="energy", limit=3)
+    gate.admit(SOLAR, relevant("solar", 5, "perovskite solar cell"))
+    gate.admit(WIND, relevant("wind", 5, "wind turbine wake"))
+    gate.finish()
+    assert gate.admitted == 3
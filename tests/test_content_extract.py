@@ -0,0 +1,58 @@
+import os
+import pytest
+from utils.content_extract import extract_main_content, link_density
+from utils.parsing import parse_html
+from bs4 import BeautifulSoup
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures")
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name, first_line", [
+    ("news_article.html", "Solid-state batteries edge closer to mass production"),
+    ("wiki_entry.html", "Photosynthetic efficiency"),
+    ("legacy_layout.html", "Technical Note 17: Measuring Infiltration Rates in Agricultural Soils"),
+])
+def test_article_starts_with_its_title(name, first_line):
+    assert extract_main_content(fixture(name)).splitlines()[0] == first_line
+
+
+def test_news_boilerplate_is_dropped():
+    text = extract_main_content(fixture("news_article.html"))
+    assert "lithium metal anode" in text
+    for junk in ("We use cookies", "Share on LinkedIn", "Sign up for our free newsletter",
+                 "Related stories", "Most read", "Privacy policy", "Wake me up when I can buy one"):
+        assert junk not in text
+
+
+def test_wiki_keeps_data_table_and_drops_footer():
+    text = extract_main_content(fixture("wiki_entry.html"))
+    assert "C4 plants (typical) | 4.3%" in text
+    assert "This page was last edited" not in text
+
+
+def test_paper_keeps_abstract():
+    text = extract_main_content(fixture("paper_abstract.html"))
+    assert "Sparse Mixture-of-Experts Routing with Load-Aware Gating" in text
+    assert "load-aware gating" in text
+
+
+@pytest.mark.parametrize("name", sorted(os.listdir(FIXTURES)))
+def test_main_content_is_shorter_than_whole_page(name):
+    content = fixture(name)
+    assert 0 < len(extract_main_content(content)) < len(parse_html(content))
+
+
+def test_pages_without_prose_return_empty():
+    assert extract_main_content(b"<html><body><nav><a href='/'>Home</a></nav><p>Hi</p></body></html>") == ""
+
+
+def test_link_density():
+    soup = BeautifulSoup("<div id='menu'><a>Home</a><a>About</a></div><p id='prose'>Plain text <a>one</a></p>",
+                         "html.parser")
+    assert link_density(soup.find(id="menu")) == 1.0
+    assert 0 < link_density(soup.find(id="prose")) < 0.5
@@ -0,0 +1,51 @@
+import time
+import pytest
+from utils.doc_cache import DocumentCache, content_hash
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DocumentCache(cache_file=str(tmp_path / "doc_cache.db"), fresh=60)
+
+
+def test_put_then_lookup_round_trips_compressed_text(cache):
+    text = "parsed body " * 1000
+    cache.put("http://a/paper", content_hash(b"raw"), text, etag='"v1"', last_modified="Mon")
+    entry = cache.lookup("http://a/paper")
+    assert entry == {"text": text, "fresh": True, "etag": '"v1"', "last_modified": "Mon"}
+    assert cache.stats()["bytes"] < len(text)
+    assert cache.lookup("http://a/other") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_stale_entry_carries_conditional_headers_until_revalidated(cache):
+    cache.fresh = 0.05
+    cache.put("http://a/paper", content_hash(b"raw"), "text", etag='"v1"', last_modified="Mon")
+    time.sleep(0.1)
+
+    entry = cache.lookup("http://a/paper")
+    assert not entry["fresh"]
+    assert cache.conditional_headers(entry) == {"If-None-Match": '"v1"', "If-Modified-Since": "Mon"}
+
+    cache.mark_revalidated("http://a/paper")
+    assert cache.lookup("http://a/paper")["fresh"]
+
+
+def test_identical_bytes_under_another_url_are_found_by_hash(cache):
+    cache.put("http://a/paper", content_hash(b"raw pdf"), "text")
+    assert cache.text_for_hash(content_hash(b"raw pdf")) == "text"
+    assert cache.text_for_hash(content_hash(b"other")) is None
+    assert cache.stats()["hash_hits"] == 1
+
+
+def test_least_recently_used_entry_is_evicted_over_budget(cache):
+    cache.put("http://a/1", "h1", "first document")
+    cache.put("http://a/2", "h2", "second document")
+    one_entry = cache.stats()["bytes"] // 2
+    cache.lookup("http://a/1")   # 2 is now the least recently used
+
+    cache.max_bytes = 2 * one_entry + one_entry // 2
+    cache.put("http://a/3", "h3", "third document")
+    assert cache.lookup("http://a/2") is None
+    assert cache.lookup("http://a/1") is not None
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,31 @@
+import pytest
+from utils.memory import MemorySystem
+
+
+@pytest.fixture
+def memory(tmp_path):
+    system = MemorySystem(store_path=str(tmp_path / "memory_store"), memory_file=str(tmp_path / "none.json"))
+    system.embedding_provider = "gemini"
+    return system
+
+
+def test_fallback_vector_is_cached_under_the_provider_that_made_it(memory, monkeypatch):
+    monkeypatch.setattr(memory, "_embed_batch_gemini", lambda texts: [None] * len(texts))
+    monkeypatch.setattr(memory, "_embed_batch_ollama", lambda texts: [[0.5] * 8 for _ in texts])
+
+    assert memory._get_embedding("query") == [0.5] * 8
+    cache = memory.embedding_cache
+    assert cache.get(cache.make_key("gemini", "query")) is None
+    assert cache.get(cache.make_key("ollama", "query")) == [0.5] * 8
+
+    # Once Gemini is back, the query is embedded by Gemini instead of reusing the Ollama vector
+    monkeypatch.setattr(memory, "_embed_batch_gemini", lambda texts: [[1.0] * 4 for _ in texts])
+    assert memory._get_embedding("query") == [1.0] * 4
+    assert cache.get(cache.make_key("gemini", "query")) == [1.0] * 4
+
+
+def test_batch_reports_producer_per_text(memory, monkeypatch):
+    monkeypatch.setattr(memory, "_embed_batch_gemini", lambda texts: [[1.0] * 4, None, None])
+    monkeypatch.setattr(memory, "_embed_batch_ollama", lambda texts: [[0.5] * 8, None])
+
+    assert memory._embed_batch(["a", "b", "c"]) == [("gemini", [1.0] * 4), ("ollama", [0.5] * 8), (None, None)]
@@ -0,0 +1,113 @@
+import time
+import asyncio
+import pytest
+from concurrent.futures import Future
+import utils.llm as llm
+import utils.llm_async as llm_async
+from utils.provider_health import provider_health
+
+
+def strategy(model_id, reply=None, delay=0.0, error=None, calls=None):
+    def func(prompt):
+        if calls is not None:
+            calls.append(model_id)
+        time.sleep(delay)
+        if error:
+            raise Exception(error)
+        return reply or model_id
+    func.model_id = model_id
+    return func
+
+
+def async_strategy(model_id, reply=None, delay=0.0, error=None, calls=None):
+    async def func(prompt):
+        if calls is not None:
+            calls.append(model_id)
+        await asyncio.sleep(delay)
+        if error:
+            raise Exception(error)
+        return reply or model_id
+    func.model_id = model_id
+    return func
+
+
+def open_breaker(model_id):
+    breaker = provider_health.get(model_id)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure(Exception("down"))
+    assert not breaker.allow()
+    return breaker
+
+
+@pytest.fixture(autouse=True)
+def short_hedge_delay(monkeypatch):
+    monkeypatch.setattr(llm, "_hedge_delay", lambda stage, model_id: 0.05)
+    monkeypatch.setattr(llm_async, "_hedge_delay", lambda stage, model_id: 0.05)
+
+
+def test_fast_primary_wins_without_a_backup():
+    calls = []
+    result = llm.execute_hedged(
+        [strategy("h-fast-a", calls=calls), strategy("h-fast-b", calls=calls)], "p", stage="hedge-test"
+    )
+    assert result == "h-fast-a"
+    assert calls == ["h-fast-a"]
+
+
+def test_slow_primary_loses_to_backup():
+    before = llm.get_hedge_stats()
+    result = llm.execute_hedged(
+        [strategy("h-slow-a", delay=0.5), strategy("h-slow-b")], "p", stage="hedge-test"
+    )
+    after = llm.get_hedge_stats()
+    assert result == "h-slow-b"
+    assert after["hedges_launched"] == before["hedges_launched"] + 1
+    assert after["backup_wins"] == before["backup_wins"] + 1
+
+
+def test_fallback_still_reaches_providers_skipped_by_the_hedge():
+    # a is cooling down so b is raced alone; when b fails, a must still be tried as a last resort
+    open_breaker("h-skip-a")
+    calls = []
+    chain = [strategy("h-skip-a", calls=calls), strategy("h-skip-b", error="boom", calls=calls)]
+    assert llm.execute_hedged(chain, "p", stage="hedge-test") == "h-skip-a"
+    assert calls == ["h-skip-b", "h-skip-a"]
+
+
+def test_cancelled_backup_releases_half_open_trial(monkeypatch):
+    breaker = open_breaker("h-trial-b")
+    breaker.opened_until = time.time() - 1  # cooldown over: the hedge's allow() takes the trial
+    submit = llm._hedge_pool.submit
+
+    def queue_backup_forever(fn, stage, func, *args):
+        # The backup never leaves the queue, so the primary's win cancels it before it runs
+        if func.model_id == "h-trial-b":
+            return Future()
+        return submit(fn, stage, func, *args)
+
+    monkeypatch.setattr(llm._hedge_pool, "submit", queue_backup_forever)
+    chain = [strategy("h-trial-a", delay=0.15), strategy("h-trial-b")]
+    assert llm.execute_hedged(chain, "p", stage="hedge-test") == "h-trial-a"
+    assert breaker.allow()   # trial slot was handed back
+
+
+def test_get_hedge_stats_reports_per_stage_percentiles():
+    llm._record_stage_latency("hedge-stats", "h-stats", 0.2)
+    stats = llm.get_hedge_stats()
+    assert stats["stage_latencies"]["hedge-stats"]["h-stats"] == 0.2
+
+
+def test_async_slow_primary_is_cancelled_and_backup_wins():
+    calls = []
+    result = asyncio.run(llm_async.execute_hedged_async(
+        [async_strategy("ha-slow-a", delay=1.0, calls=calls), async_strategy("ha-slow-b", calls=calls)],
+        "p", stage="hedge-test",
+    ))
+    assert result == "ha-slow-b"
+    assert calls == ["ha-slow-a", "ha-slow-b"]
+
+
+def test_async_fallback_reaches_skipped_provider():
+    open_breaker("ha-skip-a")
+    chain = [async_strategy("ha-skip-a"), async_strategy("ha-skip-b", error="boom")]
+    assert asyncio.run(llm_async.execute_hedged_async(chain, "p", stage="hedge-test")) == "ha-skip-a"
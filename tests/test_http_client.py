@@ -0,0 +1,85 @@
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from utils.http_client import HttpClient
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            hits = server.hits[self.path]
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            if self.path == "/busy" and hits == 1:
+                self.send_response(429)
+                self.send_header("Retry-After", "0.2")
+                self.end_headers()
+                return
+            if self.path == "/slow":
+                time.sleep(0.1)
+            body = b"ok" * 10
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.lock = threading.Lock()
+    httpd.hits, httpd.active, httpd.peak = {}, 0, 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_retry_after_is_honoured(server):
+    httpd, base = server
+    client = HttpClient()
+    start = time.time()
+    response = client.get(base + "/busy")
+    assert response.status_code == 200
+    assert time.time() - start >= 0.2
+    assert httpd.hits["/busy"] == 2
+    assert client.stats()["retries"] == 1
+
+
+def test_concurrent_requests_per_host_are_capped(server):
+    httpd, base = server
+    client = HttpClient(per_host=2)
+    threads = [threading.Thread(target=client.get, args=(base + "/slow",)) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert httpd.hits["/slow"] == 6
+    assert httpd.peak <= 2
+    stats = client.stats()
+    assert stats["requests"] == 6 and stats["active"] == 0
+    assert stats["top_hosts"] == {base.split("//")[1]: 6}
+
+
+def test_consume_reads_body_and_returns_its_result(server):
+    _, base = server
+    client = HttpClient()
+    assert client.get(base + "/page", consume=lambda r: r.content) == b"ok" * 10
+
+
+def test_transport_errors_are_counted_and_raised():
+    client = HttpClient(timeout=(0.5, 0.5))
+    with pytest.raises(Exception):
+        client.get("http://127.0.0.1:1/")
+    assert client.stats()["errors"] == 1
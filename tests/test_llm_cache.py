@@ -0,0 +1,86 @@
+import time
+import threading
+import pytest
+from utils.llm_cache import LLMResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMResponseCache(cache_file=str(tmp_path / "llm_cache.db"))
+
+
+def run_concurrently(count, target):
+    results = [None] * count
+    errors = [None] * count
+    barrier = threading.Barrier(count)
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_concurrent_misses_make_one_call(cache):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return "answer"
+
+    results, errors = run_concurrently(8, lambda: cache.get_or_compute("scoring", "groq", "prompt", compute))
+
+    assert errors == [None] * 8
+    assert len(calls) == 1
+    assert [r[0] for r in results] == ["answer"] * 8
+    assert sum(1 for _, from_cache in results if not from_cache) == 1
+    assert cache.misses == 1
+    assert cache.hits + cache.coalesced == 7
+
+
+def test_waiters_share_the_leaders_exception(cache):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        raise RuntimeError("provider down")
+
+    results, errors = run_concurrently(4, lambda: cache.get_or_compute("scoring", "groq", "prompt", compute))
+
+    assert len(calls) == 1
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    # Failures are not cached: the next call computes again
+    assert cache.get_or_compute("scoring", "groq", "prompt", lambda: "retry") == ("retry", False)
+
+
+def test_hit_after_miss_and_keys_are_per_stage_and_model(cache):
+    assert cache.get_or_compute("review", "anthropic", "p", lambda: "first") == ("first", False)
+    assert cache.get_or_compute("review", "anthropic", "p", lambda: "second") == ("first", True)
+    assert cache.get_or_compute("review", "groq", "p", lambda: "other model") == ("other model", False)
+    assert cache.get_or_compute("scoring", "anthropic", "p", lambda: "other stage") == ("other stage", False)
+
+
+def test_invalidate_drops_entry_so_next_call_recomputes(cache):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "not json"
+
+    cache.get_or_compute("review", "groq", "prompt", compute)
+    assert cache.invalidate("review", "groq", "prompt")
+    assert not cache.invalidate("review", "groq", "prompt")
+
+    response, cached = cache.get_or_compute("review", "groq", "prompt", compute)
+    assert (response, cached) == ("not json", False)
+    assert len(calls) == 2
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from utils.memory_store import MemoryStore
+
+
+def memory(mem_id, dim=4, timestamp=None):
+    return {
+        "id": mem_id,
+        "prompt": f"prompt {mem_id}",
+        "response": f"response {mem_id}",
+        "embedding": [float(len(mem_id))] * dim,
+        "metadata": {"stage": "analysis"},
+        "timestamp": timestamp,
+    }
+
+
+@pytest.fixture
+def base(tmp_path):
+    return str(tmp_path / "memory_store")
+
+
+def test_replay_restores_live_memories_in_order(base):
+    store = MemoryStore(base)
+    for i in range(5):
+        store.append(memory(f"m{i}", timestamp=i))
+    store.delete(["m1", "m3"])
+    store.close()
+
+    reloaded = MemoryStore(base)
+    memories = reloaded.load()
+    assert [m['id'] for m in memories] == ["m0", "m2", "m4"]
+    assert "prompt" not in memories[0]
+    np.testing.assert_array_equal(memories[1]['embedding'], np.full(4, 2.0, dtype=np.float32))
+    assert reloaded.read("m2") == {"prompt": "prompt m2", "response": "response m2"}
+    assert reloaded.read("m1") is None
+
+
+def test_overwrite_keeps_latest_record(base):
+    store = MemoryStore(base)
+    store.append(memory("a", timestamp=1))
+    updated = memory("a", timestamp=2)
+    updated['response'] = "updated"
+    store.append(updated)
+    store.close()
+
+    reloaded = MemoryStore(base)
+    assert len(reloaded.load()) == 1
+    assert reloaded.read("a")['response'] == "updated"
+
+
+def test_compaction_keeps_records_and_embeddings(base, monkeypatch):
+    monkeypatch.setattr("utils.memory_store.COMPACT_MIN_RECORDS", 4)
+    store = MemoryStore(base)
+    for i in range(6):
+        store.append(memory(f"m{i}", dim=3, timestamp=i))
+    store.delete([f"m{i}" for i in range(4)])  # 8 dead records > 2 live: compacts
+
+    assert store._dead == 0
+    with open(f"{base}.log") as f:
+        assert len(f.readlines()) == 2
+    assert store.read("m5") == {"prompt": "prompt m5", "response": "response m5"}
+
+    store.append(memory("m6", dim=3, timestamp=6))
+    store.close()
+
+    memories = MemoryStore(base).load()
+    assert [m['id'] for m in memories] == ["m4", "m5", "m6"]
+    for mem in memories:
+        np.testing.assert_array_equal(mem['embedding'], np.full(3, float(len(mem['id'])), dtype=np.float32))
+
+
+def test_torn_tail_is_dropped_and_appends_stay_readable(base):
+    store = MemoryStore(base)
+    store.append(memory("a", timestamp=1))
+    store.close()
+    with open(f"{base}.log", "ab") as f:
+        f.write(b'{"op": "add", "id": "torn", "pro')
+
+    store = MemoryStore(base)
+    assert [m['id'] for m in store.load()] == ["a"]
+    store.append(memory("b", timestamp=2))
+    assert store.read("b")['prompt'] == "prompt b"
+    store.close()
+
+    assert [m['id'] for m in MemoryStore(base).load()] == ["a", "b"]
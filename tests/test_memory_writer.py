@@ -0,0 +1,75 @@
+import time
+import threading
+from utils.memory_writer import WriteBehindQueue
+
+
+def test_flush_processes_every_job_in_order():
+    batches = []
+    writer = WriteBehindQueue(batches.append, flush_interval=10, batch_size=4)
+
+    for i in range(10):
+        assert writer.submit(i)
+    assert writer.flush(timeout=5)
+
+    assert [job for batch in batches for job in batch] == list(range(10))
+    assert all(len(batch) <= 4 for batch in batches)
+    assert writer.stats()["processed"] == 10
+    writer.close()
+
+
+def test_full_queue_blocks_then_drops():
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow(jobs):
+        started.set()
+        release.wait(5)
+
+    writer = WriteBehindQueue(slow, maxsize=1, flush_interval=0.01, batch_size=1, enqueue_timeout=0.05)
+    writer.submit("first")
+    assert started.wait(5)      # worker is stuck on "first"
+    assert writer.submit("second")   # fills the queue
+    assert not writer.submit("third")
+
+    stats = writer.stats()
+    assert stats["dropped"] == 1
+    assert stats["blocked"] == 1
+    assert stats["blocked_seconds"] >= 0.04
+
+    release.set()
+    assert writer.flush(timeout=5)
+    assert writer.stats()["processed"] == 2
+    writer.close()
+
+
+def test_failed_batch_is_counted_and_worker_keeps_running():
+    seen = []
+
+    def process(jobs):
+        if "bad" in jobs:
+            raise ValueError("boom")
+        seen.extend(jobs)
+
+    writer = WriteBehindQueue(process, flush_interval=10, batch_size=1)
+    writer.submit("bad")
+    assert writer.flush(timeout=5)
+    writer.submit("good")
+    assert writer.flush(timeout=5)
+
+    assert seen == ["good"]
+    assert writer.stats()["failed"] == 1
+    writer.close()
+
+
+def test_close_flushes_pending_jobs_once():
+    seen = []
+    writer = WriteBehindQueue(seen.extend, flush_interval=60, batch_size=100)
+    writer.submit("a")
+    writer.submit("b")
+
+    start = time.monotonic()
+    writer.close()
+    writer.close()
+
+    assert seen == ["a", "b"]
+    assert time.monotonic() - start < 5
@@ -0,0 +1,56 @@
+import io
+import pytest
+from reportlab.pdfgen import canvas
+import utils.parsing as parsing
+from utils.parsing import ParsePool, parse_content
+
+HTML = b"<html><body><script>var x = 1;</script><p>First paragraph.</p><p>Second one.</p></body></html>"
+
+
+def make_pdf(pages):
+    buf = io.BytesIO()
+    pdf = canvas.Canvas(buf)
+    for i in range(pages):
+        pdf.drawString(72, 720, f"page {i} text")
+        pdf.showPage()
+    pdf.save()
+    return buf.getvalue()
+
+
+@pytest.fixture
+def pool():
+    pool = ParsePool(workers=2)
+    yield pool
+    pool.close()
+
+
+def test_workers_are_not_forked_from_the_app(pool):
+    assert pool._pool()._mp_context.get_start_method() in ("forkserver", "spawn")
+
+
+def test_html_parsed_in_a_worker_matches_in_process(pool):
+    text, seconds = pool.parse(HTML, "text/html", "http://a/page")
+    assert text == parse_content(HTML, "text/html", "http://a/page")
+    assert "First paragraph." in text and "var x" not in text
+    assert seconds >= 0
+
+
+def test_long_pdf_is_split_across_workers_in_page_order(pool, monkeypatch):
+    monkeypatch.setattr(parsing, "PDF_PAGES_PER_TASK", 2)
+    text, _ = pool.parse(make_pdf(5), "application/pdf", "http://a/paper.pdf")
+    assert [line for line in text.splitlines() if line] == [f"page {i} text" for i in range(5)]
+    assert pool.stats()["documents"] == 1
+
+
+def test_pdf_ranges_stop_once_enough_text_is_collected(pool, monkeypatch):
+    monkeypatch.setattr(parsing, "PDF_PAGES_PER_TASK", 1)
+    monkeypatch.setattr(parsing, "DOC_MAX_CHARS", 1)
+    text, _ = pool.parse(make_pdf(6), "application/pdf", "http://a/paper.pdf")
+    assert text.strip() == "page 0 text"
+
+
+def test_zero_workers_parses_in_process():
+    pool = ParsePool(workers=0)
+    text, _ = pool.parse(HTML, "text/html", "http://a/page")
+    assert "Second one." in text
+    assert pool._executor is None
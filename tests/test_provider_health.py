@@ -0,0 +1,88 @@
+import time
+import pytest
+from utils.provider_health import CircuitBreaker, CLOSED, OPEN, HALF_OPEN, parse_retry_after
+
+
+def breaker(**kwargs):
+    kwargs.setdefault("failure_threshold", 3)
+    kwargs.setdefault("cooldown", 0.05)
+    kwargs.setdefault("max_cooldown", 10)
+    return CircuitBreaker("groq", **kwargs)
+
+
+def test_opens_after_consecutive_failures():
+    b = breaker()
+    b.record_failure(RuntimeError("timeout"))
+    b.record_failure(RuntimeError("timeout"))
+    assert b.state == CLOSED and b.allow()
+
+    b.record_failure(RuntimeError("timeout"))
+    assert b.state == OPEN
+    assert not b.allow()
+    assert b.skipped == 1
+
+
+def test_success_resets_the_failure_count():
+    b = breaker()
+    b.record_failure(RuntimeError("timeout"))
+    b.record_failure(RuntimeError("timeout"))
+    b.record_success(0.1)
+    b.record_failure(RuntimeError("timeout"))
+    assert b.state == CLOSED
+
+
+def test_half_open_admits_one_trial_and_success_closes():
+    b = breaker(failure_threshold=1)
+    b.record_failure(RuntimeError("timeout"))
+    time.sleep(0.06)
+
+    assert b.allow()
+    assert b.state == HALF_OPEN
+    assert not b.allow()  # Only one trial in flight
+
+    b.record_success(0.2)
+    assert b.state == CLOSED
+    assert b.allow()
+
+
+def test_failed_trial_reopens_with_doubled_cooldown():
+    b = breaker(failure_threshold=1)
+    b.record_failure(RuntimeError("timeout"))
+    time.sleep(0.06)
+    assert b.allow()
+
+    b.record_failure(RuntimeError("timeout"))
+    assert b.state == OPEN
+    assert 0.05 < b.retry_in() <= 0.1
+
+
+def test_released_trial_can_be_retried():
+    b = breaker(failure_threshold=1)
+    b.record_failure(RuntimeError("timeout"))
+    time.sleep(0.06)
+    assert b.allow()
+    b.release()
+    assert b.allow()
+
+
+def test_rate_limit_opens_immediately_for_retry_after():
+    b = breaker(failure_threshold=5)
+    b.record_failure(RuntimeError("Error code: 429 - Rate limit reached. Please try again in 7.5s"))
+    assert b.state == OPEN
+    assert b.rate_limited == 1
+    assert 7 < b.retry_in() <= 7.5
+
+
+def test_parse_retry_after_formats():
+    assert parse_retry_after(RuntimeError("Please try again in 1m7.5s")) == 67.5
+    assert parse_retry_after(RuntimeError("retry after 250ms")) == 0.25
+    assert parse_retry_after(RuntimeError("connection reset")) is None
+
+
+def test_latency_percentile():
+    b = breaker()
+    assert b.latency_percentile(95) is None
+    for latency in range(1, 101):
+        b.record_success(latency / 100)
+    assert b.latency_percentile(50) == pytest.approx(0.5, abs=0.011)
+    assert b.latency_percentile(95) == pytest.approx(0.95, abs=0.011)
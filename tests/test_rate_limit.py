@@ -0,0 +1,104 @@
+import time
+import pytest
+from types import SimpleNamespace
+from utils.rate_limit import ProviderRateLimiter, LocalRateLimitError, estimate_tokens, EXPECTED_OUTPUT_TOKENS
+
+
+def test_requests_within_budget_do_not_wait():
+    limiter = ProviderRateLimiter("groq", rpm=10, tpm=1000)
+    start = time.monotonic()
+    for _ in range(10):
+        limiter.acquire(100)
+    assert time.monotonic() - start < 0.1
+    assert limiter.stats()['requests'] == 10
+    assert limiter.stats()['tokens'] == 1000
+    assert limiter.stats()['waits'] == 0
+
+
+def test_exhausted_bucket_waits_for_refill():
+    limiter = ProviderRateLimiter("groq", rpm=0, tpm=600)  # 10 tokens/s
+    limiter.acquire(600)
+    start = time.monotonic()
+    limiter.acquire(3, max_wait=2)
+    assert 0.2 < time.monotonic() - start < 1.0
+    assert limiter.waits == 1
+
+
+def test_wait_longer_than_max_wait_is_rejected_as_rate_limit():
+    limiter = ProviderRateLimiter("groq", rpm=1, tpm=0)
+    limiter.acquire(1)
+    with pytest.raises(LocalRateLimitError, match="Rate limit"):
+        limiter.acquire(1, max_wait=0.5)
+    assert limiter.rejected == 1
+
+
+def test_oversized_request_is_admitted_against_a_full_bucket():
+    limiter = ProviderRateLimiter("groq", rpm=0, tpm=100)
+    limiter.acquire(5000, max_wait=0)
+    assert limiter.tpm.level == pytest.approx(0, abs=1)
+
+
+def test_settle_charges_actual_usage():
+    limiter = ProviderRateLimiter("anthropic", rpm=0, tpm=1000)
+    limiter.acquire(100)
+    limiter.settle(reserved=100, actual=400)
+    assert limiter.tokens == 400
+    assert limiter.tpm.level == pytest.approx(600, abs=1)
+
+
+def test_disabled_limits_never_wait():
+    limiter = ProviderRateLimiter("ollama:qwen2.5", rpm=0, tpm=0)
+    for _ in range(100):
+        limiter.acquire(10 ** 6, max_wait=0)
+    assert limiter.stats()['rpm_available'] is None
+
+
+def test_settle_with_zero_refunds_the_reservation():
+    limiter = ProviderRateLimiter("anthropic", rpm=0, tpm=1000)
+    limiter.acquire(300)
+    limiter.settle(reserved=300, actual=0)
+    assert limiter.tokens == 0
+    assert limiter.tpm.level == pytest.approx(1000, abs=1)
+
+
+def fake_limiter(monkeypatch, llm):
+    limiter = ProviderRateLimiter("test", rpm=0, tpm=100000)
+    monkeypatch.setattr(llm, "get_limiter", lambda name: limiter)
+    return limiter
+
+
+def test_anthropic_model_fallback_is_charged_once(monkeypatch):
+    import utils.llm as llm
+    limiter = fake_limiter(monkeypatch, llm)
+
+    class Missing(Exception):
+        pass
+
+    def message(model, prompt, on_token=None):
+        if "sonnet" in model:
+            raise Missing("model not found")
+        return SimpleNamespace(content=[SimpleNamespace(text="ok")], usage=None)
+
+    monkeypatch.setattr(llm, "anthropic_client", object())
+    monkeypatch.setattr(llm, "NotFoundError", Missing)
+    monkeypatch.setattr(llm, "_anthropic_message", message)
+
+    assert llm._call_anthropic("hello") == "ok"
+    assert limiter.requests == 2
+    assert limiter.tokens == estimate_tokens("hello") + EXPECTED_OUTPUT_TOKENS
+
+
+def test_groq_stream_cut_off_settles_partial_usage(monkeypatch):
+    import utils.llm as llm
+    limiter = fake_limiter(monkeypatch, llm)
+
+    def stream(**kwargs):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="partial answer"))])
+        raise ConnectionError("stream dropped")
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=stream)))
+    monkeypatch.setattr(llm, "groq_client", client)
+
+    with pytest.raises(ConnectionError):
+        llm._call_groq("hello", on_token=lambda text: None)
+    assert limiter.tokens == estimate_tokens("hello") + estimate_tokens("partial answer")
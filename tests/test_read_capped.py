@@ -0,0 +1,33 @@
+from utils.search import read_capped
+
+
+class FakeResponse:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.read = 0
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+
+def test_small_body_is_read_whole():
+    response = FakeResponse([b"abc", b"def"])
+    assert read_capped(response, max_bytes=100) == (b"abcdef", False)
+
+
+def test_body_at_the_limit_is_not_truncated():
+    assert read_capped(FakeResponse([b"12345", b"67890"]), max_bytes=10) == (b"1234567890", False)
+
+
+def test_oversize_body_is_cut_and_reading_stops():
+    response = FakeResponse([b"a" * 6, b"b" * 6, b"c" * 6, b"d" * 6])
+    content, truncated = read_capped(response, max_bytes=10)
+    assert truncated
+    assert content == b"a" * 6 + b"b" * 4
+    assert response.read == 2
+
+
+def test_empty_body():
+    assert read_capped(FakeResponse([]), max_bytes=10) == (b"", False)
@@ -0,0 +1,49 @@
+import time
+import pytest
+from utils.search_cache import SearchCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SearchCache(cache_file=str(tmp_path / "search_cache.db"), ttl=60, backoff=60)
+
+
+RESULTS = [{"title": "Paper", "href": "http://a/paper", "body": "abstract"}]
+
+
+def test_results_are_shared_across_case_and_spacing(cache):
+    cache.put("ddg", "Graph  Neural Networks", 5, RESULTS)
+    assert cache.get("ddg", "graph neural networks ", 5) == RESULTS
+    assert cache.get("ddg", "graph neural networks", 10) is None
+    assert cache.get("google", "graph neural networks", 5) is None
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 2)
+
+
+def test_empty_result_lists_are_not_cached(cache):
+    cache.put("ddg", "q", 5, [])
+    assert cache.get("ddg", "q", 5) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_expired_results_are_misses(cache):
+    cache.ttl = 0.05
+    cache.put("ddg", "q", 5, RESULTS)
+    time.sleep(0.1)
+    assert cache.get("ddg", "q", 5) is None
+
+
+def test_failed_provider_is_skipped_until_backoff_ends(cache):
+    assert not cache.provider_down("google")
+    cache.backoff = 0.1
+    cache.mark_failed("google", "403 quota")
+    assert cache.provider_down("google")
+    assert cache.stats()["providers_down"] == ["google"]
+    time.sleep(0.15)
+    assert not cache.provider_down("google")
+    assert cache.stats()["skipped_provider_calls"] == 1
+
+
+def test_entries_persist_across_instances(tmp_path):
+    path = str(tmp_path / "search_cache.db")
+    SearchCache(cache_file=path).put("ddg", "q", 5, RESULTS)
+    assert SearchCache(cache_file=path).get("ddg", "q", 5) == RESULTS
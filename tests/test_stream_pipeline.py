@@ -0,0 +1,121 @@
+import time
+import asyncio
+import threading
+import pytest
+import stages.stream_pipeline as sp
+
+DECOMPOSITION = {"subtopics": [{"name": "s", "search_queries": ["q"]}]}
+
+
+def make_docs(n):
+    return [{"title": f"Doc {i}", "url": f"http://a/{i}"} for i in range(n)]
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """
+    Replaces discovery, analysis and scoring with fakes that record what they saw.
+    """
+    state = {"docs": make_docs(7), "batches": [], "fail_analysis": set(), "discovery_error": None,
+             "scoring_error": None}
+    lock = threading.Lock()
+
+    def discover(decomposition, topic):
+        for doc in state["docs"]:
+            time.sleep(0.01)
+            yield doc
+        if state["discovery_error"]:
+            raise state["discovery_error"]
+
+    def analyze(doc, topic):
+        if doc["title"] in state["fail_analysis"]:
+            return None
+        return dict(doc, analysis={"summary": doc["title"]})
+
+    def score(batch, topic):
+        if state["scoring_error"]:
+            raise state["scoring_error"]
+        with lock:
+            state["batches"].append([d["title"] for d in batch])
+        return [dict(d, scoring={"score": 5}) for d in batch]
+
+    async def discover_async(decomposition, topic):
+        for doc in discover(decomposition, topic):
+            yield doc
+
+    async def analyze_async(doc, topic):
+        return analyze(doc, topic)
+
+    async def score_async(batch, topic):
+        return score(batch, topic)
+
+    monkeypatch.setattr(sp, "discover_documents", discover)
+    monkeypatch.setattr(sp, "analyze_single_document", analyze)
+    monkeypatch.setattr(sp, "score_documents", score)
+    monkeypatch.setattr(sp, "discover_documents_async", discover_async)
+    monkeypatch.setattr(sp, "analyze_single_document_async", analyze_async)
+    monkeypatch.setattr(sp, "score_documents_async", score_async)
+    monkeypatch.setattr(sp, "SCORING_BATCH_SIZE", 3)
+    monkeypatch.setattr(sp, "STREAM_SCORE_WAIT", 0.2)
+    return state
+
+
+def titles(docs):
+    return sorted(d["title"] for d in docs)
+
+
+def test_every_document_is_analysed_and_scored_in_micro_batches(pipeline):
+    stages = []
+    analyzed, scored = sp.stream_discover_analyze_score(DECOMPOSITION, "topic", on_stage=stages.append)
+
+    assert titles(analyzed) == titles(pipeline["docs"])
+    assert titles(scored) == titles(pipeline["docs"])
+    assert all(len(batch) <= 3 for batch in pipeline["batches"])
+    assert sorted(t for batch in pipeline["batches"] for t in batch) == titles(pipeline["docs"])
+    assert stages == ["2", "3", "4"]
+
+
+def test_documents_whose_analysis_failed_are_not_scored(pipeline):
+    pipeline["fail_analysis"] = {"Doc 2", "Doc 5"}
+    analyzed, scored = sp.stream_discover_analyze_score(DECOMPOSITION, "topic")
+    assert len(analyzed) == len(scored) == 5
+    assert "Doc 2" not in titles(scored)
+
+
+def test_invalid_decomposition_returns_empty(pipeline):
+    assert sp.stream_discover_analyze_score({}, "topic") == ([], [])
+
+
+def test_scoring_error_is_raised_not_swallowed(pipeline):
+    pipeline["scoring_error"] = RuntimeError("scoring broke")
+    with pytest.raises(RuntimeError, match="scoring broke"):
+        sp.stream_discover_analyze_score(DECOMPOSITION, "topic")
+
+
+def test_discovery_error_is_raised_without_hanging(pipeline):
+    pipeline["discovery_error"] = ConnectionError("search down")
+    start = time.time()
+    with pytest.raises(ConnectionError):
+        sp.stream_discover_analyze_score(DECOMPOSITION, "topic")
+    assert time.time() - start < 5
+
+
+def test_async_pipeline_matches_sync(pipeline):
+    stages = []
+    analyzed, scored = asyncio.run(
+        sp.stream_discover_analyze_score_async(DECOMPOSITION, "topic", on_stage=stages.append)
+    )
+    assert titles(scored) == titles(pipeline["docs"])
+    assert all(len(batch) <= 3 for batch in pipeline["batches"])
+    assert stages == ["2", "3", "4"]
+
+
+def test_async_errors_are_raised(pipeline):
+    pipeline["scoring_error"] = RuntimeError("scoring broke")
+    with pytest.raises(RuntimeError, match="scoring broke"):
+        asyncio.run(sp.stream_discover_analyze_score_async(DECOMPOSITION, "topic"))
+
+    pipeline["scoring_error"] = None
+    pipeline["discovery_error"] = ConnectionError("search down")
+    with pytest.raises(ConnectionError):
+        asyncio.run(sp.stream_discover_analyze_score_async(DECOMPOSITION, "topic"))
@@ -0,0 +1,62 @@
+import utils.token_budget as token_budget
+from utils.token_budget import PromptBudget, fit_prompt, input_limit, count_tokens, TRIM_MARKER
+
+
+def test_fit_prompt_leaves_fitting_prompts_alone():
+    prompt = "Instructions.\n" + "body " * 100 + "\nOutput format."
+    assert fit_prompt(prompt, "ollama") == prompt
+
+
+def test_fit_prompt_keeps_head_and_tail_of_oversize_prompt():
+    prompt = "INSTRUCTIONS " + "b" * 200000 + " OUTPUT FORMAT"
+    fitted = fit_prompt(prompt, "ollama")
+    assert count_tokens(fitted, "ollama") <= input_limit("ollama") + 1
+    assert fitted.startswith("INSTRUCTIONS ")
+    assert fitted.endswith(" OUTPUT FORMAT")
+    assert TRIM_MARKER in fitted
+
+
+def test_input_limit_is_capped_by_provider_tpm():
+    # Groq and Anthropic accept fewer tokens per minute than their context windows hold
+    assert input_limit("groq") < 12000
+    assert input_limit("anthropic") < 40000
+    # No per-minute budget for local models: window minus the reply, with the safety margin
+    expected = int((token_budget.OLLAMA_NUM_CTX - token_budget.EXPECTED_OUTPUT_TOKENS) * token_budget.BUDGET_SAFETY)
+    assert input_limit("ollama") == expected
+
+
+def test_budget_returns_parts_unchanged_when_they_fit():
+    budget = PromptBudget("ollama")
+    assert budget.fit("template", [("a", 1), ("b", 0)]) == ["a", "b"]
+
+
+def test_budget_cuts_lowest_priority_first():
+    budget = PromptBudget("ollama")
+    half = int(budget.limit * 0.6 * 3.4)
+    feedback, references = budget.fit("", [("f" * half, 1), ("r" * half, 0)])
+    assert feedback == "f" * half
+    assert 0 < len(references) < half
+    assert budget.count(feedback) + budget.count(references) <= budget.limit + 1
+
+
+def test_budget_drops_low_priority_part_before_touching_the_next():
+    budget = PromptBudget("ollama")
+    big = "x" * int(budget.limit * 3.4 * 1.5)
+    kept, dropped = budget.fit("", [(big, 1), ("low " * 100, 0)])
+    assert dropped == ""
+    assert kept == big[:len(kept)]
+    assert budget.count(kept) <= budget.limit + 1
+
+
+def test_reserved_tokens_shrink_the_budget():
+    assert PromptBudget("ollama", reserved=600).limit == PromptBudget("ollama").limit - 600
+
+
+def test_max_chars_caps_content(monkeypatch):
+    monkeypatch.setattr(token_budget, "PROMPT_FULL_CONTEXT", False)
+    capped = PromptBudget("anthropic", max_chars=25000).fit_text("template", "p" * 200000)
+    assert 24000 < len(capped) <= 25000
+
+    monkeypatch.setattr(token_budget, "PROMPT_FULL_CONTEXT", True)
+    full = PromptBudget("anthropic", max_chars=25000).fit_text("template", "p" * 200000)
+    assert len(full) > 100000
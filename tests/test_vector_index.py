@@ -0,0 +1,71 @@
+import numpy as np
+from utils.vector_index import FlatIndex, IVFIndex
+
+
+def clustered(n, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    return centers[rng.integers(0, clusters, size=n)] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def test_exact_scan_below_threshold():
+    data = clustered(100)
+    ivf, flat = IVFIndex(train_threshold=1000), FlatIndex()
+    for i, vec in enumerate(data):
+        ivf.add(i, vec)
+        flat.add(i, vec)
+
+    assert ivf.partitions[32].centroids is None
+    for q in data[:10]:
+        assert [k for _, k in ivf.search(q, 3)] == [k for _, k in flat.search(q, 3)]
+
+
+def test_background_training_swaps_in_lists():
+    data = clustered(600)
+    ivf = IVFIndex(train_threshold=500)
+    for i, vec in enumerate(data):
+        ivf.add(i, vec)
+    ivf.wait_for_training()
+
+    part = ivf.partitions[32]
+    assert part.centroids is not None
+    assert part.flat is None
+    assert len(ivf) == part.count == 600
+    assert ivf.search(data[42], 1)[0][1] == 42
+
+
+def test_changes_made_during_training_are_replayed():
+    data = clustered(700)
+    ivf = IVFIndex(train_threshold=10**9)
+    for i, vec in enumerate(data[:500]):
+        ivf.add(i, vec)
+
+    part = ivf.partitions[32]
+    part.train(wait=False)
+    for i, vec in enumerate(data[500:], start=500):
+        ivf.add(i, vec)
+    for i in range(0, 100):
+        ivf.remove(i)
+    ivf.wait_for_training()
+
+    assert part.centroids is not None
+    assert part.count == 600
+    assert set(part.list_of) == set(range(100, 700))
+    top = [k for _, k in ivf.search(data[650], 1, nprobe=len(part.lists))]
+    assert top == [650]
+    assert all(k >= 100 for _, k in ivf.search(data[5], 5, nprobe=len(part.lists)))
+
+
+def test_recall_against_exact_scan():
+    data = clustered(3000, seed=1)
+    ivf, flat = IVFIndex(train_threshold=1000, background=False), FlatIndex()
+    for i, vec in enumerate(data):
+        ivf.add(i, vec)
+        flat.add(i, vec)
+
+    queries = data[np.random.default_rng(2).choice(len(data), 50, replace=False)]
+    hits = 0
+    for q in queries:
+        exact = {k for _, k in flat.search(q, 2)}
+        hits += len(exact & {k for _, k in ivf.search(q, 2, nprobe=4)})
+    assert hits / (2 * len(queries)) >= 0.9
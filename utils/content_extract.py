@@ -0,0 +1,219 @@
+import re
+from bs4 import BeautifulSoup, NavigableString, Comment
+
+# Main-content extraction for HTML pages: drops navigation, banners, sidebars and footers so
+# only the article body reaches the analysis prompts. Pure CPU; runs inside the parse workers.
+
+MIN_CONTENT_CHARS = 250  # Less than this and the page is returned whole (parse_html)
+
+# Never content
+JUNK_TAGS = ["script", "style", "noscript", "iframe", "svg", "canvas", "form", "button", "select",
+             "template", "nav", "footer", "aside"]
+
+# class/id hints, as in Readability
+UNLIKELY_PATTERN = re.compile(
+    r"cookie|consent|banner|breadcrumb|combx|comment|community|disqus|menu|modal|nav|popup|promo|"
+    r"related|remark|share|shoutbox|sidebar|skip|social|sponsor|subscribe|newsletter|footer|masthead|"
+    r"advert|\bads?\b|pagination|toolbar|widget",
+    re.IGNORECASE,
+)
+LIKELY_PATTERN = re.compile(r"article|body|content|main|entry|post|paper|abstract|text|story", re.IGNORECASE)
+
+HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+TEXT_BLOCKS = {"p", "pre", "blockquote", "li", "dd", "dt", "figcaption", "caption"}
+# Tags that start a new line of output; anything else is inline and joins the running line
+BLOCK_LEVEL = HEADINGS | TEXT_BLOCKS | {
+    "div", "section", "article", "main", "header", "ul", "ol", "dl", "table", "thead", "tbody",
+    "tfoot", "tr", "td", "th", "figure", "hr", "br", "address", "details", "summary",
+}
+PROTECTED = {"html", "body", "article", "main"}
+
+
+def _collapse(text):
+    return " ".join(text.split())
+
+
+def _text_length(node):
+    return len(_collapse(node.get_text()))
+
+
+def link_density(node):
+    """
+    Share of a node's text that sits inside links: near 1 for menus, near 0 for prose.
+    """
+    length = _text_length(node)
+    if not length:
+        return 0.0
+    linked = sum(_text_length(a) for a in node.find_all("a"))
+    return min(linked / length, 1.0)
+
+
+def _strip_boilerplate(soup):
+    for tag in soup(JUNK_TAGS):
+        tag.decompose()
+    for comment in soup.find_all(string=lambda s: isinstance(s, Comment)):
+        comment.extract()
+    for br in soup.find_all("br"):
+        br.replace_with(" ")
+
+    unlikely = []
+    for node in soup.find_all(True):
+        if node.name in PROTECTED or node.attrs is None:
+            continue
+        hints = " ".join(node.get("class") or []) + " " + (node.get("id") or "")
+        if UNLIKELY_PATTERN.search(hints) and not LIKELY_PATTERN.search(hints):
+            unlikely.append(node)
+    for node in unlikely:
+        if node.parent is not None:  # Not already removed with an ancestor
+            node.decompose()
+
+
+def _score_candidates(soup):
+    """
+    Readability-style scoring: every paragraph-like block adds points for its length and commas
+    to its parent (and half to its grandparent); each container is then discounted by its link
+    density. Returns [(score, node)] best first.
+    """
+    scores = {}
+    nodes = {}
+    for block in soup.find_all(["p", "pre", "td", "blockquote"]):
+        length = _text_length(block)
+        if length < 25:
+            continue
+        points = 1 + block.get_text().count(",") + min(length // 100, 3)
+        parent = block.parent
+        for ancestor, share in ((parent, 1.0), (parent.parent if parent else None, 0.5)):
+            if ancestor is None or ancestor.name is None or ancestor.name == "[document]":
+                continue
+            key = id(ancestor)
+            if key not in nodes:
+                nodes[key] = ancestor
+                bonus = 5 if ancestor.name in ("article", "main") else 0
+                hints = " ".join(ancestor.get("class") or []) + " " + (ancestor.get("id") or "")
+                if LIKELY_PATTERN.search(hints):
+                    bonus += 5
+                scores[key] = bonus
+            scores[key] += points * share
+
+    ranked = [(score * (1 - link_density(nodes[key])), nodes[key]) for key, score in scores.items()]
+    ranked.sort(key=lambda pair: pair[0], reverse=True)
+    return ranked
+
+
+def _content_nodes(ranked):
+    """
+    The top candidate plus siblings that look like part of the same article
+    (a lead paragraph or a continuation block split out by the page layout).
+    """
+    top_score, top = ranked[0]
+    parent = top.parent
+    if parent is None or parent.name == "[document]":
+        return [top]
+
+    threshold = max(10, top_score * 0.2)
+    sibling_scores = dict((id(node), score) for score, node in ranked)
+    selected = []
+    for sibling in parent.find_all(True, recursive=False):
+        if sibling is top:
+            selected.append(sibling)
+            continue
+        if sibling_scores.get(id(sibling), 0) >= threshold:
+            selected.append(sibling)
+        elif sibling.name == "p":
+            length = _text_length(sibling)
+            density = link_density(sibling)
+            if (length > 80 and density < 0.25) or (0 < length <= 80 and density == 0 and "." in sibling.get_text()):
+                selected.append(sibling)
+    return selected
+
+
+def _table_rows(table):
+    rows = []
+    for tr in table.find_all("tr"):
+        cells = [_collapse(cell.get_text()) for cell in tr.find_all(["td", "th"], recursive=False)]
+        cells = [c for c in cells if c]
+        if cells:
+            rows.append(" | ".join(cells))
+    return rows
+
+
+def _is_layout_table(table):
+    return table.find(["table", "p", "ul", "ol", "div"] + sorted(HEADINGS)) is not None
+
+
+def _render(node, lines):
+    """
+    Appends the readable lines under node in document order: headings and data tables are
+    always kept, link-heavy blocks (menus, tag clouds) are dropped, inline runs are joined.
+    """
+    inline = []
+
+    def flush():
+        text = _collapse("".join(inline))
+        if text:
+            lines.append(text)
+        inline.clear()
+
+    for child in node.children:
+        if isinstance(child, NavigableString):
+            if not isinstance(child, Comment):
+                inline.append(str(child))
+            continue
+        name = child.name
+        if name not in BLOCK_LEVEL and child.find(sorted(BLOCK_LEVEL)) is None:
+            inline.append(child.get_text())
+            continue
+
+        flush()
+        if name in HEADINGS:
+            text = _collapse(child.get_text())
+            if text:
+                lines.append(text)
+        elif name == "table" and not _is_layout_table(child):
+            lines.extend(_table_rows(child))
+        elif name == "pre":
+            text = child.get_text().strip()
+            if text:
+                lines.append(text)
+        elif name in TEXT_BLOCKS and child.find(["p", "div", "ul", "ol", "table"]) is None:
+            text = _collapse(child.get_text())
+            if text and link_density(child) < 0.5:
+                lines.append(text)
+        elif name in ("ul", "ol", "dl") and link_density(child) > 0.5:
+            continue
+        elif link_density(child) > 0.5 and _text_length(child) < 400:
+            continue
+        else:
+            _render(child, lines)
+    flush()
+
+
+def extract_main_content(content):
+    """
+    Returns the article text of an HTML page, one block per line, or "" when no block
+    of prose stands out (the caller then falls back to the whole page).
+    """
+    soup = BeautifulSoup(content, "html.parser")
+    title = soup.find("h1")
+    title_text = _collapse(title.get_text()) if title else ""
+
+    _strip_boilerplate(soup)
+    ranked = _score_candidates(soup)
+    if not ranked:
+        return ""
+
+    lines = []
+    for node in _content_nodes(ranked):
+        if node.name in HEADINGS:
+            lines.append(_collapse(node.get_text()))
+        elif node.name == "table" and not _is_layout_table(node):
+            lines.extend(_table_rows(node))
+        else:
+            _render(node, lines)
+
+    # The page title often sits in a header outside the article container
+    if title_text and title_text not in lines:
+        lines.insert(0, title_text)
+
+    text = "\n".join(line for line in lines if line)
+    return text if len(text) >= MIN_CONTENT_CHARS else ""
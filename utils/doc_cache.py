@@ -0,0 +1,170 @@
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+DOC_CACHE_ENABLED = os.getenv("DOC_CACHE_ENABLED", "True").lower() == "true"
+DOC_CACHE_FILE = os.getenv("DOC_CACHE_FILE", "doc_cache.db")
+DOC_CACHE_FRESH = int(os.getenv("DOC_CACHE_FRESH", 24 * 3600))                  # Served without revalidating
+DOC_CACHE_MAX_BYTES = int(os.getenv("DOC_CACHE_MAX_BYTES", 256 * 1024 * 1024))  # Compressed size, LRU above this
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+class DocumentCache:
+    """
+    On-disk cache of parsed document text, zlib-compressed, keyed by URL.
+    Entries younger than `fresh` seconds are served as-is; older ones carry their ETag /
+    Last-Modified so the caller can revalidate with a conditional GET. The hash of the
+    downloaded bytes is stored too, so identical content (re-fetched or mirrored under
+    another URL) is never parsed twice.
+    """
+
+    def __init__(self, cache_file=DOC_CACHE_FILE, fresh=DOC_CACHE_FRESH, max_bytes=DOC_CACHE_MAX_BYTES):
+        self.cache_file = cache_file
+        self.fresh = fresh
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.revalidated = 0
+        self.hash_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = sqlite3.connect(cache_file, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    url TEXT PRIMARY KEY,
+                    content_hash TEXT,
+                    text BLOB,
+                    size INTEGER,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL,
+                    accessed_at REAL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents (content_hash)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_accessed ON documents (accessed_at)")
+            self._conn.commit()
+
+    def lookup(self, url):
+        """
+        Returns {'text', 'fresh', 'etag', 'last_modified'} for a cached URL, or None.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, etag, last_modified, fetched_at FROM documents WHERE url = ?", (url,)
+            ).fetchone()
+            if not row:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE documents SET accessed_at = ? WHERE url = ?", (now, url))
+            self._conn.commit()
+
+        blob, etag, last_modified, fetched_at = row
+        fresh = now - fetched_at < self.fresh
+        if fresh:
+            self.hits += 1
+        return {
+            "text": zlib.decompress(blob).decode("utf-8"),
+            "fresh": fresh,
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def mark_revalidated(self, url):
+        # 304 Not Modified: the cached text is good for another `fresh` window
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE documents SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+            self._conn.commit()
+            self.revalidated += 1
+
+    def text_for_hash(self, digest):
+        """
+        Parsed text of any cached document with these exact bytes, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM documents WHERE content_hash = ? LIMIT 1", (digest,)
+            ).fetchone()
+        if not row:
+            return None
+        self.hash_hits += 1
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def put(self, url, digest, text, etag=None, last_modified=None):
+        if not text:
+            return
+        blob = zlib.compress(text.encode("utf-8"), 6)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (url, content_hash, text, size, etag, last_modified, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, digest, blob, len(blob), etag, last_modified, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Caller holds self._lock
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        freed = 0
+        victims = []
+        for url, size in self._conn.execute("SELECT url, size FROM documents ORDER BY accessed_at ASC"):
+            if total - freed <= self.max_bytes:
+                break
+            victims.append((url,))
+            freed += size
+
+        self._conn.executemany("DELETE FROM documents WHERE url = ?", victims)
+        self.evictions += len(victims)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents"
+            ).fetchone()
+        return {
+            "entries": entries,
+            "bytes": total,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "hash_hits": self.hash_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+doc_cache = DocumentCache() if DOC_CACHE_ENABLED else None
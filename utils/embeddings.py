@@ -0,0 +1,123 @@
+import os
+import time
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Configuration
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", 4096))            # Max cached vectors (LRU)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 32))              # Max texts per provider call
+EMBED_BATCH_WINDOW = float(os.getenv("EMBED_BATCH_WINDOW_MS", 15)) / 1000  # Wait for more requests
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of embeddings keyed by a hash of (namespace, text).
+    The namespace should identify the embedding model so vectors from different
+    providers (which have different dimensions) never mix.
+    """
+
+    def __init__(self, max_entries=EMBED_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(namespace, text):
+        return hashlib.sha256(f"{namespace}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            emb = self._data.get(key)
+            if emb is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return emb
+
+    def put(self, key, embedding):
+        if embedding is None:
+            return
+        with self._lock:
+            self._data[key] = embedding
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def stats(self):
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class EmbeddingBatcher:
+    """
+    Gathers embedding requests from concurrent threads into one provider call.
+
+    `embed(text)` blocks the caller until its vector is ready. A single worker thread takes
+    the first pending request, waits up to `window` seconds for more (up to `max_batch`),
+    de-duplicates the texts and hands them to `batch_fn(texts)`, which returns one result per
+    text (a vector, or whatever the caller wants handed back with it).
+    """
+
+    def __init__(self, batch_fn, max_batch=EMBED_BATCH_SIZE, window=EMBED_BATCH_WINDOW):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.window = window
+        self._pending = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+
+    def _ensure_worker(self):
+        if self._worker and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if not (self._worker and self._worker.is_alive()):
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def embed(self, text):
+        self._ensure_worker()
+        fut = Future()
+        self._pending.put((text, fut))
+        return fut.result()
+
+    def _run(self):
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = self.batch_fn(texts)
+                by_text = dict(zip(texts, vectors))
+                for text, fut in batch:
+                    fut.set_result(by_text.get(text))
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+            self.batches += 1
+            self.requests += len(batch)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch": round(self.requests / self.batches, 2) if self.batches else 0,
+            "pending": self._pending.qsize(),
+        }
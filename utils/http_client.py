@@ -0,0 +1,159 @@
+import os
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- Configuration ---
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 32))               # Keep-alive connections kept per host
+HTTP_PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", 4))      # Simultaneous requests to one host
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 15))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 2))            # Retries on 429/503
+HTTP_MAX_RETRY_WAIT = float(os.getenv("HTTP_MAX_RETRY_WAIT", 30))   # Longer Retry-After: give up on the URL
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+RETRY_STATUSES = (429, 503)
+
+
+def parse_retry_after(response):
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None.
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """
+    Process-wide HTTP layer: one keep-alive connection pool shared by every thread,
+    a cap on concurrent requests per host, and Retry-After aware retries on 429/503.
+    A host that asked us to back off is paused for every caller, not just the one that got the 429.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, per_host=HTTP_PER_HOST_LIMIT,
+                 timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), max_retries=HTTP_MAX_RETRIES):
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        # urllib3 pools are thread-safe; the cookie jar is lock-protected
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({'User-Agent': USER_AGENT})
+
+        self._lock = threading.Lock()
+        self._host_slots = {}
+        self._host_paused_until = {}
+        self._host_requests = {}
+
+        self.requests = 0
+        self.active = 0
+        self.retries = 0
+        self.errors = 0
+        self.slot_wait_seconds = 0.0
+
+    def _slot(self, host):
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            self._host_requests[host] = self._host_requests.get(host, 0) + 1
+            return slot
+
+    def _wait_for_host(self, host):
+        delay = self._host_paused_until.get(host, 0) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _pause_host(self, host, seconds):
+        with self._lock:
+            until = time.time() + seconds
+            if until > self._host_paused_until.get(host, 0):
+                self._host_paused_until[host] = until
+
+    def get(self, url, consume=None, **kwargs):
+        """
+        requests.get through the shared pool. Returns the last response; raises on transport errors.
+        With `consume`, the body is streamed and consume(response) runs while the host slot is
+        still held (so body transfer counts against the per-host limit); its result is returned
+        and the response is closed.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if consume is not None:
+            kwargs['stream'] = True
+        host = urlsplit(url).netloc.lower()
+        slot = self._slot(host)
+
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_host(host)
+
+            start = time.time()
+            with slot:
+                waited = time.time() - start
+                with self._lock:
+                    self.requests += 1
+                    self.active += 1
+                    self.slot_wait_seconds += waited
+                try:
+                    response = self.session.get(url, **kwargs)
+                    final = response.status_code not in RETRY_STATUSES or attempt == self.max_retries
+                    wait = None if final else parse_retry_after(response)
+                    if wait is None and not final:
+                        wait = 2 ** attempt
+                    if not final and wait > HTTP_MAX_RETRY_WAIT:
+                        final = True
+                    if final and consume is not None:
+                        try:
+                            return consume(response)
+                        finally:
+                            response.close()
+                except Exception:
+                    with self._lock:
+                        self.errors += 1
+                    raise
+                finally:
+                    with self._lock:
+                        self.active -= 1
+
+            if final:
+                return response
+
+            print(f"  [HTTP] {host} returned {response.status_code}. Retrying in {wait:.1f}s...")
+            response.close()
+            self._pause_host(host, wait)
+            with self._lock:
+                self.retries += 1
+        return response
+
+    def stats(self):
+        with self._lock:
+            busiest = sorted(self._host_requests.items(), key=lambda kv: kv[1], reverse=True)[:10]
+            now = time.time()
+            return {
+                "requests": self.requests,
+                "active": self.active,
+                "retries": self.retries,
+                "errors": self.errors,
+                "slot_wait_seconds": round(self.slot_wait_seconds, 2),
+                "hosts": len(self._host_slots),
+                "paused_hosts": sum(1 for until in self._host_paused_until.values() if until > now),
+                "open_pools": len(self.session.get_adapter("https://").poolmanager.pools),
+                "top_hosts": dict(busiest),
+            }
+
+
+http_client = HttpClient()
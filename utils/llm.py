@@ -1,7 +1,10 @@
 
 import os
 import time
+import threading
 import warnings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 # Suppress the deprecation warning
 warnings.filterwarnings("ignore", category=FutureWarning, module="google.generativeai")
 import google.generativeai as genai
@@ -9,6 +12,9 @@ from groq import Groq
 from anthropic import Anthropic, NotFoundError
 from dotenv import load_dotenv
 from utils.llm_offline import query_offline_llm
+from utils.provider_health import provider_health, LATENCY_WINDOW
+from utils.rate_limit import get_limiter, estimate_tokens, EXPECTED_OUTPUT_TOKENS
+from utils.token_budget import PromptBudget, context_window, input_limit, fit_prompt, output_tokens_for
 
 load_dotenv()
 
@@ -17,11 +23,22 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 
+# Hedged requests (opt-in): stages listed here race a backup provider when the first is slow
+HEDGE_STAGES = {s.strip() for s in os.getenv("LLM_HEDGE_STAGES", "").split(",") if s.strip()}
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))   # Backup fires after this latency percentile
+HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", 4.0)) # Used until we have latency samples
+HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 0.5))
+HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", 20.0))
+
 # Import Memory System
 from utils.memory import MemorySystem
 # Initialize Memory System
 memory_system = MemorySystem()
 
+# Response Cache (persistent, with single-flight for concurrent identical prompts)
+from utils.llm_cache import LLMResponseCache, LLM_CACHE_ENABLED
+llm_cache = LLMResponseCache() if LLM_CACHE_ENABLED else None
+
 # Initialize Clients
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
@@ -31,7 +48,7 @@ anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY) if ANTHROPIC_API_KEY els
 
 # --- Internal Callers ---
 
-def _call_gemini(prompt):
+def _call_gemini(prompt, on_token=None):
     if not GEMINI_API_KEY:
         raise ValueError("GEMINI_API_KEY not found.")
     
@@ -43,12 +60,26 @@ def _call_gemini(prompt):
     max_retries = 3 
     base_delay = 2
     
+    limiter = get_limiter("gemini")
+    reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+    
     for attempt in range(max_retries):
         try:
-            response = model.generate_content(prompt)
-            if not response.text:
+            limiter.acquire(reserved)
+            response = model.generate_content(prompt, stream=on_token is not None)
+            if on_token is not None:
+                parts = []
+                for chunk in response:
+                    parts.append(chunk.text)
+                    on_token(chunk.text)
+                text = "".join(parts)
+            else:
+                text = response.text
+            usage = getattr(response, 'usage_metadata', None)
+            limiter.settle(reserved, getattr(usage, 'total_token_count', None))
+            if not text:
                 raise ValueError("Gemini returned empty response.")
-            return response.text
+            return text
         except Exception as e:
             error_msg = str(e)
             if "400" in error_msg:
@@ -64,50 +95,93 @@ def _call_gemini(prompt):
                     continue
             raise e  # smooth failover to next model if retries exhausted or other error
 
-def _call_groq(prompt):
+def _call_groq(prompt, on_token=None):
     if not groq_client:
         raise ValueError("GROQ_API_KEY not found or client init failed.")
     
+    # Shared RPM/TPM budget so concurrent stages don't trip Groq's 429s
+    limiter = get_limiter("groq")
+    reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+    limiter.acquire(reserved)
+    
     # Updated to llama-3.3-70b-versatile
-    try:
-        chat_completion = groq_client.chat.completions.create(
+    if on_token is not None:
+        stream = groq_client.chat.completions.create(
             messages=[{"role": "user", "content": prompt}],
             model="llama-3.3-70b-versatile",
+            stream=True,
         )
-        return chat_completion.choices[0].message.content
-    except Exception as e:
-        if "429" in str(e): # Rate limit
-             # For Groq free tier, limits can be long (minutes). 
-             # Better to failover immediately unless it's very short, 
-             # but we can try a short sleep just in case.
-             time.sleep(2) 
-        raise e
-
-def _call_anthropic(prompt):
+        parts = []
+        usage = None
+        try:
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    on_token(delta)
+                # Groq reports usage on the final chunk
+                usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None) or usage
+        except Exception:
+            # Cut off before the usage chunk: charge what was sent and received so far
+            limiter.settle(reserved, estimate_tokens(prompt) + estimate_tokens("".join(parts)))
+            raise
+        limiter.settle(reserved, getattr(usage, 'total_tokens', None))
+        return "".join(parts)
+    
+    chat_completion = groq_client.chat.completions.create(
+        messages=[{"role": "user", "content": prompt}],
+        model="llama-3.3-70b-versatile",
+    )
+    usage = getattr(chat_completion, 'usage', None)
+    limiter.settle(reserved, getattr(usage, 'total_tokens', None))
+    return chat_completion.choices[0].message.content
+
+def _anthropic_usage(message):
+    usage = getattr(message, 'usage', None)
+    if not usage:
+        return None
+    return usage.input_tokens + usage.output_tokens
+
+def _anthropic_message(model, prompt, on_token=None):
+    """
+    Sends one Messages request, streaming text deltas to on_token when given.
+    """
+    if on_token is None:
+        return anthropic_client.messages.create(
+            max_tokens=4096,
+            messages=[{"role": "user", "content": prompt}],
+            model=model,
+        )
+    with anthropic_client.messages.stream(
+        max_tokens=4096,
+        messages=[{"role": "user", "content": prompt}],
+        model=model,
+    ) as stream:
+        for text in stream.text_stream:
+            on_token(text)
+        return stream.get_final_message()
+
+def _call_anthropic(prompt, on_token=None):
     if not anthropic_client:
         raise ValueError("ANTHROPIC_API_KEY not found or client init failed.")
     
     # Updated: Try Claude 3.5 Sonnet (June version) then Haiku (most widely available)
     model_id = "claude-3-5-sonnet-20240620" 
     
+    limiter = get_limiter("anthropic")
+    reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+    limiter.acquire(reserved)
+    
     try:
-        message = anthropic_client.messages.create(
-            max_tokens=4096,
-            messages=[{"role": "user", "content": prompt}],
-            model=model_id, 
-        )
-        return message.content[0].text
+        message = _anthropic_message(model_id, prompt, on_token)
     except NotFoundError:
-        # Fallback to Haiku which is usually available to all tiers
-        try:
-            message = anthropic_client.messages.create(
-                max_tokens=4096,
-                messages=[{"role": "user", "content": prompt}],
-                model="claude-3-haiku-20240307", 
-            )
-            return message.content[0].text
-        except Exception as e:
-            raise e
+        # Fallback to Haiku which is usually available to all tiers.
+        # The 404 used no tokens: refund them so the retry is only charged once
+        limiter.settle(reserved, 0)
+        limiter.acquire(reserved)
+        message = _anthropic_message("claude-3-haiku-20240307", prompt, on_token)
+    limiter.settle(reserved, _anthropic_usage(message))
+    return message.content[0].text
 
 # --- Main Logic ---
 
@@ -143,87 +217,384 @@ STAGE_CONFIG = {
     "review": ["anthropic", "groq", "ollama:deepseek-r1", "ollama:qwen2.5", "ollama:llama3.2", "ollama:gemma2", "ollama:mistral"]
 }
 
-def _resolve_strategy(model_id):
+def stage_context_window(stage):
+    """
+    Smallest context window in the stage's chain: a prompt that fits it survives any failover.
+    """
+    return min(context_window(m) for m in STAGE_CONFIG.get(stage, STAGE_CONFIG['default']))
+
+def stage_budget(stage, max_chars=None, failover_safe=False):
+    """
+    Token budget for a stage prompt, sized for the stage's primary model with room left for
+    the reply and the memory context _run_stage injects, and capped at `max_chars` of content.
+    A failover to a smaller model is covered by fit_prompt() at call time, which cuts blindly;
+    failover_safe sizes for the smallest model in the chain so that cut never happens.
+    """
+    policy = get_memory_policy(stage)
+    reserved = policy['max_tokens'] if policy['enabled'] else 0
+    chain = STAGE_CONFIG.get(stage, STAGE_CONFIG['default'])
+    model_id = chain[0]
+    if failover_safe:
+        model_id = min(chain, key=lambda m: input_limit(m, output_tokens_for(stage)))
+    return PromptBudget(model_id, output_tokens_for(stage), reserved=reserved, max_chars=max_chars)
+
+# --- Memory Retrieval Policy ---
+
+# Per-stage control over memory injection. Keys missing from a stage fall back to "default".
+# - enabled:    retrieve and inject past interactions into the prompt
+# - record:     save this stage's prompt/response as a new memory
+# - partitions: stages whose memories are searched (None = all partitions)
+# - top_k / threshold: number of hits and minimum cosine similarity
+# - max_tokens: cap on injected context size
+MEMORY_POLICY = {
+    "default": {"enabled": True, "record": True, "partitions": None, "top_k": 2, "threshold": 0.4, "max_tokens": 800},
+    
+    "topic": {"partitions": ["topic"], "top_k": 1, "threshold": 0.6, "max_tokens": 400},
+    
+    # Query rewriting only needs the query itself
+    "discovery": {"enabled": False, "record": False},
+    
+    "analysis": {"partitions": ["analysis"], "top_k": 2, "threshold": 0.5, "max_tokens": 600},
+    
+    # High volume, strict format: extra tokens only add latency
+    "scoring": {"enabled": False, "record": False},
+    
+    "synthesis": {"partitions": ["analysis", "synthesis"], "top_k": 3, "max_tokens": 1200},
+    "generation": {"partitions": ["synthesis", "generation", "review"], "top_k": 2, "max_tokens": 1200},
+    "review": {"partitions": ["review"], "top_k": 1, "threshold": 0.5, "max_tokens": 600}
+}
+
+def get_memory_policy(stage):
+    policy = dict(MEMORY_POLICY['default'])
+    policy.update(MEMORY_POLICY.get(stage, {}))
+    return policy
+
+class TokenStream:
+    """
+    Token callback for a streaming query. Failover restarts the answer on another provider,
+    so partial output already sent is retracted through on_reset before the next attempt.
+    """
+
+    def __init__(self, on_token, on_reset=None):
+        self.on_token = on_token
+        self.on_reset = on_reset
+        self.emitted = False
+
+    def __call__(self, text):
+        if text:
+            self.emitted = True
+            self.on_token(text)
+
+    def restart(self):
+        if self.emitted and self.on_reset:
+            self.on_reset()
+        self.emitted = False
+
+def _resolve_strategy(model_id, stream=None, output_tokens=EXPECTED_OUTPUT_TOKENS):
     """
     Returns a callable (function) for a given model_id string.
+    The model_id is attached to the callable so the router can track provider health.
+    With a TokenStream the provider is called in streaming mode.
+    Prompts are trimmed to the model's input limit before they are sent.
     """
     if model_id == 'groq':
-        return lambda p: _call_groq(p)
+        call = lambda p: _call_groq(p, on_token=stream)
     elif model_id == 'anthropic':
-        return lambda p: _call_anthropic(p)
+        call = lambda p: _call_anthropic(p, on_token=stream)
     elif model_id == 'gemini':
-         return lambda p: _call_gemini(p)
+        call = lambda p: _call_gemini(p, on_token=stream)
     elif model_id.startswith('ollama:'):
         # Specific offline/cloud model
         model_name = model_id.split(':', 1)[1]
-        return lambda p: query_offline_llm(p, model_name=model_name)
+        call = lambda p: query_offline_llm(p, model_name=model_name, on_token=stream)
     else:
         # Default to offline if unknown
-        return lambda p: query_offline_llm(p)
+        call = lambda p: query_offline_llm(p, on_token=stream)
+    
+    def func(p):
+        if stream is not None:
+            stream.restart()
+        return call(fit_prompt(p, model_id, output_tokens))
+    func.model_id = model_id
+    return func
 
-def execute_strategies(strategies, prompt):
+def _call_with_breaker(func, prompt):
+    """
+    Runs one strategy and reports the outcome to its provider's circuit breaker.
+    """
+    breaker = provider_health.get(getattr(func, 'model_id', 'unknown'))
+    start = time.time()
+    try:
+        response = func(prompt)
+    except Exception as e:
+        breaker.record_failure(e)
+        raise
+    breaker.record_success(time.time() - start)
+    return response
+
+def execute_strategies(strategies, prompt, stream=None):
     """
     Executes a list of strategy functions in order.
+    Providers whose circuit breaker is open are skipped without being called.
+    `stream` is the TokenStream the strategies were resolved with, if any.
     """
+    from termcolor import colored
+    
     errors = []
+    skipped = []
     for i, func in enumerate(strategies):
+        model_id = getattr(func, 'model_id', 'unknown')
+        breaker = provider_health.get(model_id)
+        if not breaker.allow():
+            skipped.append(func)
+            continue
+        
         try:
              # print(f"  [Strategy {i+1}] Executing...") 
-             return func(prompt)
+             return _call_with_breaker(func, prompt)
         except Exception as e:
-            errors.append(str(e))
-            from termcolor import colored
+            errors.append(f"{model_id}: {e}")
             
             error_msg = str(e)
             if "429" in error_msg or "Rate limit" in error_msg:
-                print(colored(f"  [Limit] Strategy {i+1} ({func.__name__ if hasattr(func, '__name__') else 'Unknown'}) rate limited. Switching...", "yellow"))
+                print(colored(f"  [Limit] Strategy {i+1} ({model_id}) rate limited. Circuit open for {breaker.retry_in():.0f}s. Switching...", "yellow"))
             elif "not found" in error_msg.lower():
-                 print(colored(f"  [Config] Strategy {i+1} Key not found/Model missing. Switching...", "yellow"))
+                 print(colored(f"  [Config] Strategy {i+1} ({model_id}) Key not found/Model missing. Switching...", "yellow"))
             else:
-                print(colored(f"  [Error] Strategy {i+1} failed: {error_msg[:200]}...", "red"))
+                print(colored(f"  [Error] Strategy {i+1} ({model_id}) failed: {error_msg[:200]}...", "red"))
                 
             continue
+    
+    # Every provider was skipped: try the one whose cooldown ends soonest rather than failing outright
+    if skipped and not errors:
+        func = min(skipped, key=lambda f: provider_health.get(f.model_id).retry_in())
+        print(colored(f"  [Router] All providers cooling down. Trying {func.model_id} anyway...", "yellow"))
+        try:
+            return _call_with_breaker(func, prompt)
+        except Exception as e:
+            errors.append(f"{func.model_id}: {e}")
             
     # Fallback to generic offline if enabled and not already tried
     enable_offline = os.getenv("ENABLE_OFFLINE_FALLBACK", "True").lower() == "true"
     if enable_offline:
         try:
-            return query_offline_llm(prompt)
+            if stream is not None:
+                stream.restart()
+            return query_offline_llm(fit_prompt(prompt, 'ollama'), on_token=stream)
         except Exception as e:
             errors.append(f"Offline Default: {e}")
             
     raise Exception(f"All strategies failed. Errors: {errors}")
 
-def query_stage(stage, prompt):
+# --- Hedged Execution ---
+
+_hedge_pool = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HEDGE_WORKERS", 16)), thread_name_prefix="llm-hedge")
+_hedge_lock = threading.Lock()
+hedge_stats = {"hedged_calls": 0, "hedges_launched": 0, "backup_wins": 0, "wasted_calls": 0}
+# Recent latencies per (stage, model_id): a provider answers a scoring prompt far faster than a
+# review, so a delay pooled across stages would hedge one too early and the other too late
+_stage_latencies = {}
+
+def _bump_hedge_stat(name):
+    with _hedge_lock:
+        hedge_stats[name] += 1
+
+def _record_stage_latency(stage, model_id, latency):
+    with _hedge_lock:
+        samples = _stage_latencies.get((stage, model_id))
+        if samples is None:
+            samples = _stage_latencies[(stage, model_id)] = deque(maxlen=LATENCY_WINDOW)
+        samples.append(latency)
+
+def _percentile(ordered, pct):
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+def _stage_latency_percentile(stage, model_id, pct):
+    with _hedge_lock:
+        samples = _stage_latencies.get((stage, model_id))
+        if not samples:
+            return None
+        ordered = sorted(samples)
+    return _percentile(ordered, pct)
+
+def _hedge_delay(stage, model_id):
     """
-    Primary Entry Point for Stage-based LLM routing.
+    Seconds to wait on the primary before launching the backup: its recent p95 latency on this stage.
     """
-    # Get config for stage, or default
-    model_chain = STAGE_CONFIG.get(stage, STAGE_CONFIG['default'])
+    delay = _stage_latency_percentile(stage, model_id, HEDGE_PERCENTILE)
+    if delay is None:
+        delay = HEDGE_DEFAULT_DELAY
+    return min(max(delay, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+def _hedge_call(stage, func, prompt, started):
+    # Runs on _hedge_pool; `started` tells the caller the request has left the pool's queue
+    started.set()
+    start = time.time()
+    response = _call_with_breaker(func, prompt)
+    _record_stage_latency(stage, func.model_id, time.time() - start)
+    return response
+
+def execute_hedged(strategies, prompt, stage='default'):
+    """
+    Sends the prompt to the first available provider and, if it has not answered within
+    its p95 latency for this stage, races a backup request to the next provider in the chain.
+    The first successful answer wins; the other call is cancelled if it has not started,
+    otherwise its result is ignored (and counted as wasted).
+    Falls back to execute_strategies over the rest of the chain if both fail.
+    """
+    _bump_hedge_stat("hedged_calls")
     
-    # Resolve to functions
-    # Resolve to functions
-    strategies = [_resolve_strategy(m) for m in model_chain]
+    # Providers whose breaker refuses a call are passed over here but stay in the chain,
+    # so the fallback below still tries them once they recover
+    healthy = (func for func in strategies if provider_health.get(func.model_id).allow())
+    primary = next(healthy, None)
+    if primary is None:
+        return execute_strategies(strategies, prompt)
+    
+    started = threading.Event()
+    first = _hedge_pool.submit(_hedge_call, stage, primary, prompt, started)
+    futures = {first: primary}
+    # Time spent queued behind other hedged calls is not the provider being slow
+    while not started.wait(0.5) and not first.done():
+        pass
+    done, _ = wait(futures, timeout=_hedge_delay(stage, primary.model_id))
+    
+    if not done:
+        # Primary is slower than usual: launch the next healthy provider as a backup
+        backup = next(healthy, None)
+        if backup is not None:
+            print(f"  [Hedge] {primary.model_id} slow, racing {backup.model_id}...")
+            futures[_hedge_pool.submit(_hedge_call, stage, backup, prompt, threading.Event())] = backup
+            _bump_hedge_stat("hedges_launched")
+    
+    pending = set(futures)
+    errors = []
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is not None:
+                errors.append(f"{futures[fut].model_id}: {fut.exception()}")
+                continue
+            
+            if futures[fut] is not primary:
+                _bump_hedge_stat("backup_wins")
+            for loser in pending:
+                if loser.cancel():
+                    # Never ran: hand back the half-open trial slot allow() reserved for it
+                    provider_health.get(futures[loser].model_id).release()
+                else:
+                    # Already running: let it finish, but count a successful result as wasted
+                    loser.add_done_callback(
+                        lambda f: _bump_hedge_stat("wasted_calls") if not f.cancelled() and f.exception() is None else None
+                    )
+            return fut.result()
+    
+    print(f"  [Hedge] Hedged providers failed ({'; '.join(e[:100] for e in errors)}). Continuing down the chain...")
+    return execute_strategies([func for func in strategies if func not in futures.values()], prompt)
+
+def get_hedge_stats():
+    with _hedge_lock:
+        samples = {key: sorted(values) for key, values in _stage_latencies.items() if values}
+        stats = dict(hedge_stats)
+    delays = {}
+    for (stage, model_id), ordered in samples.items():
+        delays.setdefault(stage, {})[model_id] = round(_percentile(ordered, HEDGE_PERCENTILE), 3)
+    return dict(stats, stages=sorted(HEDGE_STAGES), latency_percentile=HEDGE_PERCENTILE, stage_latencies=delays)
+
+def _with_memory_context(prompt, policy, budget):
+    """
+    Returns the prompt with relevant past interactions appended, per the stage's memory policy.
+    Memory is the lowest-priority part of a prompt: it only gets what `budget` has left.
+    """
+    if not policy['enabled']:
+        return prompt
+    
+    remaining = budget.limit - budget.count(prompt)
+    if remaining < 100:
+        return prompt
+    
+    context_str = memory_system.retrieve_context(
+        prompt,
+        top_k=policy['top_k'],
+        partitions=policy['partitions'],
+        threshold=policy['threshold'],
+        max_tokens=min(policy['max_tokens'], remaining)
+    )
+    if not context_str:
+        return prompt
+    
+    # Append context to prompt in a clearly separated way
+    final_prompt = f"{prompt}\n\n[SYSTEM: The following are relevant past interactions to help with context]\n{context_str}\n[End Context]"
+    return final_prompt if budget.count(final_prompt) <= budget.limit else prompt
+
+def _context_budget(stage, strategies):
+    # Whole-prompt budget of the first provider, memory included
+    model_id = strategies[0].model_id if strategies else 'ollama'
+    return PromptBudget(model_id, output_tokens_for(stage))
+
+def _run_stage(stage, strategies, prompt, stream=None):
+    """
+    Memory-augmented execution of a single stage prompt (uncached path).
+    """
+    policy = get_memory_policy(stage)
     
     # --- Memory Integration ---
     # 1. Retrieve Context
-    context_str = memory_system.retrieve_context(prompt)
-    
-    final_prompt = prompt
-    if context_str:
-        # Append context to prompt in a clearly separated way
-        final_prompt = f"{prompt}\n\n[SYSTEM: The following are relevant past interactions to help with context]\n{context_str}\n[End Context]"
+    final_prompt = _with_memory_context(prompt, policy, _context_budget(stage, strategies))
     
-    # 2. Execute
-    response = execute_strategies(strategies, final_prompt)
+    # 2. Execute (a streamed answer can't be raced against a second provider)
+    if stage in HEDGE_STAGES and stream is None:
+        response = execute_hedged(strategies, final_prompt, stage)
+    else:
+        response = execute_strategies(strategies, final_prompt, stream=stream)
     
     # 3. Save Memory
     # We save the *original* prompt, not the one with context, to avoid recursive context bloat
-    if response:
+    if response and policy['record']:
         memory_system.add_memory(prompt, response, metadata={"stage": stage})
         
     return response
 
+def query_stage(stage, prompt, on_token=None, on_reset=None):
+    """
+    Primary Entry Point for Stage-based LLM routing.
+    
+    With `on_token`, the response is streamed: on_token(text) is called for each chunk as it
+    arrives and the full response is still returned. `on_reset()` is called if a provider fails
+    mid-stream and the answer restarts on the next one. Cached responses arrive as one chunk.
+    """
+    # Get config for stage, or default
+    model_chain = STAGE_CONFIG.get(stage, STAGE_CONFIG['default'])
+    
+    # Resolve to functions
+    stream = TokenStream(on_token, on_reset) if on_token else None
+    strategies = [_resolve_strategy(m, stream, output_tokens_for(stage)) for m in model_chain]
+    
+    if not llm_cache:
+        return _run_stage(stage, strategies, prompt, stream)
+    
+    # Cache key uses the whole chain so editing STAGE_CONFIG invalidates old answers
+    model_id = "|".join(model_chain)
+    response, cached = llm_cache.get_or_compute(
+        stage, model_id, prompt, lambda: _run_stage(stage, strategies, prompt, stream)
+    )
+    if cached:
+        print(f"  [Cache] Reused '{stage}' response ({len(response)} chars)")
+        if on_token and response:
+            on_token(response)
+    return response
+
+def forget_response(stage, prompt):
+    """
+    Drops the cached reply to a stage prompt, for callers that could not use it (e.g. no
+    parseable JSON): the next query_stage call asks the providers again instead of replaying it.
+    """
+    if not llm_cache:
+        return
+    model_id = "|".join(STAGE_CONFIG.get(stage, STAGE_CONFIG['default']))
+    if llm_cache.invalidate(stage, model_id, prompt):
+        print(f"  [Cache] Dropped unusable '{stage}' response")
+
 # --- Deprecated / Compatibility ---
 
 def query_llm_robust(prompt, primary_preference=None, use_heavy_fallback=True):
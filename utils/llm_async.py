@@ -0,0 +1,307 @@
+import os
+import time
+import asyncio
+import google.generativeai as genai
+from groq import AsyncGroq
+from anthropic import AsyncAnthropic, NotFoundError
+from termcolor import colored
+from utils.llm import (
+    GEMINI_API_KEY, GROQ_API_KEY, ANTHROPIC_API_KEY, STAGE_CONFIG, HEDGE_STAGES,
+    memory_system, llm_cache, get_memory_policy, _with_memory_context, _context_budget, _hedge_delay,
+    _record_stage_latency, _bump_hedge_stat, _anthropic_usage, TokenStream
+)
+from utils.llm_offline import query_offline_llm_async
+from utils.provider_health import provider_health
+from utils.rate_limit import get_limiter, estimate_tokens, EXPECTED_OUTPUT_TOKENS
+from utils.token_budget import fit_prompt, output_tokens_for
+
+# Async clients share connection pools across every coroutine on the loop
+async_groq_client = AsyncGroq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+async_anthropic_client = AsyncAnthropic(api_key=ANTHROPIC_API_KEY) if ANTHROPIC_API_KEY else None
+
+# --- Internal Callers (async) ---
+
+async def _call_gemini_async(prompt, on_token=None):
+    if not GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY not found.")
+
+    model = genai.GenerativeModel('gemini-1.5-flash')
+    limiter = get_limiter("gemini")
+    reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+
+    max_retries = 3
+    base_delay = 2
+    for attempt in range(max_retries):
+        try:
+            await limiter.acquire_async(reserved)
+            response = await model.generate_content_async(prompt, stream=on_token is not None)
+            if on_token is not None:
+                parts = []
+                async for chunk in response:
+                    parts.append(chunk.text)
+                    on_token(chunk.text)
+                text = "".join(parts)
+            else:
+                text = response.text
+            usage = getattr(response, 'usage_metadata', None)
+            limiter.settle(reserved, getattr(usage, 'total_token_count', None))
+            if not text:
+                raise ValueError("Gemini returned empty response.")
+            return text
+        except Exception as e:
+            error_msg = str(e)
+            if "400" in error_msg:
+                print(f"  [Gemini] 400 Bad Request (Invalid Argument/Model). Switching strategies...")
+                raise e
+            if "429" in error_msg or "ResourceExhausted" in error_msg or "QuotaExceeded" in error_msg:
+                if attempt < max_retries - 1:
+                    wait_time = base_delay * (2 ** attempt)
+                    print(f"  [Gemini] Rate limit hit. Retrying in {wait_time}s...")
+                    await asyncio.sleep(wait_time)
+                    continue
+            raise e
+
+async def _call_groq_async(prompt, on_token=None):
+    if not async_groq_client:
+        raise ValueError("GROQ_API_KEY not found or client init failed.")
+
+    limiter = get_limiter("groq")
+    reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+    await limiter.acquire_async(reserved)
+
+    if on_token is not None:
+        stream = await async_groq_client.chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model="llama-3.3-70b-versatile",
+            stream=True,
+        )
+        parts = []
+        usage = None
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    on_token(delta)
+                usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None) or usage
+        except BaseException:
+            # Failed or cancelled before the usage chunk: charge what was sent and received so far
+            limiter.settle(reserved, estimate_tokens(prompt) + estimate_tokens("".join(parts)))
+            raise
+        limiter.settle(reserved, getattr(usage, 'total_tokens', None))
+        return "".join(parts)
+
+    chat_completion = await async_groq_client.chat.completions.create(
+        messages=[{"role": "user", "content": prompt}],
+        model="llama-3.3-70b-versatile",
+    )
+    usage = getattr(chat_completion, 'usage', None)
+    limiter.settle(reserved, getattr(usage, 'total_tokens', None))
+    return chat_completion.choices[0].message.content
+
+async def _anthropic_message_async(model, prompt, on_token=None):
+    if on_token is None:
+        return await async_anthropic_client.messages.create(
+            max_tokens=4096,
+            messages=[{"role": "user", "content": prompt}],
+            model=model,
+        )
+    async with async_anthropic_client.messages.stream(
+        max_tokens=4096,
+        messages=[{"role": "user", "content": prompt}],
+        model=model,
+    ) as stream:
+        async for text in stream.text_stream:
+            on_token(text)
+        return await stream.get_final_message()
+
+async def _call_anthropic_async(prompt, on_token=None):
+    if not async_anthropic_client:
+        raise ValueError("ANTHROPIC_API_KEY not found or client init failed.")
+
+    limiter = get_limiter("anthropic")
+    reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+    await limiter.acquire_async(reserved)
+
+    try:
+        message = await _anthropic_message_async("claude-3-5-sonnet-20240620", prompt, on_token)
+    except NotFoundError:
+        # Fallback to Haiku which is usually available to all tiers; refund the 404's tokens first
+        limiter.settle(reserved, 0)
+        await limiter.acquire_async(reserved)
+        message = await _anthropic_message_async("claude-3-haiku-20240307", prompt, on_token)
+    limiter.settle(reserved, _anthropic_usage(message))
+    return message.content[0].text
+
+def _resolve_strategy_async(model_id, stream=None, output_tokens=EXPECTED_OUTPUT_TOKENS):
+    """
+    Async counterpart of _resolve_strategy: returns a coroutine function tagged with model_id.
+    """
+    if model_id == 'groq':
+        func = lambda p: _call_groq_async(p, on_token=stream)
+    elif model_id == 'anthropic':
+        func = lambda p: _call_anthropic_async(p, on_token=stream)
+    elif model_id == 'gemini':
+        func = lambda p: _call_gemini_async(p, on_token=stream)
+    elif model_id.startswith('ollama:'):
+        model_name = model_id.split(':', 1)[1]
+        func = lambda p: query_offline_llm_async(p, model_name=model_name, on_token=stream)
+    else:
+        func = lambda p: query_offline_llm_async(p, on_token=stream)
+
+    async def strategy(prompt):
+        if stream is not None:
+            stream.restart()
+        return await func(fit_prompt(prompt, model_id, output_tokens))
+    strategy.model_id = model_id
+    return strategy
+
+async def _call_with_breaker_async(func, prompt):
+    breaker = provider_health.get(getattr(func, 'model_id', 'unknown'))
+    start = time.time()
+    try:
+        response = await func(prompt)
+    except asyncio.CancelledError:
+        # Losing hedge: not a provider failure
+        breaker.release()
+        raise
+    except Exception as e:
+        breaker.record_failure(e)
+        raise
+    breaker.record_success(time.time() - start)
+    return response
+
+async def execute_strategies_async(strategies, prompt, stream=None):
+    """
+    Async counterpart of execute_strategies (same breaker-aware failover order).
+    """
+    errors = []
+    skipped = []
+    for i, func in enumerate(strategies):
+        breaker = provider_health.get(func.model_id)
+        if not breaker.allow():
+            skipped.append(func)
+            continue
+
+        try:
+            return await _call_with_breaker_async(func, prompt)
+        except Exception as e:
+            errors.append(f"{func.model_id}: {e}")
+
+            error_msg = str(e)
+            if "429" in error_msg or "Rate limit" in error_msg:
+                print(colored(f"  [Limit] Strategy {i+1} ({func.model_id}) rate limited. Circuit open for {breaker.retry_in():.0f}s. Switching...", "yellow"))
+            elif "not found" in error_msg.lower():
+                print(colored(f"  [Config] Strategy {i+1} ({func.model_id}) Key not found/Model missing. Switching...", "yellow"))
+            else:
+                print(colored(f"  [Error] Strategy {i+1} ({func.model_id}) failed: {error_msg[:200]}...", "red"))
+
+    if skipped and not errors:
+        func = min(skipped, key=lambda f: provider_health.get(f.model_id).retry_in())
+        print(colored(f"  [Router] All providers cooling down. Trying {func.model_id} anyway...", "yellow"))
+        try:
+            return await _call_with_breaker_async(func, prompt)
+        except Exception as e:
+            errors.append(f"{func.model_id}: {e}")
+
+    enable_offline = os.getenv("ENABLE_OFFLINE_FALLBACK", "True").lower() == "true"
+    if enable_offline:
+        try:
+            if stream is not None:
+                stream.restart()
+            return await query_offline_llm_async(fit_prompt(prompt, 'ollama'), on_token=stream)
+        except Exception as e:
+            errors.append(f"Offline Default: {e}")
+
+    raise Exception(f"All strategies failed. Errors: {errors}")
+
+async def _hedge_call_async(stage, func, prompt, started):
+    # `started` tells the caller the task got to run before it could be cancelled
+    started.set()
+    start = time.time()
+    response = await _call_with_breaker_async(func, prompt)
+    _record_stage_latency(stage, func.model_id, time.time() - start)
+    return response
+
+async def execute_hedged_async(strategies, prompt, stage='default'):
+    """
+    Async counterpart of execute_hedged. The losing request is actually cancelled.
+    """
+    _bump_hedge_stat("hedged_calls")
+
+    # Skipped providers stay in the chain for the fallback below
+    healthy = (func for func in strategies if provider_health.get(func.model_id).allow())
+    primary = next(healthy, None)
+    if primary is None:
+        return await execute_strategies_async(strategies, prompt)
+
+    started = {}
+    first = asyncio.ensure_future(_hedge_call_async(stage, primary, prompt, started.setdefault(primary, asyncio.Event())))
+    tasks = {first: primary}
+    done, _ = await asyncio.wait(tasks, timeout=_hedge_delay(stage, primary.model_id))
+
+    if not done:
+        backup = next(healthy, None)
+        if backup is not None:
+            print(f"  [Hedge] {primary.model_id} slow, racing {backup.model_id}...")
+            tasks[asyncio.ensure_future(_hedge_call_async(stage, backup, prompt, started.setdefault(backup, asyncio.Event())))] = backup
+            _bump_hedge_stat("hedges_launched")
+
+    pending = set(tasks)
+    errors = []
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None:
+                errors.append(f"{tasks[task].model_id}: {task.exception()}")
+                continue
+            if tasks[task] is not primary:
+                _bump_hedge_stat("backup_wins")
+            for loser in pending:
+                loser.cancel()
+                if not started[tasks[loser]].is_set():
+                    # Cancelled before its first step, so _call_with_breaker_async never ran to release it
+                    provider_health.get(tasks[loser].model_id).release()
+            return task.result()
+
+    print(f"  [Hedge] Hedged providers failed ({'; '.join(e[:100] for e in errors)}). Continuing down the chain...")
+    return await execute_strategies_async([func for func in strategies if func not in tasks.values()], prompt)
+
+async def _run_stage_async(stage, strategies, prompt, stream=None):
+    policy = get_memory_policy(stage)
+
+    # Retrieval embeds the prompt through a blocking SDK call; keep it off the loop
+    final_prompt = await asyncio.to_thread(_with_memory_context, prompt, policy, _context_budget(stage, strategies))
+
+    if stage in HEDGE_STAGES and stream is None:
+        response = await execute_hedged_async(strategies, final_prompt, stage)
+    else:
+        response = await execute_strategies_async(strategies, final_prompt, stream=stream)
+
+    # add_memory only enqueues onto the write-behind queue
+    if response and policy['record']:
+        memory_system.add_memory(prompt, response, metadata={"stage": stage})
+
+    return response
+
+async def query_stage_async(stage, prompt, on_token=None, on_reset=None):
+    """
+    Async counterpart of query_stage: same routing, memory policy, breakers, response cache
+    and on_token/on_reset streaming callbacks.
+    """
+    model_chain = STAGE_CONFIG.get(stage, STAGE_CONFIG['default'])
+    stream = TokenStream(on_token, on_reset) if on_token else None
+    strategies = [_resolve_strategy_async(m, stream, output_tokens_for(stage)) for m in model_chain]
+
+    if not llm_cache:
+        return await _run_stage_async(stage, strategies, prompt, stream)
+
+    model_id = "|".join(model_chain)
+    response, cached = await llm_cache.get_or_compute_async(
+        stage, model_id, prompt, lambda: _run_stage_async(stage, strategies, prompt, stream)
+    )
+    if cached:
+        print(f"  [Cache] Reused '{stage}' response ({len(response)} chars)")
+        if on_token and response:
+            on_token(response)
+    return response
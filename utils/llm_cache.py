@@ -0,0 +1,231 @@
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import Future
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "True").lower() == "true"
+LLM_CACHE_FILE = os.getenv("LLM_CACHE_FILE", "llm_cache.db")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))  # Seconds a response stays valid
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 64 * 1024 * 1024))  # LRU eviction above this
+
+
+class LLMResponseCache:
+    """
+    On-disk, content-addressed cache of LLM responses keyed by (stage, model id, prompt hash).
+    Entries expire after `ttl` seconds and the least recently used ones are evicted once the
+    stored responses exceed `max_bytes`. Identical prompts that are in flight at the same time
+    are coalesced so only one provider call is made (single-flight).
+    """
+
+    def __init__(self, cache_file=LLM_CACHE_FILE, ttl=LLM_CACHE_TTL, max_bytes=LLM_CACHE_MAX_BYTES):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self._db_lock = threading.Lock()
+        self._flight_lock = threading.Lock()
+        self._inflight = {}  # key -> Future shared by every waiter
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+        self._conn = sqlite3.connect(cache_file, check_same_thread=False)
+        with self._db_lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    stage TEXT,
+                    model TEXT,
+                    response TEXT,
+                    size INTEGER,
+                    created_at REAL,
+                    accessed_at REAL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(stage, model_id, prompt):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{stage}\x00{model_id}\x00{prompt_hash}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+
+            response, created_at = row
+            if now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return response
+
+    def put(self, key, stage, model_id, response):
+        if not response:
+            return
+
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, stage, model, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, stage, model_id, response, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        # Expired entries first, then least recently used until we fit the size budget.
+        # Caller must hold self._db_lock.
+        cur = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        self.evictions += max(cur.rowcount, 0)
+
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC"):
+            if total - freed <= self.max_bytes:
+                break
+            victims.append((key,))
+            freed += size
+
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def get_or_compute(self, stage, model_id, prompt, compute):
+        """
+        Returns (response, from_cache). On a miss exactly one caller runs `compute()`; concurrent
+        callers with the same key wait for that result (or exception) instead of re-querying.
+        """
+        key = self.make_key(stage, model_id, prompt)
+
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached, True
+
+        with self._flight_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self._inflight[key] = flight
+
+        if not leader:
+            self.coalesced += 1
+            return flight.result(), True
+
+        try:
+            # Another leader may have finished between our lookup and taking leadership
+            cached = self.get(key)
+            if cached is not None:
+                self.hits += 1
+                flight.set_result(cached)
+                return cached, True
+
+            self.misses += 1
+            response = compute()
+            self.put(key, stage, model_id, response)
+            flight.set_result(response)
+            return response, False
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._flight_lock:
+                self._inflight.pop(key, None)
+
+    async def get_or_compute_async(self, stage, model_id, prompt, compute):
+        """
+        Async counterpart of get_or_compute: `compute` is a coroutine function. Shares the
+        same in-flight table, so sync and async callers coalesce with each other.
+        """
+        key = self.make_key(stage, model_id, prompt)
+
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached, True
+
+        with self._flight_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self._inflight[key] = flight
+
+        if not leader:
+            self.coalesced += 1
+            return await asyncio.wrap_future(flight), True
+
+        try:
+            cached = self.get(key)
+            if cached is not None:
+                self.hits += 1
+                flight.set_result(cached)
+                return cached, True
+
+            self.misses += 1
+            response = await compute()
+            self.put(key, stage, model_id, response)
+            flight.set_result(response)
+            return response, False
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._flight_lock:
+                self._inflight.pop(key, None)
+
+    def invalidate(self, stage, model_id, prompt):
+        """
+        Drops one cached response. Returns True if there was one.
+        """
+        with self._db_lock:
+            cur = self._conn.execute("DELETE FROM responses WHERE key = ?", (self.make_key(stage, model_id, prompt),))
+            self._conn.commit()
+        return cur.rowcount > 0
+
+    def clear(self):
+        with self._db_lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        with self._db_lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {
+            "entries": entries,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "inflight": len(self._inflight),
+        }
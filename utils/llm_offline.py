@@ -1,7 +1,9 @@
 import os
 import ollama
-from ollama import Client
+from ollama import Client, AsyncClient
 from dotenv import load_dotenv
+from utils.rate_limit import get_limiter, estimate_tokens, EXPECTED_OUTPUT_TOKENS
+from utils.token_budget import OLLAMA_NUM_CTX
 
 load_dotenv()
 
@@ -23,35 +25,112 @@ def get_client():
         )
     return None # Use default ollama.chat
 
-def query_offline_llm(prompt, model_name=None):
+def get_async_client():
+    # httpx async clients are bound to the running event loop, so build one per call
+    if OLLAMA_API_KEY:
+        return AsyncClient(
+            host=OLLAMA_HOST,
+            headers={
+                'Authorization': f'Bearer {OLLAMA_API_KEY}'
+            }
+        )
+    return AsyncClient()
+
+def query_offline_llm(prompt, model_name=None, on_token=None):
     """
     Queries Ollama (Cloud if API Key present, else local).
+    Streams the reply through on_token(text) when given.
     """
     client = get_client()
     target_model = model_name if model_name else OLLAMA_MODEL
     
+    # Each model gets its own budget (Ollama Cloud limits are per model)
+    limiter = get_limiter(f"ollama:{target_model}")
+    reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+    limiter.acquire(reserved)
+    
+    try:
+        messages = [
+            {'role': 'system', 'content': 'You are a helpful research assistant.'},
+            {'role': 'user', 'content': prompt}
+        ]
+        
+        chat = client.chat if client else ollama.chat
+        response = chat(
+            model=target_model, 
+            messages=messages, 
+            options={'num_ctx': OLLAMA_NUM_CTX}, # Prompts are budgeted against this window (utils/token_budget.py)
+            format='json' if 'json' in prompt.lower() else '',
+            stream=on_token is not None
+        )
+        
+        if on_token is not None:
+            parts = []
+            chunk = {}
+            for chunk in response:
+                text = chunk['message']['content']
+                if text:
+                    parts.append(text)
+                    on_token(text)
+            # The final chunk carries the eval counts
+            response = chunk
+            content = "".join(parts)
+        else:
+            content = response['message']['content']
+            
+        used = (response.get('prompt_eval_count') or 0) + (response.get('eval_count') or 0)
+        limiter.settle(reserved, used or None)
+        return content
+    except Exception as e:
+        error_str = str(e).lower()
+        if "not found" in error_str:
+            raise ValueError(f"Ollama model '{target_model}' not found.")
+        if "401" in error_str or "unauthorized" in error_str:
+             raise PermissionError("Ollama Cloud API Key is invalid or unauthorized.")
+        print(f"Error querying Ollama: {e}")
+        raise e
+
+async def query_offline_llm_async(prompt, model_name=None, on_token=None):
+    """
+    Async counterpart of query_offline_llm.
+    """
+    client = get_async_client()
+    target_model = model_name if model_name else OLLAMA_MODEL
+    
+    limiter = get_limiter(f"ollama:{target_model}")
+    reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+    await limiter.acquire_async(reserved)
+    
     try:
         messages = [
             {'role': 'system', 'content': 'You are a helpful research assistant.'},
             {'role': 'user', 'content': prompt}
         ]
         
-        if client:
-            response = client.chat(
-                model=target_model, 
-                messages=messages, 
-                options={'num_ctx': 8192}, # Increased context window for research
-                format='json' if 'json' in prompt.lower() else ''
-            )
+        response = await client.chat(
+            model=target_model, 
+            messages=messages, 
+            options={'num_ctx': OLLAMA_NUM_CTX}, # Prompts are budgeted against this window (utils/token_budget.py)
+            format='json' if 'json' in prompt.lower() else '',
+            stream=on_token is not None
+        )
+        
+        if on_token is not None:
+            parts = []
+            chunk = {}
+            async for chunk in response:
+                text = chunk['message']['content']
+                if text:
+                    parts.append(text)
+                    on_token(text)
+            response = chunk
+            content = "".join(parts)
         else:
-            response = ollama.chat(
-                model=target_model, 
-                messages=messages, 
-                options={'num_ctx': 8192}, # Increased context window for research
-                format='json' if 'json' in prompt.lower() else ''
-            )
+            content = response['message']['content']
             
-        return response['message']['content']
+        used = (response.get('prompt_eval_count') or 0) + (response.get('eval_count') or 0)
+        limiter.settle(reserved, used or None)
+        return content
     except Exception as e:
         error_str = str(e).lower()
         if "not found" in error_str:
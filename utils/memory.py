@@ -1,7 +1,8 @@
 
 import os
-import json
 import time
+import uuid
+import threading
 import numpy as np
 import warnings
 # Suppress the deprecation warning
@@ -10,22 +11,34 @@ import google.generativeai as genai
 import ollama
 from ollama import Client as OllamaClient
 from dotenv import load_dotenv
+from utils.vector_index import FlatIndex, IVFIndex
+from utils.memory_store import MemoryStore
+from utils.embeddings import EmbeddingCache, EmbeddingBatcher
+from utils.memory_writer import WriteBehindQueue, MEMORY_WRITE_BEHIND
 
 load_dotenv()
 
-MEMORY_FILE = "memory_store.json"
+MEMORY_FILE = "memory_store.json" # Legacy store, migrated once into MEMORY_STORE
+MEMORY_STORE = os.getenv("MEMORY_STORE", "memory_store")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
 OLLAMA_API_KEY = os.getenv("OLLAMA_API_KEY")
 
 # Configuration
-MAX_MEMORIES = 200
+# Only ids, metadata and log offsets stay in RAM (texts are read back from the store on a hit),
+# so the cap is bounded by the vector index: 50000 x 768-dim float32 rows is ~150 MB
+MAX_MEMORIES = int(os.getenv("MAX_MEMORIES", 50000))
+MEMORY_INDEX = os.getenv("MEMORY_INDEX", "ivf").lower() # 'ivf' (approximate) or 'flat' (exact scan)
 SIMILARITY_THRESHOLD = 0.65 # Minimum similarity to be considered relevant
+DEFAULT_RETRIEVAL_THRESHOLD = 0.4 # Lowered from 0.65 to 0.4 for better recall
 
 class MemorySystem:
-    def __init__(self, memory_file=MEMORY_FILE):
+    def __init__(self, store_path=MEMORY_STORE, memory_file=MEMORY_FILE):
         self.memory_file = memory_file
+        self.store = MemoryStore(store_path)
+        self._lock = threading.RLock()
         self.memories = self._load_memory()
+        self._rebuild_index()
         
         if GEMINI_API_KEY:
             genai.configure(api_key=GEMINI_API_KEY)
@@ -33,31 +46,71 @@ class MemorySystem:
         else:
             self.embedding_provider = "ollama"
 
+        self.embedding_cache = EmbeddingCache()
+        self.embedding_batcher = EmbeddingBatcher(self._embed_batch)
+
+        # Embedding + persistence of new memories runs off the caller's hot path
+        self.writer = WriteBehindQueue(self._write_memories, name="memory-writer") if MEMORY_WRITE_BEHIND else None
+
     def _load_memory(self):
-        if os.path.exists(self.memory_file):
-            try:
-                with open(self.memory_file, 'r') as f:
-                    data = json.load(f)
-                    return data if isinstance(data, list) else []
-            except json.JSONDecodeError:
-                return []
-        return []
-
-    def _save_memory(self):
+        # One-time import of the old JSON list into the append-only store
+        self.store.migrate_from_json(self.memory_file)
+        return self.store.load()
+
+    def _rebuild_index(self):
+        """
+        Builds the normalized embedding matrices and the id lookup from self.memories.
+        """
+        self.indexes = {}  # partition (stage) -> vector index
+        self._by_id = {}
+        for mem in self.memories:
+            # Older stores used str(time.time()) ids, which can collide across threads
+            if not mem.get('id') or mem['id'] in self._by_id:
+                mem['id'] = uuid.uuid4().hex
+            self._by_id[mem['id']] = mem
+            if mem.get('embedding') is not None:
+                self._index_for(mem).add(mem['id'], mem.pop('embedding'))
+
+    @staticmethod
+    def _partition_of(mem):
+        return (mem.get('metadata') or {}).get('stage') or "default"
+
+    def _index_for(self, mem):
+        """
+        Memories are partitioned by the stage that produced them, so a stage can search
+        only the partitions its retrieval policy names.
+        """
+        partition = self._partition_of(mem)
+        index = self.indexes.get(partition)
+        if index is None:
+            # IVF searches exactly until a partition is large enough to train centroids
+            index = self.indexes[partition] = IVFIndex() if MEMORY_INDEX == "ivf" else FlatIndex()
+        return index
+
+    def _save_memory(self, memory_item):
+        # Append-only: O(record) per call instead of rewriting the whole store
+        self.store.append(memory_item)
+        # The text and embedding live on disk and in the index; keep only what lookups need
+        record = {k: memory_item[k] for k in ('id', 'metadata', 'timestamp')}
+        self._by_id[record['id']] = record
+        self.memories.append(record)
+
         # Prune if too large
         if len(self.memories) > MAX_MEMORIES:
             # Keep the most recent ones
+            dropped = self.memories[:-MAX_MEMORIES]
+            for mem in dropped:
+                self._index_for(mem).remove(mem['id'])
+                self._by_id.pop(mem['id'], None)
             self.memories = self.memories[-MAX_MEMORIES:]
-            
-        with open(self.memory_file, 'w') as f:
-            json.dump(self.memories, f, indent=4)
+            self.store.delete([mem['id'] for mem in dropped])
 
-    def _get_embedding_gemini(self, text):
+    def _embed_batch_gemini(self, texts):
         try:
             # text-embedding-004 is current standard, embedding-001 is legacy but stable
             result = genai.embed_content(
                 model="models/text-embedding-004",
-                content=text,
+                content=texts,
                 task_type="retrieval_document"
             )
             return result['embedding']
@@ -66,113 +119,195 @@ class MemorySystem:
                  # Fallback
                 result = genai.embed_content(
                     model="models/embedding-001",
-                    content=text
+                    content=texts
                 )
                 return result['embedding']
             except Exception as e:
                 print(f"[Memory] Gemini Embedding failed: {e}")
-                return None
+                return [None] * len(texts)
 
-    def _get_embedding_ollama(self, text):
+    def _embed_batch_ollama(self, texts):
         if getattr(self, "embedding_disabled", False):
-            return None
+            return [None] * len(texts)
             
+        model = os.getenv("OLLAMA_MODEL", "llama3.2")
         try:
-            model = os.getenv("OLLAMA_MODEL", "llama3.2")
-            # Use the simple python library call which maps to /api/embeddings correctly
-            response = ollama.embeddings(model=model, prompt=text)
-            return response.get('embedding')
-        except Exception as e:
-            # Fallback/Error Handling: Disable if endpoint missing (404) to avoid spam
-            if "404" in str(e):
-                print(f"[System] Local embedding not supported key ('{model}'). Memory features disabled.")
-                self.embedding_disabled = True
-            else:
+            # /api/embed takes a list of inputs in one request
+            response = ollama.embed(model=model, input=texts)
+            return list(response.get('embeddings') or [None] * len(texts))
+        except Exception:
+            pass
+
+        # Older servers only have /api/embeddings (one text per call)
+        embeddings = []
+        for text in texts:
+            try:
+                response = ollama.embeddings(model=model, prompt=text)
+                embeddings.append(response.get('embedding'))
+            except Exception as e:
+                # Fallback/Error Handling: Disable if endpoint missing (404) to avoid spam
+                if "404" in str(e):
+                    print(f"[System] Local embedding not supported key ('{model}'). Memory features disabled.")
+                    self.embedding_disabled = True
+                    return embeddings + [None] * (len(texts) - len(embeddings))
                 print(f"[Memory] Ollama Embedding failed: {e}")
-            return None
+                embeddings.append(None)
+        return embeddings
 
-    def _get_embedding(self, text):
+    def _embed_batch(self, texts):
+        """
+        Returns one (provider, embedding) pair per text; provider is the one that actually
+        produced the vector ("ollama" when Gemini failed on it), None if none did.
+        """
         if self.embedding_provider == "gemini":
             try:
-                emb = self._get_embedding_gemini(text)
-                if emb: return emb
+                embeddings = self._embed_batch_gemini(texts)
             except Exception as e:
                 print(f"[Memory] Unexpected Gemini error: {e}. Falling back...")
+                embeddings = [None] * len(texts)
+            results = [("gemini", emb) if emb else (None, None) for emb in embeddings]
             
-            # Fallback to ollama if gemini fails or returns None
-            return self._get_embedding_ollama(text)
+            # Fallback to ollama for any text gemini failed on
+            missing = [i for i, emb in enumerate(embeddings) if not emb]
+            if missing:
+                retried = self._embed_batch_ollama([texts[i] for i in missing])
+                for i, emb in zip(missing, retried):
+                    results[i] = ("ollama", emb) if emb else (None, None)
+            return results
         else:
-            return self._get_embedding_ollama(text)
+            return [("ollama", emb) if emb else (None, None) for emb in self._embed_batch_ollama(texts)]
+
+    def _cache_embedding(self, text, provider, embedding):
+        # Keyed by the producing provider: a fallback Ollama vector must not be served later as
+        # a Gemini one (different model and dimension from the memories it would be compared to)
+        if provider and embedding:
+            self.embedding_cache.put(self.embedding_cache.make_key(provider, text), embedding)
+
+    def _get_embedding(self, text):
+        key = self.embedding_cache.make_key(self.embedding_provider, text)
+        embedding = self.embedding_cache.get(key)
+        if embedding is not None:
+            return embedding
+
+        # Concurrent callers (stage 3/4 thread pools) share one provider call
+        provider, embedding = self.embedding_batcher.embed(text) or (None, None)
+        self._cache_embedding(text, provider, embedding)
+        return embedding
 
     def add_memory(self, prompt, response, metadata=None):
         if not prompt or not response:
             return
 
+        job = {
+            "prompt": prompt,
+            "response": response,
+            "metadata": metadata or {},
+            "timestamp": time.time()
+        }
+        if self.writer:
+            self.writer.submit(job)
+        else:
+            self._write_memories([job])
+
+    def _write_memories(self, jobs):
+        """
+        Embeds a batch of new memories in one provider call and persists them.
+        Runs on the write-behind thread unless MEMORY_WRITE_BEHIND is disabled.
+        """
         # Combine text for embedding
-        text_to_embed = f"Request: {prompt}\nResult: {response}"
-        embedding = self._get_embedding(text_to_embed)
+        texts = [f"Request: {job['prompt']}\nResult: {job['response']}" for job in jobs]
+        keys = [self.embedding_cache.make_key(self.embedding_provider, text) for text in texts]
+        embeddings = [self.embedding_cache.get(key) for key in keys]
+
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+        if missing:
+            fetched = self._embed_batch([texts[i] for i in missing])
+            for i, (provider, emb) in zip(missing, fetched):
+                embeddings[i] = emb
+                self._cache_embedding(texts[i], provider, emb)
 
-        if embedding:
+        for job, embedding in zip(jobs, embeddings):
+            if not embedding:
+                continue
             memory_item = {
-                "id": str(time.time()),
-                "prompt": prompt,
-                "response": response,
+                "id": uuid.uuid4().hex,
+                "prompt": job['prompt'],
+                "response": job['response'],
                 "embedding": embedding,
-                "metadata": metadata or {},
-                "timestamp": time.time()
+                "metadata": job['metadata'],
+                "timestamp": job['timestamp']
             }
-            self.memories.append(memory_item)
-            self._save_memory()
+            with self._lock:
+                self._index_for(memory_item).add(memory_item['id'], embedding)
+                self._save_memory(memory_item)
+
+    def flush(self, timeout=None):
+        """
+        Waits for queued memories to be embedded and persisted.
+        """
+        if self.writer:
+            return self.writer.flush(timeout=timeout)
+        return True
+
+    def stats(self):
+        return {
+            "memories": len(self.memories),
+            "partitions": {name: len(index) for name, index in self.indexes.items()},
+            "embedding_cache": self.embedding_cache.stats(),
+            "embedding_batcher": self.embedding_batcher.stats(),
+            "writer": self.writer.stats() if self.writer else None,
+        }
 
-    def retrieve_context(self, query, top_k=2):
+    def retrieve_context(self, query, top_k=2, partitions=None, threshold=DEFAULT_RETRIEVAL_THRESHOLD,
+                         max_tokens=None):
         """
         Retrieves relevant past interactions based on query similarity.
+        `partitions` limits the search to memories from those stages (None = all).
+        `max_tokens` caps the size of the injected context (~4 chars per token).
         Returns a formatted string of context.
         """
-        if not self.memories:
-            return ""
+        with self._lock:
+            if partitions is None:
+                indexes = list(self.indexes.values())
+            else:
+                indexes = [self.indexes[p] for p in partitions if p in self.indexes]
+            if not any(len(index) for index in indexes):
+                return ""
 
         query_embedding = self._get_embedding(query)
         if not query_embedding:
             return ""
 
-        query_vec = np.array(query_embedding)
-        
-        scores = []
-        for mem in self.memories:
-            if 'embedding' not in mem: continue
-            mem_vec = np.array(mem['embedding'])
-            
-            # Use dot product / cosine similarity
-            # Use dot product / cosine similarity
-            # Ensure dimensions match (Gemini vs Ollama embeddings might differ if mixed)
-            if mem_vec.shape != query_vec.shape:
-                # print(f"[Memory] Dimension mismatch: Query {query_vec.shape} vs Mem {mem_vec.shape}")
-                continue
+        # One matrix-vector product per searched partition, merged by score
+        with self._lock:
+            hits = [hit for index in indexes for hit in index.search(query_embedding, top_k)]
+            hits.sort(key=lambda x: x[0], reverse=True)
+            top_results = [(score, key) for score, key in hits[:top_k] if key in self._by_id]
 
-            norm_q = np.linalg.norm(query_vec)
-            norm_m = np.linalg.norm(mem_vec)
-            
-            if norm_q == 0 or norm_m == 0:
-                similarity = 0
-            else:
-                similarity = np.dot(query_vec, mem_vec) / (norm_q * norm_m)
-            
-            scores.append((similarity, mem))
+        budget = max_tokens * 4 if max_tokens else None
+        relevant_memories = []
+        for score, key in top_results:
+            if score < threshold:
+                continue
+            mem = self.store.read(key)
+            if mem is None:  # Pruned since the search
+                continue
+            # Truncate very long responses for context window sanity
+            short_response = mem['response']
+            if len(short_response) > 500:
+                short_response = short_response[:500] + "...(truncated)"
 
-        # Sort by similarity descending
-        scores.sort(key=lambda x: x[0], reverse=True)
-        top_results = scores[:top_k]
+            entry = f"PAST INTERACTION (Score: {score:.2f}):\nQ: {mem['prompt']}\nA: {short_response}"
+            if budget is not None and len(entry) > budget:
+                # Past prompts can be whole documents; trim the question to what is left
+                overflow = len(entry) - budget + len("...(truncated)")
+                if len(mem['prompt']) - overflow < 200:
+                    break
+                entry = f"PAST INTERACTION (Score: {score:.2f}):\nQ: {mem['prompt'][:len(mem['prompt']) - overflow]}...(truncated)\nA: {short_response}"
 
-        relevant_memories = []
-        for score, mem in top_results:
-            if score >= 0.4: # Lowered threshold from 0.65 to 0.4 for better recall
-                # Truncate very long responses for context window sanity
-                short_response = mem['response']
-                if len(short_response) > 500:
-                    short_response = short_response[:500] + "...(truncated)"
-                
-                relevant_memories.append(f"PAST INTERACTION (Score: {score:.2f}):\nQ: {mem['prompt']}\nA: {short_response}")
+            relevant_memories.append(entry)
+            if budget is not None:
+                budget -= len(entry)
 
         if not relevant_memories:
             # print("[Memory] No relevant context found.")
@@ -0,0 +1,319 @@
+import os
+import json
+import threading
+import numpy as np
+
+# Compact once dead (deleted/overwritten) records outnumber live ones by this ratio
+COMPACT_RATIO = float(os.getenv("MEMORY_COMPACT_RATIO", 1.0))
+COMPACT_MIN_RECORDS = int(os.getenv("MEMORY_COMPACT_MIN_RECORDS", 500))
+
+
+class MemoryStore:
+    """
+    Append-only storage engine for the memory system.
+
+    - `<base>.log`: one JSON record per line for text + metadata ("add" and "del" ops).
+      Appends are O(record); the log is replayed on startup. Only the byte offset of each
+      live record is kept in RAM; prompt and response text are read back with `read()`.
+    - `<base>.<dim>.npy`: memory-mapped float32 embedding matrix per embedding dimension.
+      Each "add" record points at its row.
+
+    Dead rows are reclaimed by `compact()`, which runs automatically once the log holds
+    more dead records than live ones (see COMPACT_RATIO).
+    """
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.log_path = f"{base_path}.log"
+        self._lock = threading.Lock()
+        self._matrices = {}   # dim -> np.memmap (capacity, dim)
+        self._next_row = {}   # dim -> first free row
+        self._records = {}    # id -> live "add" record without its text, plus its log offset
+        self._dead = 0
+        self._log = None
+        self._reader = None
+
+    # --- Paths / Files ---
+
+    def _npy_path(self, dim, base=None):
+        return f"{base or self.base_path}.{dim}.npy"
+
+    def _open_matrix(self, dim, capacity=None):
+        path = self._npy_path(dim)
+        if os.path.exists(path):
+            mat = np.load(path, mmap_mode='r+')
+        else:
+            mat = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(capacity or 256, dim))
+        self._matrices[dim] = mat
+        return mat
+
+    def _ensure_capacity(self, dim, row):
+        mat = self._matrices.get(dim)
+        if mat is None:
+            mat = self._open_matrix(dim)
+        if row < mat.shape[0]:
+            return mat
+
+        # Grow by doubling into a new file, then swap it in
+        new_cap = max(mat.shape[0] * 2, row + 1)
+        tmp_path = self._npy_path(dim) + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(new_cap, dim))
+        grown[:mat.shape[0]] = mat
+        grown.flush()
+        del grown, mat
+        self._matrices.pop(dim, None)
+        os.replace(tmp_path, self._npy_path(dim))
+        return self._open_matrix(dim)
+
+    # --- Public API ---
+
+    def exists(self):
+        return os.path.exists(self.log_path)
+
+    def load(self):
+        """
+        Replays the log. Returns a list of live memories (oldest first) with their id,
+        metadata, timestamp and embedding (a float32 array); the text stays on disk.
+        """
+        with self._lock:
+            self._records = {}
+            self._next_row = {}
+            self._dead = 0
+
+            if os.path.exists(self.log_path):
+                with open(self.log_path, 'rb') as f:
+                    offset = complete = 0
+                    for line in f:
+                        line_offset = offset
+                        offset += len(line)
+                        try:
+                            if not line.endswith(b"\n"):
+                                raise ValueError("unterminated record")
+                            rec = json.loads(line)
+                        except ValueError:
+                            # Torn write at the tail from a crash; everything before it is intact
+                            continue
+                        complete = offset
+                        if rec.get('op') == 'del':
+                            if self._records.pop(rec.get('id'), None) is not None:
+                                self._dead += 1
+                            self._dead += 1
+                            continue
+                        if rec['id'] in self._records:
+                            self._dead += 1
+                        self._records[rec['id']] = self._index_record(rec, line_offset)
+                        dim = rec.get('dim')
+                        if dim:
+                            self._next_row[dim] = max(self._next_row.get(dim, 0), rec['row'] + 1)
+
+                if complete < offset:
+                    # Appends must start on a fresh line so every offset points at a whole record
+                    with open(self.log_path, 'r+b') as f:
+                        f.truncate(complete)
+
+            for dim in self._next_row:
+                if os.path.exists(self._npy_path(dim)):
+                    self._open_matrix(dim)
+
+            memories = []
+            for rec in sorted(self._records.values(), key=lambda r: r.get('timestamp') or 0):
+                mem = {k: v for k, v in rec.items() if k not in ('op', 'dim', 'row', 'offset')}
+                mat = self._matrices.get(rec.get('dim'))
+                if mat is not None and rec['row'] < mat.shape[0]:
+                    mem['embedding'] = np.array(mat[rec['row']])
+                memories.append(mem)
+            return memories
+
+    def append(self, memory):
+        """
+        Persists one memory. The embedding row is written before the log record, so the log
+        never references an unwritten row.
+        """
+        with self._lock:
+            rec = {
+                "op": "add",
+                "id": memory['id'],
+                "prompt": memory['prompt'],
+                "response": memory['response'],
+                "metadata": memory.get('metadata') or {},
+                "timestamp": memory.get('timestamp'),
+            }
+
+            embedding = memory.get('embedding')
+            if embedding is not None and len(embedding):
+                vec = np.asarray(embedding, dtype=np.float32).ravel()
+                dim = int(vec.shape[0])
+                row = self._next_row.get(dim, 0)
+                mat = self._ensure_capacity(dim, row)
+                mat[row] = vec
+                mat.flush()
+                self._next_row[dim] = row + 1
+                rec["dim"] = dim
+                rec["row"] = row
+
+            if rec['id'] in self._records:
+                self._dead += 1
+            self._records[rec['id']] = self._index_record(rec, self._write(rec))
+            self._maybe_compact()
+
+    def read(self, mem_id):
+        """
+        Returns {"prompt", "response"} of a live memory from the log, or None.
+        """
+        with self._lock:
+            rec = self._records.get(mem_id)
+            if rec is None:
+                return None
+            full = self._read_at(rec['offset'])
+        return {"prompt": full['prompt'], "response": full['response']}
+
+    def delete(self, ids):
+        with self._lock:
+            for mem_id in ids:
+                if self._records.pop(mem_id, None) is None:
+                    continue
+                self._write({"op": "del", "id": mem_id})
+                self._dead += 2  # the add record and its tombstone
+            self._maybe_compact()
+
+    def close(self):
+        with self._lock:
+            if self._log:
+                self._log.close()
+                self._log = None
+            if self._reader:
+                self._reader.close()
+                self._reader = None
+            for mat in self._matrices.values():
+                mat.flush()
+
+    # --- Internals ---
+
+    @staticmethod
+    def _index_record(rec, offset):
+        # What stays in RAM per memory: everything but the text
+        kept = {k: v for k, v in rec.items() if k not in ('prompt', 'response')}
+        kept['offset'] = offset
+        return kept
+
+    def _write(self, rec):
+        """
+        Appends one record and returns its byte offset in the log.
+        """
+        if self._log is None:
+            self._log = open(self.log_path, 'ab')
+        offset = self._log.tell()
+        self._log.write((json.dumps(rec) + "\n").encode('utf-8'))
+        self._log.flush()
+        return offset
+
+    def _read_at(self, offset):
+        if self._reader is None:
+            self._reader = open(self.log_path, 'rb')
+        self._reader.seek(offset)
+        return json.loads(self._reader.readline())
+
+    def _maybe_compact(self):
+        live = len(self._records)
+        if self._dead >= COMPACT_MIN_RECORDS and self._dead > live * COMPACT_RATIO:
+            self._compact_locked()
+
+    def compact(self):
+        with self._lock:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        """
+        Rewrites the log with live records only and packs each embedding matrix densely.
+        New files are written next to the old ones and swapped in with os.replace.
+        """
+        if self._log:
+            self._log.close()
+            self._log = None
+
+        live = sorted(self._records.values(), key=lambda r: r.get('timestamp') or 0)
+        tmp_base = f"{self.base_path}.compact"
+
+        by_dim = {}
+        for rec in live:
+            if rec.get('dim') in self._matrices:
+                by_dim.setdefault(rec['dim'], []).append(rec)
+
+        new_rows = {}
+        for dim, recs in by_dim.items():
+            old = self._matrices[dim]
+            packed = np.lib.format.open_memmap(
+                self._npy_path(dim, tmp_base), mode='w+', dtype=np.float32, shape=(max(len(recs) * 2, 256), dim)
+            )
+            for i, rec in enumerate(recs):
+                packed[i] = old[rec['row']]
+                new_rows[rec['id']] = i
+            packed.flush()
+            del packed
+
+        with open(f"{tmp_base}.log", 'wb') as f:
+            for rec in live:
+                full = self._read_at(rec['offset'])
+                if rec['id'] in new_rows:
+                    rec['row'] = full['row'] = new_rows[rec['id']]
+                rec['offset'] = f.tell()
+                f.write((json.dumps(full) + "\n").encode('utf-8'))
+        if self._reader:
+            self._reader.close()
+            self._reader = None
+
+        # Swap in the compacted files; drop matrices for dimensions with no live rows
+        for dim in list(self._matrices):
+            self._matrices.pop(dim).flush()
+            if dim in by_dim:
+                os.replace(self._npy_path(dim, tmp_base), self._npy_path(dim))
+            else:
+                os.remove(self._npy_path(dim))
+        os.replace(f"{tmp_base}.log", self.log_path)
+
+        self._next_row = {dim: len(recs) for dim, recs in by_dim.items()}
+        for dim in by_dim:
+            self._open_matrix(dim)
+        self._dead = 0
+        print(f"[Memory] Compacted store to {len(live)} records.")
+
+    def migrate_from_json(self, json_path):
+        """
+        One-time import of the legacy memory_store.json list. The old file is renamed to
+        `<json_path>.migrated` so the import never runs twice.
+        """
+        if self.exists() or not os.path.exists(json_path):
+            return 0
+
+        try:
+            with open(json_path, 'r') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"[Memory] Could not read legacy store {json_path}: {e}")
+            return 0
+
+        if not isinstance(data, list):
+            data = []
+
+        seen = set()
+        count = 0
+        for i, mem in enumerate(data):
+            if not mem.get('prompt') or not mem.get('response'):
+                continue
+            mem_id = mem.get('id') or f"legacy-{i}"
+            if mem_id in seen:
+                mem_id = f"{mem_id}-{i}"
+            seen.add(mem_id)
+            self.append({
+                "id": mem_id,
+                "prompt": mem['prompt'],
+                "response": mem['response'],
+                "embedding": mem.get('embedding'),
+                "metadata": mem.get('metadata') or {},
+                "timestamp": mem.get('timestamp', 0),
+            })
+            count += 1
+
+        os.replace(json_path, f"{json_path}.migrated")
+        print(f"[Memory] Migrated {count} memories from {json_path}.")
+        return count
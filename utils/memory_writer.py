@@ -0,0 +1,152 @@
+import os
+import time
+import queue
+import atexit
+import threading
+
+# Configuration
+MEMORY_WRITE_BEHIND = os.getenv("MEMORY_WRITE_BEHIND", "True").lower() == "true"
+MEMORY_WRITE_QUEUE_SIZE = int(os.getenv("MEMORY_WRITE_QUEUE_SIZE", 256))
+MEMORY_FLUSH_INTERVAL = float(os.getenv("MEMORY_FLUSH_INTERVAL", 2.0))     # Seconds between flushes
+MEMORY_WRITE_BATCH = int(os.getenv("MEMORY_WRITE_BATCH", 16))              # Flush early at this many jobs
+MEMORY_ENQUEUE_TIMEOUT = float(os.getenv("MEMORY_ENQUEUE_TIMEOUT", 0.5))   # Max caller block when full
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue drained by a background thread. Jobs are handed to `process_batch(jobs)`
+    every `flush_interval` seconds, or sooner once `batch_size` jobs are waiting.
+
+    When the queue is full, `submit` blocks the caller for at most `enqueue_timeout` seconds
+    and then drops the job. Both cases are counted in `stats()` so backpressure is visible.
+    Pending jobs are flushed at interpreter exit.
+    """
+
+    def __init__(self, process_batch, name="write-behind", maxsize=MEMORY_WRITE_QUEUE_SIZE,
+                 flush_interval=MEMORY_FLUSH_INTERVAL, batch_size=MEMORY_WRITE_BATCH,
+                 enqueue_timeout=MEMORY_ENQUEUE_TIMEOUT):
+        self.process_batch = process_batch
+        self.name = name
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._flush_requested = threading.Event()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stopped = False
+
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.blocked = 0          # submits that found the queue full
+        self.blocked_seconds = 0.0
+        self.high_watermark = 0
+        self.last_flush_seconds = 0.0
+
+        atexit.register(self.close)
+
+    def _ensure_worker(self):
+        if self._worker and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if not (self._worker and self._worker.is_alive()):
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def submit(self, job):
+        """
+        Enqueues a job. Returns False if it was dropped because the queue stayed full.
+        """
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.blocked += 1
+            start = time.monotonic()
+            try:
+                self._queue.put(job, timeout=self.enqueue_timeout)
+            except queue.Full:
+                self.dropped += 1
+                print(f"[Memory] Write queue full ({self._queue.maxsize}). Dropping memory.")
+                return False
+            finally:
+                self.blocked_seconds += time.monotonic() - start
+
+        self.submitted += 1
+        self.high_watermark = max(self.high_watermark, self._queue.qsize())
+        if self._queue.qsize() >= self.batch_size:
+            self._flush_requested.set()
+        return True
+
+    def _drain(self):
+        jobs = []
+        while len(jobs) < max(self.batch_size, 1):
+            try:
+                jobs.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+
+    def _process(self, jobs):
+        start = time.monotonic()
+        try:
+            self.process_batch(jobs)
+            self.processed += len(jobs)
+        except Exception as e:
+            self.failed += len(jobs)
+            print(f"[Memory] Background write failed: {e}")
+        finally:
+            self.last_flush_seconds = time.monotonic() - start
+            for _ in jobs:
+                self._queue.task_done()
+
+    def _run(self):
+        while True:
+            self._flush_requested.wait(timeout=self.flush_interval)
+            self._flush_requested.clear()
+            while True:
+                jobs = self._drain()
+                if not jobs:
+                    break
+                self._process(jobs)
+
+    def flush(self, timeout=None):
+        """
+        Blocks until every job submitted so far has been processed (or `timeout` expires).
+        Returns True if the queue fully drained.
+        """
+        if self._queue.unfinished_tasks == 0:
+            return True
+        self._ensure_worker()
+        self._flush_requested.set()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            self._flush_requested.set()
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout=30):
+        if self._stopped:
+            return
+        self._stopped = True
+        if not self.flush(timeout=timeout):
+            print(f"[Memory] Exit flush timed out with {self._queue.unfinished_tasks} pending writes.")
+
+    def stats(self):
+        return {
+            "depth": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "high_watermark": self.high_watermark,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "blocked": self.blocked,
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "last_flush_seconds": round(self.last_flush_seconds, 3),
+        }
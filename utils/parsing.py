@@ -0,0 +1,176 @@
+import os
+import io
+import time
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import PyPDF2
+from bs4 import BeautifulSoup
+from utils.content_extract import extract_main_content
+
+# --- Configuration ---
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", 150))
+# Text kept per PDF: stage 3 ranks 15k-char chunks, so a dozen chunks is plenty to choose from
+DOC_MAX_CHARS = int(os.getenv("DOC_MAX_CHARS", 180000))
+# Parsing is CPU-bound (BeautifulSoup, PyPDF2), so it runs in worker processes. 0 parses in the calling thread.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 20))  # Larger PDFs are split across workers
+# Keep only the article body of HTML pages (utils/content_extract.py); False keeps the whole page text
+HTML_MAIN_CONTENT = os.getenv("HTML_MAIN_CONTENT", "True").lower() == "true"
+# Workers are started from a clean server process, never forked from the app: a fork would copy
+# its threads' held locks and open SQLite connections into the child
+PARSE_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Worker functions below must stay importable without side effects: they run in child processes.
+
+
+def is_pdf(content, content_type, url):
+    return 'application/pdf' in content_type or url.lower().endswith('.pdf') or content[:5] == b'%PDF-'
+
+
+def parse_pdf_pages(content, start=0, stop=PDF_MAX_PAGES, max_chars=DOC_MAX_CHARS):
+    """
+    Text of pages [start, stop), joined once; stops early after max_chars characters.
+    """
+    with io.BytesIO(content) as open_pdf_file:
+        reader = PyPDF2.PdfReader(open_pdf_file)
+        parts = []
+        collected = 0
+        for i in range(start, min(stop, len(reader.pages))):
+            if collected >= max_chars:
+                break
+            page_text = (reader.pages[i].extract_text() or "") + "\n"
+            parts.append(page_text)
+            collected += len(page_text)
+        return "".join(parts)
+
+
+def parse_html(content):
+    """
+    Whole-page text: everything but scripts and styles.
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+    # Kill all script and style elements
+    for script in soup(["script", "style"]):
+        script.decompose()
+    text = soup.get_text()
+    # Break into lines and remove leading and trailing space on each
+    lines = (line.strip() for line in text.splitlines())
+    # Break multi-headlines into a line each
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    # Drop blank lines
+    text = '\n'.join(chunk for chunk in chunks if chunk)
+    return text
+
+
+def parse_html_document(content):
+    """
+    Article text of an HTML page, or the whole page when no main content block stands out.
+    """
+    if HTML_MAIN_CONTENT:
+        text = extract_main_content(content)
+        if text:
+            return text
+    return parse_html(content)
+
+
+def parse_content(content, content_type, url):
+    """
+    Extracts text from downloaded bytes in the current process. Handles HTML and basic PDF parsing.
+    """
+    if is_pdf(content, content_type, url):
+        try:
+            return parse_pdf_pages(content)
+        except Exception as e:
+            print(f"Error parsing PDF {url}: {e}")
+            return ""
+    # Assume HTML
+    return parse_html_document(content)
+
+
+class ParsePool:
+    """
+    Bounded process pool for document parsing: bytes go in, text comes out.
+    PDFs longer than PDF_PAGES_PER_TASK pages are split into page ranges parsed in parallel;
+    ranges are submitted in order, at most `workers` at a time, and the rest are skipped once
+    DOC_MAX_CHARS characters have been collected.
+    """
+
+    def __init__(self, workers=PARSE_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.parse_seconds = 0.0
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context(PARSE_START_METHOD)
+                )
+                atexit.register(self.close)
+            return self._executor
+
+    def _parse_pdf(self, content, url):
+        with io.BytesIO(content) as open_pdf_file:
+            pages = min(len(PyPDF2.PdfReader(open_pdf_file).pages), PDF_MAX_PAGES)
+
+        pool = self._pool()
+        ranges = [(start, min(start + PDF_PAGES_PER_TASK, pages)) for start in range(0, pages, PDF_PAGES_PER_TASK)]
+        in_flight = [pool.submit(parse_pdf_pages, content, a, b) for a, b in ranges[:self.workers]]
+        queued = ranges[self.workers:]
+
+        parts = []
+        collected = 0
+        while in_flight:
+            text = in_flight.pop(0).result()
+            parts.append(text)
+            collected += len(text)
+            if collected >= DOC_MAX_CHARS:
+                for future in in_flight:
+                    future.cancel()
+                break
+            if queued:
+                a, b = queued.pop(0)
+                in_flight.append(pool.submit(parse_pdf_pages, content, a, b))
+        return "".join(parts)
+
+    def parse(self, content, content_type, url):
+        """
+        Returns (text, seconds spent parsing).
+        """
+        start = time.time()
+        if self.workers <= 0:
+            text = parse_content(content, content_type, url)
+        elif is_pdf(content, content_type, url):
+            try:
+                text = self._parse_pdf(content, url)
+            except Exception as e:
+                print(f"Error parsing PDF {url}: {e}")
+                text = ""
+        else:
+            text = self._pool().submit(parse_html_document, content).result()
+
+        elapsed = time.time() - start
+        with self._lock:
+            self.documents += 1
+            self.parse_seconds += elapsed
+        return text, elapsed
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "documents": self.documents,
+            "parse_seconds": round(self.parse_seconds, 2),
+        }
+
+
+parse_pool = ParsePool()
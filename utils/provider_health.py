@@ -0,0 +1,205 @@
+import os
+import re
+import time
+import threading
+from collections import deque
+
+# Configuration
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 3))  # Consecutive failures to open
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", 30))                 # Base open time (seconds)
+BREAKER_MAX_COOLDOWN = float(os.getenv("BREAKER_MAX_COOLDOWN", 600))
+LATENCY_WINDOW = 200  # Recent successful latencies kept per provider
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_RETRY_IN_PATTERN = re.compile(r"(?:try again|retry)[^0-9]{0,20}(?:(\d+)m)?(\d+(?:\.\d+)?)\s*(ms|s)", re.IGNORECASE)
+
+
+def is_rate_limit_error(error):
+    msg = str(error)
+    return "429" in msg or "rate limit" in msg.lower() or "ResourceExhausted" in msg or "QuotaExceeded" in msg
+
+
+def is_config_error(error):
+    # Missing keys / models won't fix themselves within a normal cooldown
+    msg = str(error).lower()
+    return isinstance(error, (ValueError, PermissionError)) and ("not found" in msg or "unauthorized" in msg or "invalid" in msg)
+
+
+def parse_retry_after(error):
+    """
+    Extracts a wait time in seconds from a provider error, if it carries one.
+    Checks the HTTP Retry-After header (Groq/Anthropic SDK errors expose `.response`)
+    and falls back to messages like "Please try again in 1m7.5s".
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+
+    match = _RETRY_IN_PATTERN.search(str(error))
+    if match:
+        minutes, amount, unit = match.groups()
+        seconds = float(amount) / 1000 if unit == "ms" else float(amount)
+        return seconds + (int(minutes) * 60 if minutes else 0)
+    return None
+
+
+class CircuitBreaker:
+    """
+    Per-provider breaker shared by every thread.
+
+    closed    -> calls flow; `failure_threshold` consecutive failures (or one rate-limit) open it.
+    open      -> calls are skipped until the cooldown (Retry-After when known) expires.
+    half_open -> a single trial call is let through; success closes, failure re-opens
+                 with a doubled cooldown.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 cooldown=BREAKER_COOLDOWN, max_cooldown=BREAKER_MAX_COOLDOWN):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.open_count = 0          # consecutive opens, drives the backoff
+        self.opened_until = 0.0
+        self._trial_in_flight = False
+
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.skipped = 0
+        self.last_error = None
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def allow(self):
+        """
+        Returns True if a call may be made now. Moves open -> half_open after the cooldown
+        and admits only one trial call while half-open.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() >= self.opened_until:
+                self.state = HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.skipped += 1
+            return False
+
+    def record_success(self, latency):
+        with self._lock:
+            self.calls += 1
+            self.successes += 1
+            self.latencies.append(latency)
+            self.consecutive_failures = 0
+            self.open_count = 0
+            self.state = CLOSED
+            self._trial_in_flight = False
+
+    def release(self):
+        """
+        Gives back a half-open trial slot when the call was cancelled before it finished.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)[:200]
+
+            rate_limited = is_rate_limit_error(error)
+            if rate_limited:
+                self.rate_limited += 1
+
+            # A rate limit (often minutes on Groq's free tier) opens the breaker right away with
+            # the provider's Retry-After, so callers fail over immediately instead of sleeping
+            if self.state == HALF_OPEN or rate_limited or is_config_error(error) \
+                    or self.consecutive_failures >= self.failure_threshold:
+                self._open(error, rate_limited)
+
+    def _open(self, error, rate_limited):
+        # Caller holds self._lock
+        if is_config_error(error):
+            cooldown = self.max_cooldown
+        else:
+            cooldown = min(self.base_cooldown * (2 ** self.open_count), self.max_cooldown)
+            retry_after = parse_retry_after(error) if rate_limited else None
+            if retry_after is not None:
+                cooldown = min(retry_after, self.max_cooldown)
+
+        self.state = OPEN
+        self.open_count += 1
+        self.opened_until = time.time() + cooldown
+        self._trial_in_flight = False
+
+    def retry_in(self):
+        if self.state != OPEN:
+            return 0.0
+        return max(self.opened_until - time.time(), 0.0)
+
+    def latency_percentile(self, pct):
+        with self._lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+        idx = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[idx]
+
+    def stats(self):
+        p50 = self.latency_percentile(50)
+        p95 = self.latency_percentile(95)
+        return {
+            "state": self.state,
+            "retry_in": round(self.retry_in(), 1),
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited,
+            "skipped": self.skipped,
+            "error_rate": round(self.failures / self.calls, 3) if self.calls else 0.0,
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p95": round(p95, 3) if p95 is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class ProviderHealth:
+    """
+    Process-wide registry of circuit breakers keyed by STAGE_CONFIG model id
+    ('groq', 'anthropic', 'ollama:qwen2.5', ...).
+    """
+
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_id):
+        breaker = self._breakers.get(model_id)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(model_id, CircuitBreaker(model_id))
+        return breaker
+
+    def stats(self):
+        return {name: breaker.stats() for name, breaker in list(self._breakers.items())}
+
+
+provider_health = ProviderHealth()
@@ -0,0 +1,168 @@
+import os
+import time
+import asyncio
+import threading
+
+# Default (requests/min, tokens/min) per provider. 0 disables that bucket.
+# Override with RATE_LIMIT_<PROVIDER>_RPM / RATE_LIMIT_<PROVIDER>_TPM, e.g. RATE_LIMIT_GROQ_TPM=12000.
+# Every 'ollama:<model>' id gets its own limiter with the OLLAMA limits.
+DEFAULT_LIMITS = {
+    "groq": (30, 12000),
+    "anthropic": (50, 40000),
+    "gemini": (15, 1000000),
+    "ollama": (0, 0),
+}
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", 30))  # Longer waits fail over instead
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("RATE_LIMIT_EXPECTED_OUTPUT_TOKENS", 1024))
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English prose
+    return max(len(text) // 4, 1)
+
+
+class LocalRateLimitError(Exception):
+    """
+    Raised when a request would have to wait longer than RATE_LIMIT_MAX_WAIT for budget.
+    The message mirrors provider 429s so the circuit breaker opens for the wait time.
+    """
+
+
+class TokenBucket:
+    """
+    Continuously refilling bucket holding at most `per_minute` units.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        amount = min(amount, self.capacity)  # A single oversized request must still be admissible
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        # Can go negative when settling actual usage; later callers then wait it out
+        self.level -= min(amount, self.capacity)
+
+
+class ProviderRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets for one provider, shared by all threads.
+    """
+
+    def __init__(self, name, rpm, tpm):
+        self.name = name
+        self.rpm = TokenBucket(rpm) if rpm else None
+        self.tpm = TokenBucket(tpm) if tpm else None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.rejected = 0
+
+    def _try_acquire(self, tokens, start, waited, max_wait):
+        """
+        Consumes budget and returns 0 if available, otherwise returns the seconds to wait.
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = max(
+                self.rpm.wait_time(1, now) if self.rpm else 0.0,
+                self.tpm.wait_time(tokens, now) if self.tpm else 0.0,
+            )
+            if delay == 0:
+                if self.rpm: self.rpm.take(1)
+                if self.tpm: self.tpm.take(tokens)
+                self.requests += 1
+                self.tokens += tokens
+                if waited:
+                    self.waits += 1
+                    self.wait_seconds += now - start
+                return 0.0
+            if now - start + delay > max_wait:
+                self.rejected += 1
+                raise LocalRateLimitError(
+                    f"Rate limit (local {self.name} budget) exhausted. Please try again in {delay:.1f}s"
+                )
+            return delay
+
+    def acquire(self, tokens, max_wait=RATE_LIMIT_MAX_WAIT):
+        """
+        Blocks until one request and `tokens` tokens are available, then consumes them.
+        Raises LocalRateLimitError if that would take longer than `max_wait` seconds.
+        """
+        start = time.monotonic()
+        delay = self._try_acquire(tokens, start, False, max_wait)
+        while delay:
+            time.sleep(min(delay, 1.0))
+            delay = self._try_acquire(tokens, start, True, max_wait)
+
+    async def acquire_async(self, tokens, max_wait=RATE_LIMIT_MAX_WAIT):
+        """
+        Same as acquire() but yields to the event loop while waiting.
+        """
+        start = time.monotonic()
+        delay = self._try_acquire(tokens, start, False, max_wait)
+        while delay:
+            await asyncio.sleep(min(delay, 1.0))
+            delay = self._try_acquire(tokens, start, True, max_wait)
+
+    def settle(self, reserved, actual):
+        """
+        Corrects the token bucket once the provider reports real usage.
+        """
+        if not self.tpm or actual is None:
+            return
+        with self._lock:
+            self.tpm.take(actual - reserved)
+            self.tokens += actual - reserved
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "tokens": self.tokens,
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 2),
+            "rejected": self.rejected,
+            "rpm_available": round(self.rpm.level, 1) if self.rpm else None,
+            "tpm_available": round(self.tpm.level, 1) if self.tpm else None,
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _limits_for(provider):
+    rpm, tpm = DEFAULT_LIMITS.get(provider, (0, 0))
+    prefix = f"RATE_LIMIT_{provider.upper()}"
+    return int(os.getenv(f"{prefix}_RPM", rpm)), int(os.getenv(f"{prefix}_TPM", tpm))
+
+
+def get_limiter(model_id):
+    """
+    Returns the process-wide limiter for a STAGE_CONFIG model id ('groq', 'ollama:qwen2.5', ...).
+    """
+    limiter = _limiters.get(model_id)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(model_id)
+            if limiter is None:
+                rpm, tpm = _limits_for(model_id.split(':', 1)[0])
+                limiter = _limiters[model_id] = ProviderRateLimiter(model_id, rpm, tpm)
+    return limiter
+
+
+def rate_limit_stats():
+    return {name: limiter.stats() for name, limiter in list(_limiters.items())}
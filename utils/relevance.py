@@ -0,0 +1,93 @@
+import re
+import math
+from collections import Counter
+
+# Lexical relevance scoring that runs on the CPU in milliseconds (no LLM or embedding calls).
+
+STOPWORDS = {
+    "the", "and", "for", "are", "with", "that", "this", "from", "was", "were", "which", "have", "has",
+    "not", "but", "can", "its", "into", "their", "these", "those", "than", "then", "also", "such",
+    "using", "use", "used", "based", "our", "they", "been", "being", "more", "most", "other", "all",
+    "any", "may", "how", "what", "when", "where", "who", "why", "will", "would", "should", "could",
+    "between", "about", "over", "under", "each", "both", "only", "some", "there", "here", "via",
+}
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Bibliography noise: [12], "et al.", years, DOIs, URLs, "pp."
+_CITATION_PATTERN = re.compile(r"\[\d+(?:[,–-]\s*\d+)*\]|\bet al\b|\b(?:19|20)\d{2}\b|\bdoi\b|https?://|\bpp\.", re.IGNORECASE)
+
+
+def _stem(word):
+    # Plural folding only: enough for "transformers" to match "transformer"
+    if len(word) > 4 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [_stem(w) for w in _TOKEN_PATTERN.findall(text.lower()) if len(w) > 2 and w not in STOPWORDS]
+
+
+class BM25:
+    """
+    Okapi BM25 over a small in-memory corpus of token lists.
+    """
+
+    def __init__(self, corpus_tokens, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokens) for tokens in corpus_tokens]
+        self.lengths = [len(tokens) for tokens in corpus_tokens]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        doc_freq = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(self.term_freqs)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def scores(self, query_tokens):
+        query = set(query_tokens)
+        results = []
+        for tf, length in zip(self.term_freqs, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            score = 0.0
+            for term in query:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            results.append(score)
+        return results
+
+
+def information_density(text):
+    """
+    0..1 estimate of how much prose a chunk holds: share of characters in words, discounted
+    by citation markers (reference lists, front matter) and by repetitive vocabulary.
+    """
+    if not text:
+        return 0.0
+    words = re.findall(r"[A-Za-z]{2,}", text)
+    if not words:
+        return 0.0
+
+    alpha_ratio = sum(len(w) for w in words) / len(text)
+    citation_ratio = min(len(_CITATION_PATTERN.findall(text)) * 40 / len(text), 1.0)
+    sample = [w.lower() for w in words[:2000]]
+    diversity = min(len(set(sample)) / len(sample) / 0.3, 1.0)  # Prose sits around 0.3+ unique
+    return alpha_ratio * (1 - citation_ratio) * diversity
+
+
+def rank_texts(texts, query, relevance_weight=0.7):
+    """
+    Returns one score per text: normalized BM25 similarity to `query` blended with
+    information_density. Without query terms only density counts.
+    """
+    density = [information_density(t) for t in texts]
+    query_tokens = tokenize(query or "")
+    if not query_tokens:
+        return density
+
+    bm25 = BM25([tokenize(t) for t in texts]).scores(query_tokens)
+    top = max(bm25) or 1.0
+    return [relevance_weight * (s / top) + (1 - relevance_weight) * d for s, d in zip(bm25, density)]
@@ -1,21 +1,32 @@
 import os
-import requests
-from bs4 import BeautifulSoup
-import io
-import PyPDF2
 from dotenv import load_dotenv
+from utils.http_client import http_client
+from utils.doc_cache import doc_cache, content_hash
+from utils.search_cache import search_cache
+from utils.parsing import parse_pool, is_pdf
 
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID")
 
+# Download limits (PDF page/character limits live in utils/parsing.py)
+DOWNLOAD_MAX_BYTES = int(os.getenv("DOWNLOAD_MAX_BYTES", 20 * 1024 * 1024))
+SKIP_CONTENT_TYPES = ('image/', 'video/', 'audio/', 'font/', 'application/zip',
+                      'application/x-tar', 'application/gzip', 'application/vnd.ms-powerpoint')
+
 def google_search(query, num_results=5):
     """
     Performs a Google Custom Search.
+    Results are cached per (provider, normalized query, num_results) in utils/search_cache.py,
+    and a provider that just failed is skipped for SEARCH_PROVIDER_BACKOFF seconds.
     """
 
     def run_ddg_fallback(query):
+        if search_cache:
+            cached = search_cache.get("ddg", query, num_results)
+            if cached is not None:
+                return cached
         print(f"  [Search] Using DuckDuckGo (Fallback) for: '{query}'")
         try:
             from duckduckgo_search import DDGS
@@ -29,8 +40,11 @@ def google_search(query, num_results=5):
                         'link': r.get('href'),
                         'snippet': r.get('body')
                     })
+                if search_cache:
+                    search_cache.put("ddg", query, num_results, mapped_results)
                 return mapped_results
         except Exception as e:
+            # DDG is the last resort, so it is always tried rather than backed off
             print(f"  [Search] DDG Failed: {e}")
             return []
 
@@ -38,6 +52,13 @@ def google_search(query, num_results=5):
     if not GOOGLE_API_KEY or GOOGLE_API_KEY.startswith("gsk_"):
         return run_ddg_fallback(query)
 
+    if search_cache:
+        cached = search_cache.get("google", query, num_results)
+        if cached is not None:
+            return cached
+        if search_cache.provider_down("google"):
+            return run_ddg_fallback(query)
+
     params = {
         'key': GOOGLE_API_KEY,
         'cx': GOOGLE_CSE_ID,
@@ -47,52 +68,110 @@ def google_search(query, num_results=5):
 
     url = "https://www.googleapis.com/customsearch/v1"
     try:
-        response = requests.get(url, params=params)
+        response = http_client.get(url, params=params)
         response.raise_for_status()
-        return response.json().get('items', [])
+        items = response.json().get('items', [])
+        if search_cache:
+            search_cache.put("google", query, num_results, items)
+        return items
     except Exception as e:
         print(f"Error performing Google Search: {e}")
+        if search_cache:
+            search_cache.mark_failed("google", e)
         # Fallback to DDG on API error too
         return run_ddg_fallback(query)
 
+def read_capped(response, max_bytes=DOWNLOAD_MAX_BYTES):
+    """
+    Streams the body in chunks, stopping after max_bytes. Returns (content, truncated).
+    """
+    parts = []
+    size = 0
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        parts.append(chunk)
+        size += len(chunk)
+        if size > max_bytes:
+            return b"".join(parts)[:max_bytes], True
+    return b"".join(parts), False
+
+def _consume_document(url, response, cached):
+    """
+    Reads a streamed response into a download record: skips non-document types from the
+    headers before reading the body, enforces DOWNLOAD_MAX_BYTES and resolves cache hits.
+    """
+    if response.status_code == 304 and cached:
+        doc_cache.mark_revalidated(url)
+        return {"url": url, "text": cached['text']}
+    response.raise_for_status()
+    
+    content_type = response.headers.get('Content-Type', '').lower()
+    if content_type.startswith(SKIP_CONTENT_TYPES):
+        print(f"  [Download] Skipping {content_type.split(';')[0]}: {url}")
+        return {"url": url, "text": ""}
+    
+    declared = int(response.headers.get('Content-Length') or 0)
+    if declared > DOWNLOAD_MAX_BYTES and is_pdf(b"", content_type, url):
+        # A cut-off PDF has no cross-reference table and cannot be parsed
+        print(f"  [Download] Skipping {declared // 1024} KB PDF over the {DOWNLOAD_MAX_BYTES // 1024} KB cap: {url}")
+        return {"url": url, "text": ""}
+    
+    content, truncated = read_capped(response)
+    if truncated:
+        if is_pdf(content, content_type, url):
+            print(f"  [Download] PDF exceeded {DOWNLOAD_MAX_BYTES // 1024} KB cap, skipping: {url}")
+            return {"url": url, "text": ""}
+        print(f"  [Download] Truncated at {DOWNLOAD_MAX_BYTES // 1024} KB: {url}")
+    
+    digest = content_hash(content)
+    text = doc_cache.text_for_hash(digest) if doc_cache else None
+    return {
+        "url": url,
+        "text": text,
+        "content": content,
+        "content_type": content_type,
+        "digest": digest,
+        "etag": response.headers.get('ETag'),
+        "last_modified": response.headers.get('Last-Modified'),
+    }
+
+def download_document(url):
+    """
+    Network half of download_and_parse. Returns a record with either 'text' (cache hit)
+    or the raw 'content' to hand to parse_document. Raises on HTTP errors.
+    """
+    cached = doc_cache.lookup(url) if doc_cache else None
+    if cached and cached['fresh']:
+        return {"url": url, "text": cached['text']}
+    
+    # Shared keep-alive pool; browser User-Agent is set on the session
+    headers = doc_cache.conditional_headers(cached) if cached else {}
+    return http_client.get(url, headers=headers, consume=lambda response: _consume_document(url, response, cached))
+
+def parse_document(download):
+    """
+    CPU half of download_and_parse: parses the bytes in the parse process pool and caches
+    the text. Returns (text, parse_seconds); cache hits take no parse time.
+    """
+    if download.get('text') is not None:
+        if doc_cache and download.get('digest'):
+            # Same bytes already parsed under another URL: remember this URL too
+            doc_cache.put(download['url'], download['digest'], download['text'],
+                          download.get('etag'), download.get('last_modified'))
+        return download['text'], 0.0
+    
+    text, seconds = parse_pool.parse(download['content'], download['content_type'], download['url'])
+    if doc_cache:
+        doc_cache.put(download['url'], download['digest'], text, download.get('etag'), download.get('last_modified'))
+    return text, seconds
+
 def download_and_parse(url):
     """
     Downloads content from a URL and extracts text.
-    Handles HTML and basic PDF parsing.
+    Parsed text is cached on disk (utils/doc_cache.py): fresh entries skip the network,
+    stale ones are revalidated with a conditional GET, and already-seen bytes skip parsing.
     """
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        content_type = response.headers.get('Content-Type', '').lower()
-        
-        if 'application/pdf' in content_type or url.endswith('.pdf'):
-            try:
-                with io.BytesIO(response.content) as open_pdf_file:
-                    reader = PyPDF2.PdfReader(open_pdf_file)
-                    text = ""
-                    for page in reader.pages:
-                        text += page.extract_text() + "\n"
-                    return text
-            except Exception as e:
-                print(f"Error parsing PDF {url}: {e}")
-                return ""
-        else:
-            # Assume HTML
-            soup = BeautifulSoup(response.content, 'html.parser')
-            # Kill all script and style elements
-            for script in soup(["script", "style"]):
-                script.decompose()
-            text = soup.get_text()
-            # Break into lines and remove leading and trailing space on each
-            lines = (line.strip() for line in text.splitlines())
-            # Break multi-headlines into a line each
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            # Drop blank lines
-            text = '\n'.join(chunk for chunk in chunks if chunk)
-            return text
-
+        return parse_document(download_document(url))[0]
     except Exception as e:
         print(f"Error downloading {url}: {e}")
         return ""
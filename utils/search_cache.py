@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "True").lower() == "true"
+SEARCH_CACHE_FILE = os.getenv("SEARCH_CACHE_FILE", "search_cache.db")
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 3 * 24 * 3600))        # Seconds a result list stays valid
+SEARCH_PROVIDER_BACKOFF = int(os.getenv("SEARCH_PROVIDER_BACKOFF", 600))    # Seconds a failed provider is skipped
+
+
+def normalize_query(query):
+    # Case and spacing do not change what the engines return
+    return " ".join(query.lower().split())
+
+
+class SearchCache:
+    """
+    On-disk cache of search results keyed by (provider, normalized query, num_results), plus a
+    short-lived record of providers that just failed so callers can skip them instead of
+    paying for a doomed request before every fallback.
+    """
+
+    def __init__(self, cache_file=SEARCH_CACHE_FILE, ttl=SEARCH_CACHE_TTL, backoff=SEARCH_PROVIDER_BACKOFF):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.backoff = backoff
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+        self._conn = sqlite3.connect(cache_file, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS searches (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT,
+                    query TEXT,
+                    num_results INTEGER,
+                    results TEXT,
+                    created_at REAL
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS provider_failures (
+                    provider TEXT PRIMARY KEY,
+                    reason TEXT,
+                    until REAL
+                )
+                """
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(provider, query, num_results):
+        return hashlib.sha256(f"{provider}\x00{normalize_query(query)}\x00{num_results}".encode("utf-8")).hexdigest()
+
+    def get(self, provider, query, num_results):
+        key = self.make_key(provider, query, num_results)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT results, created_at FROM searches WHERE key = ?", (key,)
+            ).fetchone()
+            if not row or time.time() - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, provider, query, num_results, results):
+        # Empty lists are usually a failure in disguise (DDG rate limit), so they are not kept
+        if not results:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO searches (key, provider, query, num_results, results, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.make_key(provider, query, num_results), provider, normalize_query(query),
+                 num_results, json.dumps(results), now),
+            )
+            self._conn.execute("DELETE FROM searches WHERE created_at < ?", (now - self.ttl,))
+            self._conn.commit()
+
+    def mark_failed(self, provider, reason=""):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO provider_failures (provider, reason, until) VALUES (?, ?, ?)",
+                (provider, str(reason)[:200], time.time() + self.backoff),
+            )
+            self._conn.commit()
+        print(f"  [Search] {provider} failed; skipping it for {self.backoff}s.")
+
+    def provider_down(self, provider):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT until FROM provider_failures WHERE provider = ?", (provider,)
+            ).fetchone()
+            down = bool(row) and row[0] > time.time()
+            if down:
+                self.skipped += 1
+        return down
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM searches")
+            self._conn.execute("DELETE FROM provider_failures")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM searches").fetchone()[0]
+            down = [p for p, in self._conn.execute(
+                "SELECT provider FROM provider_failures WHERE until > ?", (time.time(),))]
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped_provider_calls": self.skipped,
+            "providers_down": down,
+        }
+
+
+search_cache = SearchCache() if SEARCH_CACHE_ENABLED else None
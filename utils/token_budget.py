@@ -0,0 +1,133 @@
+import os
+from utils.rate_limit import get_limiter, EXPECTED_OUTPUT_TOKENS
+
+# --- Configuration ---
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", 8192))  # Context window requested from Ollama
+BUDGET_SAFETY = float(os.getenv("TOKEN_BUDGET_SAFETY", 0.9))  # Share of a model's limit we plan to fill
+# Stage content stays within the character slices the prompts used before token budgets
+# (e.g. 25k chars of paper for review); True lets it grow to the model's whole context window
+PROMPT_FULL_CONTEXT = os.getenv("PROMPT_FULL_CONTEXT", "False").lower() == "true"
+
+# Context window (tokens, input + output) per provider
+MODEL_CONTEXT_TOKENS = {
+    "groq": 128000,
+    "anthropic": 200000,
+    "gemini": 1000000,
+    "ollama": OLLAMA_NUM_CTX,
+}
+
+# Average characters per token on English/academic text for each provider's tokenizer,
+# rounded down so counts err on the high side
+CHARS_PER_TOKEN = {
+    "groq": 3.6,       # Llama 3 tokenizer
+    "anthropic": 3.4,
+    "gemini": 3.8,
+    "ollama": 3.4,     # Mixed model families; assume the least efficient
+}
+
+# Reply size reserved inside the context window; everything else uses EXPECTED_OUTPUT_TOKENS
+STAGE_OUTPUT_TOKENS = {
+    "generation": 4096,
+    "synthesis": 2048,
+}
+
+TRIM_MARKER = "\n[... trimmed to fit the model's context ...]\n"
+
+
+def provider_of(model_id):
+    return model_id.split(':', 1)[0]
+
+
+def count_tokens(text, model_id="ollama"):
+    return int(len(text) / CHARS_PER_TOKEN.get(provider_of(model_id), CHARS_PER_TOKEN['ollama'])) + 1
+
+
+def context_window(model_id):
+    return MODEL_CONTEXT_TOKENS.get(provider_of(model_id), MODEL_CONTEXT_TOKENS['ollama'])
+
+
+def output_tokens_for(stage):
+    return STAGE_OUTPUT_TOKENS.get(stage, EXPECTED_OUTPUT_TOKENS)
+
+
+def input_limit(model_id, output_tokens=EXPECTED_OUTPUT_TOKENS):
+    """
+    Largest prompt (tokens) one request to model_id may carry: its context window minus the
+    reply, and no more than the provider accepts per minute (Groq rejects larger requests with 413).
+    """
+    limit = context_window(model_id) - output_tokens
+    tpm = get_limiter(model_id).tpm
+    if tpm:
+        limit = min(limit, tpm.capacity - output_tokens)
+    return max(int(limit * BUDGET_SAFETY), 256)
+
+
+def truncate_tokens(text, max_tokens, model_id="ollama"):
+    """
+    Keeps the head of text within max_tokens.
+    """
+    if count_tokens(text, model_id) <= max_tokens:
+        return text
+    ratio = CHARS_PER_TOKEN.get(provider_of(model_id), CHARS_PER_TOKEN['ollama'])
+    return text[:max(int((max_tokens - 1) * ratio), 0)]
+
+
+def fit_prompt(prompt, model_id, output_tokens=EXPECTED_OUTPUT_TOKENS):
+    """
+    Last-resort guard before a request goes out: cuts the middle of an oversize prompt so the
+    instructions at the start and the output format at the end survive.
+    """
+    limit = input_limit(model_id, output_tokens)
+    used = count_tokens(prompt, model_id)
+    if used <= limit:
+        return prompt
+
+    ratio = CHARS_PER_TOKEN.get(provider_of(model_id), CHARS_PER_TOKEN['ollama'])
+    keep = int((limit - count_tokens(TRIM_MARKER, model_id)) * ratio)
+    head = keep * 2 // 3
+    print(f"  [Budget] Prompt of ~{used} tokens exceeds {model_id} limit of {limit}. Trimming middle...")
+    return prompt[:head] + TRIM_MARKER + prompt[len(prompt) - (keep - head):]
+
+
+class PromptBudget:
+    """
+    Token budget for one prompt sent to a model: the input limit minus space reserved
+    for injected memory context. `max_chars` caps the variable parts on top of that
+    (ignored when PROMPT_FULL_CONTEXT is set).
+    """
+
+    def __init__(self, model_id, output_tokens=EXPECTED_OUTPUT_TOKENS, reserved=0, max_chars=None):
+        self.model_id = model_id
+        self.limit = input_limit(model_id, output_tokens) - reserved
+        self.content_limit = None
+        if max_chars is not None and not PROMPT_FULL_CONTEXT:
+            self.content_limit = count_tokens("x" * max_chars, model_id)
+
+    def count(self, text):
+        return count_tokens(text, self.model_id)
+
+    def fit(self, template, parts):
+        """
+        Trims variable prompt parts so template + parts fit the budget.
+        `template` is the prompt rendered with every part empty; `parts` is a list of
+        (text, priority). Lower-priority parts are cut first, each keeping its head.
+        Returns the (possibly shortened) texts in the order given.
+        """
+        available = max(self.limit - self.count(template), 0)
+        if self.content_limit is not None:
+            available = min(available, self.content_limit)
+        sizes = [self.count(text) for text, _ in parts]
+        over = sum(sizes) - available
+        if over <= 0:
+            return [text for text, _ in parts]
+
+        for idx in sorted(range(len(parts)), key=lambda i: parts[i][1]):
+            cut = min(over, sizes[idx])
+            sizes[idx] -= cut
+            over -= cut
+            if over <= 0:
+                break
+        return [truncate_tokens(text, size, self.model_id) for (text, _), size in zip(parts, sizes)]
+
+    def fit_text(self, template, text):
+        return self.fit(template, [(text, 0)])[0]
@@ -0,0 +1,365 @@
+import threading
+import numpy as np
+
+
+class _Partition:
+    """
+    Contiguous float32 matrix of L2-normalized rows for a single embedding dimension.
+    Grows by doubling so inserts are amortized O(dim).
+    """
+
+    def __init__(self, dim, capacity=64):
+        self.dim = dim
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.count = 0
+        self.keys = []        # row -> key
+        self.rows = {}        # key -> row
+
+    def add(self, key, unit_vec):
+        if key in self.rows:
+            self.matrix[self.rows[key]] = unit_vec
+            return
+
+        if self.count == self.matrix.shape[0]:
+            grown = np.zeros((self.matrix.shape[0] * 2, self.dim), dtype=np.float32)
+            grown[:self.count] = self.matrix[:self.count]
+            self.matrix = grown
+
+        self.matrix[self.count] = unit_vec
+        self.rows[key] = self.count
+        self.keys.append(key)
+        self.count += 1
+
+    def remove(self, key):
+        row = self.rows.pop(key, None)
+        if row is None:
+            return False
+
+        # Swap the last row into the hole to keep the matrix dense
+        last = self.count - 1
+        if row != last:
+            self.matrix[row] = self.matrix[last]
+            moved_key = self.keys[last]
+            self.keys[row] = moved_key
+            self.rows[moved_key] = row
+        self.keys.pop()
+        self.count -= 1
+        return True
+
+    def search(self, unit_query, top_k):
+        if self.count == 0:
+            return []
+
+        scores = self.matrix[:self.count] @ unit_query
+        k = min(top_k, self.count)
+        if k < self.count:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(self.count)
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.keys[i]) for i in top]
+
+
+def normalize(vector):
+    vec = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vec)
+    if norm == 0:
+        return vec
+    return vec / norm
+
+
+class FlatIndex:
+    """
+    Exact cosine-similarity index. Rows are normalized once at insert time and kept in one
+    matrix per embedding dimension (Gemini and Ollama embeddings differ in size), so a query
+    is a single matrix-vector product plus argpartition top-k against the matching partition.
+    """
+
+    def __init__(self):
+        self.partitions = {}  # dim -> _Partition
+        self._dims = {}       # key -> dim
+
+    def __len__(self):
+        return len(self._dims)
+
+    def __contains__(self, key):
+        return key in self._dims
+
+    def add(self, key, vector):
+        unit = normalize(vector)
+        dim = unit.shape[0]
+
+        old_dim = self._dims.get(key)
+        if old_dim is not None and old_dim != dim:
+            self.partitions[old_dim].remove(key)
+
+        part = self.partitions.get(dim)
+        if part is None:
+            part = self.partitions[dim] = _Partition(dim)
+        part.add(key, unit)
+        self._dims[key] = dim
+
+    def remove(self, key):
+        dim = self._dims.pop(key, None)
+        if dim is None:
+            return False
+        return self.partitions[dim].remove(key)
+
+    def search(self, vector, top_k=2):
+        """
+        Returns [(score, key), ...] sorted by descending cosine similarity.
+        Only rows with the same dimension as the query are considered.
+        """
+        unit = normalize(vector)
+        part = self.partitions.get(unit.shape[0])
+        if part is None:
+            return []
+        return part.search(unit, top_k)
+
+
+# --- Approximate Index (IVF) ---
+
+IVF_TRAIN_THRESHOLD = 4096  # Below this many rows a partition is searched exactly
+IVF_NPROBE = 4              # Inverted lists scanned per query
+IVF_KMEANS_ITERS = 10
+IVF_TRAIN_SAMPLE = 65536    # Max rows used to fit centroids
+IVF_ASSIGN_BLOCK = 65536    # Rows scored against the centroids at a time
+
+
+def _assign(data, centroids):
+    # Blocked so a 1M-row refit never materializes a full (rows x nlist) score matrix
+    out = np.empty(data.shape[0], dtype=np.int64)
+    for start in range(0, data.shape[0], IVF_ASSIGN_BLOCK):
+        block = data[start:start + IVF_ASSIGN_BLOCK]
+        out[start:start + IVF_ASSIGN_BLOCK] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def _kmeans_cosine(data, nlist, iters=IVF_KMEANS_ITERS, seed=0):
+    """
+    Spherical k-means on unit rows. Returns unit centroids of shape (nlist, dim).
+    """
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(data.shape[0], nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = _assign(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=nlist)
+
+        # Re-seed empty clusters from random rows so every list stays useful
+        empty = np.where(counts == 0)[0]
+        if len(empty):
+            sums[empty] = data[rng.choice(data.shape[0], len(empty), replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+class _IVFPartition:
+    """
+    Inverted-file index for one embedding dimension. Rows are bucketed by their nearest
+    k-means centroid; a query scans only the `nprobe` closest buckets. Each bucket is a
+    dense `_Partition`, so inserts and deletes stay O(dim).
+
+    Centroids are fit on a background thread over a snapshot of the rows; inserts and
+    deletes made meanwhile are logged and replayed onto the new lists, which are then
+    swapped in at once. Until then the current layout (or exact scan) keeps serving.
+    """
+
+    def __init__(self, dim, nprobe=IVF_NPROBE, train_threshold=IVF_TRAIN_THRESHOLD, background=True):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.background = background
+        self.flat = _Partition(dim)  # Used until there is enough data to train
+        self.centroids = None
+        self.lists = []
+        self.list_of = {}            # key -> list index
+        self.trained_size = 0
+        self._lock = threading.Lock()
+        self._changes = None         # Ops made while a fit is running, replayed before the swap
+        self._trainer = None
+
+    @property
+    def count(self):
+        if self.centroids is None:
+            return self.flat.count
+        return len(self.list_of)
+
+    def _snapshot(self):
+        if self.centroids is None:
+            return list(self.flat.keys), self.flat.matrix[:self.flat.count].copy()
+        keys = [key for lst in self.lists for key in lst.keys]
+        data = np.concatenate([lst.matrix[:lst.count] for lst in self.lists])
+        return keys, data
+
+    def _fit(self, keys, data):
+        nlist = int(min(max(np.sqrt(len(keys)), 16), len(keys)))
+        if len(keys) > IVF_TRAIN_SAMPLE:
+            sample = data[np.random.default_rng(0).choice(len(keys), IVF_TRAIN_SAMPLE, replace=False)]
+        else:
+            sample = data
+        centroids = _kmeans_cosine(sample, nlist)
+
+        lists = [_Partition(self.dim, capacity=16) for _ in range(nlist)]
+        list_of = {}
+        for key, vec, li in zip(keys, data, _assign(data, centroids)):
+            lists[li].add(key, vec)
+            list_of[key] = int(li)
+        return centroids, lists, list_of
+
+    def _train_snapshot(self, keys, data):
+        try:
+            centroids, lists, list_of = self._fit(keys, data)
+        except Exception as e:
+            print(f"[Memory] Index training failed: {e}")
+            with self._lock:
+                self._changes = None
+            return
+
+        with self._lock:
+            for op, key, vec in self._changes:
+                li = list_of.pop(key, None)
+                if li is not None:
+                    lists[li].remove(key)
+                if op == "add":
+                    li = int(np.argmax(centroids @ vec))
+                    lists[li].add(key, vec)
+                    list_of[key] = li
+            self.centroids, self.lists, self.list_of = centroids, lists, list_of
+            self.flat = None
+            self.trained_size = len(list_of)
+            self._changes = None
+
+    def train(self, wait=True):
+        """
+        Fits centroids over the current rows. With wait=False the fit runs on a background
+        thread; a fit already in progress is not restarted.
+        """
+        with self._lock:
+            if self._changes is not None:
+                trainer = self._trainer
+            else:
+                keys, data = self._snapshot()
+                if not keys:
+                    return
+                self._changes = []
+                trainer = self._trainer = threading.Thread(
+                    target=self._train_snapshot, args=(keys, data), name="ivf-train", daemon=True
+                )
+                trainer.start()
+        if wait and trainer is not None:
+            trainer.join()
+
+    def wait_for_training(self, timeout=None):
+        trainer = self._trainer
+        if trainer is not None:
+            trainer.join(timeout)
+
+    def add(self, key, unit_vec):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append(("add", key, unit_vec))
+
+            if self.centroids is None:
+                self.flat.add(key, unit_vec)
+                needs_training = self.flat.count >= self.train_threshold
+            else:
+                self._remove_locked(key)
+                li = int(np.argmax(self.centroids @ unit_vec))
+                self.lists[li].add(key, unit_vec)
+                self.list_of[key] = li
+                # Refit once the data has grown well past what the centroids were trained on
+                needs_training = len(self.list_of) >= 4 * self.trained_size
+            needs_training = needs_training and self._changes is None
+
+        if needs_training:
+            self.train(wait=not self.background)
+
+    def remove(self, key):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append(("remove", key, None))
+            return self._remove_locked(key)
+
+    def _remove_locked(self, key):
+        if self.centroids is None:
+            return self.flat.remove(key)
+        li = self.list_of.pop(key, None)
+        if li is None:
+            return False
+        return self.lists[li].remove(key)
+
+    def search(self, unit_query, top_k, nprobe=None):
+        with self._lock:
+            return self._search_locked(unit_query, top_k, nprobe)
+
+    def _search_locked(self, unit_query, top_k, nprobe):
+        if self.centroids is None:
+            return self.flat.search(unit_query, top_k)
+
+        nprobe = min(nprobe or self.nprobe, len(self.lists))
+        centroid_scores = self.centroids @ unit_query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        # Score every probed list, then select top-k once over the concatenation
+        lists = [self.lists[li] for li in probe if self.lists[li].count]
+        if not lists:
+            return []
+        scores = np.concatenate([lst.matrix[:lst.count] @ unit_query for lst in lists])
+        offsets = np.cumsum([0] + [lst.count for lst in lists])
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            owner = int(np.searchsorted(offsets, i, side='right')) - 1
+            results.append((float(scores[i]), lists[owner].keys[i - offsets[owner]]))
+        return results
+
+
+class IVFIndex(FlatIndex):
+    """
+    Approximate cosine-similarity index with the same interface as FlatIndex.
+    Each dimension partition is searched exactly until it holds `train_threshold` rows,
+    then switches to an inverted file over k-means centroids (scanning `nprobe` lists).
+    """
+
+    def __init__(self, nprobe=IVF_NPROBE, train_threshold=IVF_TRAIN_THRESHOLD, background=True):
+        super().__init__()
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.background = background
+
+    def add(self, key, vector):
+        unit = normalize(vector)
+        dim = unit.shape[0]
+
+        old_dim = self._dims.get(key)
+        if old_dim is not None and old_dim != dim:
+            self.partitions[old_dim].remove(key)
+
+        part = self.partitions.get(dim)
+        if part is None:
+            part = self.partitions[dim] = _IVFPartition(dim, self.nprobe, self.train_threshold, self.background)
+        part.add(key, unit)
+        self._dims[key] = dim
+
+    def search(self, vector, top_k=2, nprobe=None):
+        unit = normalize(vector)
+        part = self.partitions.get(unit.shape[0])
+        if part is None:
+            return []
+        return part.search(unit, top_k, nprobe=nprobe)
+
+    def wait_for_training(self, timeout=None):
+        """
+        Blocks until background centroid fits have been swapped in.
+        """
+        for part in list(self.partitions.values()):
+            part.wait_for_training(timeout)